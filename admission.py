@@ -0,0 +1,340 @@
+import os
+import math
+import time
+import hashlib
+import ipaddress
+import logging
+import threading
+from functools import wraps
+from flask import current_app, request, jsonify
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from metrics import ADMISSION_ADMITTED, ADMISSION_SHED, ADMISSION_QUEUED, ADMISSION_WAITING
+from scheduler import FairScheduler, estimate_cost
+
+logger = logging.getLogger(__name__)
+
+# Shed reasons reported on admission_shed_total
+SHED_TOO_LARGE = 'too_large'
+SHED_CLIENT_LIMIT = 'client_limit'
+SHED_QUEUE_FULL = 'queue_full'
+SHED_WAIT_TIMEOUT = 'wait_timeout'
+
+# How often a queued request looks for a free slot
+POLL_INTERVAL = 0.05
+
+# WSGI environ key holding how long an admitted request waited for its slot
+ADMISSION_WAIT_KEY = 'word_to_pdf.admission_wait'
+
+# X-API-Key values that identify a client (comma-separated); any other key is ignored
+API_KEYS = frozenset(key.strip() for key in os.getenv('ADMISSION_API_KEYS', '').split(',') if key.strip())
+
+# IPv6 peers count as one client per network of this prefix length; a single
+# host is usually handed a whole /64 and could otherwise rotate through it
+IPV6_CLIENT_PREFIX = int(os.getenv('ADMISSION_IPV6_PREFIX', '64'))
+
+
+class Slots:
+    """
+    A node-wide counting semaphore made of flock()ed files, one per slot
+
+    Locks die with the process holding them, so a crashed worker never leaks
+    a slot. Without fcntl (Windows) every acquire succeeds.
+    """
+
+    def __init__(self, directory, prefix, count, remove_on_release=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.count = count
+        self.remove_on_release = remove_on_release
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, index):
+        return os.path.join(self.directory, f"{self.prefix}.{index}")
+
+    def try_acquire(self):
+        """
+        Take a free slot without waiting
+        Returns:
+            tuple: (path, file descriptor) of the held slot, or None if all are taken
+        """
+        if fcntl is None:
+            return ('', None)
+        for index in range(self.count):
+            path = self._path(index)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            # A releaser may have unlinked the file between our open and flock
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    return (path, fd)
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        return None
+
+    def release(self, held):
+        path, fd = held
+        if fd is None:
+            return
+        if self.remove_on_release:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        os.close(fd)
+
+    def held(self):
+        """Number of slots currently taken, by any process on the node"""
+        if fcntl is None:
+            return 0
+        taken = 0
+        for index in range(self.count):
+            try:
+                fd = os.open(self._path(index), os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except OSError:
+                taken += 1
+            finally:
+                os.close(fd)
+        return taken
+
+
+class Shed(Exception):
+    """A request was refused; status and retry_after describe the response"""
+
+    def __init__(self, reason, status, retry_after, message):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps concurrent conversions per process and per node, with a bounded wait queue
+
+    A request first takes one of its client's slots (429 if the client already
+    has max_per_client requests running or waiting), then a place in the node's
+    wait queue (503 if it is full), then waits up to wait_timeout for a run
+    slot (503 if none frees up). Retry-After comes from recent conversion times.
+    Requests waiting in the same process take free slots in scheduler order.
+    """
+
+    def __init__(self, directory, max_per_process, max_per_node, queue_size, wait_timeout, max_per_client=0,
+                 scheduler=None):
+        self.max_per_process = max_per_process
+        self.max_per_node = max_per_node
+        self.queue_size = queue_size
+        self.wait_timeout = wait_timeout
+        self.run_slots = Slots(directory, 'run', max_per_node)
+        self.wait_slots = Slots(directory, 'wait', queue_size)
+        self.client_directory = os.path.join(directory, 'clients')
+        self.max_per_client = max_per_client
+        self._process_slots = threading.BoundedSemaphore(max_per_process)
+        self.scheduler = scheduler or FairScheduler()
+        self._latency = None
+        self._latency_lock = threading.Lock()
+
+    def record_latency(self, seconds):
+        """Fold one admitted request's duration into the moving average"""
+        with self._latency_lock:
+            self._latency = seconds if self._latency is None else 0.8 * self._latency + 0.2 * seconds
+
+    def retry_after(self):
+        """
+        Seconds a shed client should wait: roughly how long the current queue takes to drain
+        Returns:
+            int: Between 1 and 300
+        """
+        latency = self._latency if self._latency is not None else 5.0
+        backlog = self.wait_slots.held() + 1
+        return max(1, min(300, math.ceil(latency * backlog / max(1, self.max_per_node))))
+
+    def client_slots(self, client):
+        key = hashlib.sha256(client.encode()).hexdigest()[:16]
+        return Slots(self.client_directory, key, self.max_per_client, remove_on_release=True)
+
+    def shed(self, endpoint, reason, status, message):
+        """Count a refused request and build the Shed describing the response"""
+        ADMISSION_SHED.labels(endpoint=endpoint, reason=reason).inc()
+        retry_after = self.retry_after()
+        logger.warning(f"Shed {endpoint} request ({reason}), retry after {retry_after}s")
+        return Shed(reason, status, retry_after, message)
+
+    def _try_run(self, held):
+        if not self._process_slots.acquire(blocking=False):
+            return False
+        slot = self.run_slots.try_acquire()
+        if slot is None:
+            self._process_slots.release()
+            return False
+        held.append((self._process_slots, None))
+        held.append((self.run_slots, slot))
+        return True
+
+    def acquire(self, endpoint, client=None, queued=True, cost=1.0):
+        """
+        Take a run slot, waiting in the node's queue if none is free
+        Args:
+            endpoint (str): Label for the admission metrics
+            client (str, optional): Client identity for the per-client limit
+            queued (bool): Wait in the bounded queue and shed on timeout; when
+                False (background jobs) wait as long as it takes
+            cost (float): Estimated conversion time, for scheduling
+        Returns:
+            callable: Releases everything that was taken; call it exactly once
+        Raises:
+            Shed: If the request must be refused
+        """
+        held = []
+
+        def release():
+            for slots, slot in reversed(held):
+                if slots is self._process_slots:
+                    slots.release()
+                else:
+                    slots.release(slot)
+            held.clear()
+
+        try:
+            if client and self.max_per_client > 0:
+                slots = self.client_slots(client)
+                slot = slots.try_acquire()
+                if slot is None:
+                    raise self.shed(endpoint, SHED_CLIENT_LIMIT, 429, "Too many conversions in progress for this client")
+                held.append((slots, slot))
+
+            ticket = self.scheduler.add(None, cost, client)
+            try:
+                if not (self.scheduler.is_next(ticket) and self._try_run(held)):
+                    self._wait(endpoint, held, queued, ticket)
+            except BaseException:
+                self.scheduler.remove(ticket)
+                raise
+            self.scheduler.take(ticket)
+        except BaseException:
+            release()
+            raise
+
+        ADMISSION_ADMITTED.labels(endpoint=endpoint).inc()
+        return release
+
+    def _wait(self, endpoint, held, queued, ticket):
+        wait_slot = None
+        if queued:
+            wait_slot = self.wait_slots.try_acquire()
+            if wait_slot is None:
+                raise self.shed(endpoint, SHED_QUEUE_FULL, 503, "Server is busy, try again later")
+
+        ADMISSION_QUEUED.labels(endpoint=endpoint).inc()
+        ADMISSION_WAITING.inc()
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while not (self.scheduler.is_next(ticket) and self._try_run(held)):
+                if queued and time.monotonic() >= deadline:
+                    raise self.shed(endpoint, SHED_WAIT_TIMEOUT, 503, "Server is busy, try again later")
+                time.sleep(POLL_INTERVAL)
+        finally:
+            ADMISSION_WAITING.dec()
+            if wait_slot is not None:
+                self.wait_slots.release(wait_slot)
+
+    def admit(self, endpoint):
+        """
+        Decorator for views that convert: admission happens before the request body is read
+        Args:
+            endpoint (str): Label for the admission metrics
+        Returns:
+            callable: The decorator
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                queued_at = time.time()
+                try:
+                    release = self.acquire(endpoint, client=client_id(), cost=estimate_cost(request.content_length))
+                except Shed as e:
+                    return shed_response(e)
+
+                start_time = time.time()
+                request.environ[ADMISSION_WAIT_KEY] = start_time - queued_at
+
+                def done():
+                    release()
+                    self.record_latency(time.time() - start_time)
+
+                try:
+                    response = current_app.make_response(view(*args, **kwargs))
+                except BaseException:
+                    done()
+                    raise
+                if response.is_streamed:
+                    # The work happens while the body streams out
+                    response.call_on_close(done)
+                else:
+                    done()
+                return response
+            return wrapped
+        return decorator
+
+
+def client_id():
+    """
+    The client a request is counted against: a configured API key, else the peer address
+
+    Both are things the client cannot pick for itself. remote_addr is the
+    rightmost untrusted X-Forwarded-For hop when app applies ProxyFix for
+    TRUSTED_PROXY_HOPS, and the socket peer otherwise. The same identity is
+    charged for fair share in the scheduler, so a client cannot claim a fresh
+    share per request either.
+    """
+    api_key = request.headers.get('X-API-Key', '')
+    if api_key in API_KEYS:
+        return f"key-{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return request.remote_addr or 'unknown'
+    if address.version == 6:
+        if address.ipv4_mapped:
+            return str(address.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{address}/{IPV6_CLIENT_PREFIX}", strict=False))
+    return str(address)
+
+
+def shed_response(shed):
+    response = jsonify({"error": str(shed)})
+    response.status_code = shed.status
+    response.headers['Retry-After'] = str(shed.retry_after)
+    return response
+
+
+def reject_oversized(endpoint, max_length):
+    """
+    Refuse a request from its Content-Length header, before any of the body is read
+    Args:
+        endpoint (str): Label for the admission metrics
+        max_length (int): Largest acceptable body, or None for no limit
+    Returns:
+        Response: A 413 response, or None if the request may proceed
+    """
+    length = request.content_length
+    if max_length is None or length is None or length <= max_length:
+        return None
+    ADMISSION_SHED.labels(endpoint=endpoint, reason=SHED_TOO_LARGE).inc()
+    logger.warning(f"Rejected {length} byte {endpoint} request over the {max_length} byte limit")
+    response = jsonify({"error": "File too large"})
+    response.status_code = 413
+    return response
@@ -1,16 +1,49 @@
 import os
-from flask import Flask, request, render_template, send_file, jsonify, redirect, make_response
+import re
+import hmac
+import json
+import uuid
+import shutil
+import hashlib
+import zipfile
+import mimetypes
+import threading
+import contextvars
+from collections import OrderedDict, namedtuple
+from concurrent import futures
+from contextlib import contextmanager
+from functools import wraps
+from flask import Flask, Request, Response, current_app, request, render_template, send_file, jsonify, redirect, make_response
 from werkzeug.utils import secure_filename
-from word_to_pdf import convert_word_to_pdf
-from s3_manager import S3Manager
+from werkzeug.middleware.proxy_fix import ProxyFix
+from word_to_pdf import convert_document, convert_batch
+from s3_manager import S3Manager, get_upload_executor
+from conversion_cache import ConversionCache
+from ingest import IngestSink, UploadPipe
+from job_queue import JobStore, JobQueue, QueueFullError, JOB_QUEUED, JOB_DONE, JOB_FAILED
+from office_watchdog import reap_orphans
+from workspace import WorkspaceManager, ConvertedStore, local_name, display_name
+from chunked_upload import ChunkedUploadStore, ChunkError, UploadNotFoundError
+from admission import AdmissionController, SHED_QUEUE_FULL, ADMISSION_WAIT_KEY, client_id, reject_oversized, shed_response
+from scheduler import FairScheduler, estimate_cost
+from outbox import Outbox
+from export_profiles import get_profile, cache_digest, UnknownProfileError
+from readiness import Readiness
+from log_pipeline import configure_logging, in_context, new_request_id, request_id
+from sampling_profiler import SamplingProfiler, ProfilerBusyError, busy, mark_busy, mark_idle, request_finished
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 from waitress import serve
 import ssl
 import time
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST, ProcessCollector, start_http_server
-import boto3
+from prometheus_client import CONTENT_TYPE_LATEST
+from metrics import (
+    CONVERSION_REQUEST_COUNT, CONVERSION_SUCCESS_COUNT, CONVERSION_FAILURE_COUNT, CONVERSION_DURATION,
+    FILE_SIZE, S3_UPLOAD_SUCCESS, S3_UPLOAD_FAILURE, CACHE_HIT_COUNT, CACHE_MISS_COUNT,
+    CACHE_EVICTION_COUNT, STAGE_DURATION, IN_FLIGHT, OFFICE_ORPHANS_REAPED, DISK_USAGE_BYTES, DISK_BUDGET_BYTES,
+    latest_metrics, start_metrics_server
+)
 import yaml
 
 # Load environment variables
@@ -20,32 +53,101 @@ load_dotenv()
 with open('version.txt', 'r') as f:
     version_info = yaml.safe_load(f)
 
-# Configure logging
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# JSON records written to app.log (rotated by size) and stderr on a background thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Initialize Prometheus metrics
-CONVERSION_REQUEST_COUNT = Counter('pdf_conversion_requests_total', 'Total number of PDF conversion requests')
-CONVERSION_SUCCESS_COUNT = Counter('pdf_conversion_success_total', 'Total number of successful PDF conversions')
-CONVERSION_FAILURE_COUNT = Counter('pdf_conversion_failure_total', 'Total number of failed PDF conversions')
-CONVERSION_DURATION = Histogram('pdf_conversion_duration_seconds', 'Time spent processing PDF conversion')
-FILE_SIZE = Histogram('uploaded_file_size_bytes', 'Size of uploaded files', buckets=[1024*1024, 2*1024*1024, 5*1024*1024, 10*1024*1024])
-S3_UPLOAD_SUCCESS = Counter('s3_upload_success_total', 'Successful S3 uploads')
-S3_UPLOAD_FAILURE = Counter('s3_upload_failure_total', 'Failed S3 uploads')
+# Batches may carry hundreds of documents, so they get their own size limits
+BATCH_MAX_CONTENT_LENGTH = int(os.getenv('BATCH_MAX_CONTENT_LENGTH', str(256 * 1024 * 1024)))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '500'))
+
+# Single-file uploads are hashed, saved and archived to S3 in one pass as they are parsed
+STREAMING_INGEST_PATHS = ('/convert', '/jobs')
+S3_STREAM_ARCHIVE = os.getenv('S3_STREAM_ARCHIVE', '1') == '1'
+
+class ConverterRequest(Request):
+    @property
+    def workspace(self):
+        """This request's private scratch workspace, created on first use"""
+        if 'workspace' not in self.__dict__:
+            self.__dict__['workspace'] = workspaces.create(self.content_length or 0)
+        return self.__dict__['workspace']
 
-# Initialize process collector
-ProcessCollector()
+    @property
+    def max_content_length(self):
+        if self.path == '/batch':
+            return BATCH_MAX_CONTENT_LENGTH
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.path not in STREAMING_INGEST_PATHS or not filename or not allowed_file(filename):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        pipe = None
+        if S3_STREAM_ARCHIVE:
+            pipe = UploadPipe()
+            pipe.start(s3_manager, secure_filename(filename), is_pdf=False)
+        sink = IngestSink(self.workspace.path, pipe)
+        self.__dict__.setdefault('ingest_sinks', []).append(sink)
+        return sink
 
 app = Flask(__name__)
+app.request_class = ConverterRequest
+
+# Proxies in front of the app that each append to X-Forwarded-For; request.remote_addr
+# is then the hop the last of them saw, and with none it is the socket peer
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
 # Enable CORS
 from flask_cors import CORS
 CORS(app)
 
+# A caller's X-Request-ID is kept so its logs and ours line up; anything else gets a fresh ID
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+@app.before_request
+def bind_request_id():
+    incoming = request.headers.get('X-Request-ID', '')
+    request_id.set(incoming if REQUEST_ID_PATTERN.match(incoming) else new_request_id())
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = request_id.get()
+    return response
+
+# (stage, seconds) for each timed_stage of the current request, reported in Server-Timing
+stage_timings = contextvars.ContextVar('stage_timings', default=None)
+
+@app.before_request
+def start_stage_timings():
+    request.started_at = time.time()
+    stage_timings.set([])
+    # Request threads are what the sampling profiler looks at
+    mark_busy()
+
+@app.after_request
+def add_server_timing_header(response):
+    totals = OrderedDict()
+    admission_wait = request.environ.get(ADMISSION_WAIT_KEY)
+    if admission_wait is not None:
+        totals['admission_wait'] = admission_wait
+    for stage, seconds in stage_timings.get() or ():
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    started_at = getattr(request, 'started_at', None)
+    if started_at is not None:
+        totals['total'] = time.time() - started_at
+    if totals:
+        response.headers['Server-Timing'] = ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+    return response
+
+@app.teardown_request
+def finish_request_tracing(error=None):
+    mark_idle()
+    if not request.path.startswith('/admin/'):
+        request_finished()
+
 # Security headers
 @app.after_request
 def add_security_headers(response):
@@ -64,7 +166,7 @@ def add_security_headers(response):
         response.headers['X-XSS-Protection'] = '1; mode=block'
     return response
 
-# Initialize S3 manager
+# Initialize S3 manager; the client connects lazily in each worker
 s3_manager = S3Manager()
 
 # Configure upload folder
@@ -78,18 +180,518 @@ os.makedirs(CONVERTED_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Serve /convert from the local copy and upload the PDF to S3 in the background
+S3_WRITE_BEHIND = os.getenv('S3_WRITE_BEHIND', '0') == '1'
+
+# Downloads: 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile) hand the bytes to a front proxy
+DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD', '')
+DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-converted')
+DOWNLOAD_CACHE_MAX_AGE = int(os.getenv('DOWNLOAD_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+ETAG_CACHE_SIZE = 4096
+_etag_cache = OrderedDict()
+_etag_lock = threading.Lock()
+
+# Content-addressed PDF cache: local LRU tier under converted/, shared tier in S3
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+conversion_cache = ConversionCache(os.path.join(CONVERTED_FOLDER, 'cache'), CACHE_MAX_BYTES, s3_manager,
+                                   rescan_interval=float(os.getenv('CACHE_RESCAN_INTERVAL', '60')))
+DISK_BUDGET_BYTES.labels(area='cache').set(CACHE_MAX_BYTES)
+
+# Each request gets its own scratch directory, on tmpfs when WORKSPACE_TMPFS_DIR has room
+workspaces = WorkspaceManager(UPLOAD_FOLDER, os.getenv('WORKSPACE_TMPFS_DIR'))
+workspaces.reap_stale()
+
+# PDFs served from this node, kept within budget by evicting ones already in S3
+converted_store = ConvertedStore(
+    CONVERTED_FOLDER,
+    int(os.getenv('CONVERTED_MAX_BYTES', str(2 * 1024 * 1024 * 1024))),
+    sweep_interval=int(os.getenv('CONVERTED_SWEEP_INTERVAL', '60'))
+)
+converted_store.add_usage_reporter(workspaces.report_usage)
+converted_store.add_usage_reporter(lambda: DISK_USAGE_BYTES.labels(area='cache').set(conversion_cache.total_bytes))
+
+# Documents too large for one request arrive as resumable chunked uploads
+chunked_uploads = ChunkedUploadStore(
+    os.path.join(UPLOAD_FOLDER, 'chunked'),
+    int(os.getenv('CHUNKED_UPLOAD_MAX_BYTES', str(512 * 1024 * 1024))),
+    chunk_size=min(int(os.getenv('CHUNKED_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024))), app.config['MAX_CONTENT_LENGTH']),
+    ttl=int(os.getenv('CHUNKED_UPLOAD_TTL', str(24 * 3600)))
+)
+converted_store.add_usage_reporter(lambda: DISK_USAGE_BYTES.labels(area='chunked').set(chunked_uploads.total_bytes()))
+
+# Files that failed to reach S3 wait here and are uploaded once S3 recovers
+outbox = Outbox(
+    os.getenv('S3_OUTBOX_DIR', 'outbox'),
+    s3_manager,
+    drain_interval=int(os.getenv('S3_OUTBOX_DRAIN_INTERVAL', '30')),
+    max_attempts=int(os.getenv('S3_OUTBOX_MAX_ATTEMPTS', '10')),
+    max_backoff=int(os.getenv('S3_OUTBOX_MAX_BACKOFF', '3600'))
+)
+
+# /readyz: converters warmed up in this worker, S3 reachable, disk within budget
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', '1') == '1'
+readiness = Readiness(
+    s3_manager,
+    converted_store,
+    [UPLOAD_FOLDER, CONVERTED_FOLDER],
+    min_free_bytes=int(os.getenv('READY_MIN_FREE_MB', '256')) * 1024 * 1024,
+    check_interval=float(os.getenv('READY_CHECK_INTERVAL', '15')),
+    require_s3=os.getenv('READY_REQUIRE_S3', '1') == '1',
+    warm_up_enabled=STARTUP_WARMUP
+)
+
+def pdf_delivered(meta):
+    # The PDF is now in the shared tier, so its local download copy may be evicted
+    conversion_cache.mark_shared(meta['digest'])
+    converted_store.mark_in_s3(meta['served_name'], conversion_cache.s3_key(meta['digest']))
+
+def thumbnail_delivered(meta):
+    converted_store.mark_in_s3(meta['served_name'], conversion_cache.thumbnail_key(meta['digest']))
+
+outbox.on_delivered('pdf', pdf_delivered)
+outbox.on_delivered('thumbnail', thumbnail_delivered)
+
+# Conversions allowed at once per worker process and per node, and how many may wait for a slot
+admission = AdmissionController(
+    os.path.join(UPLOAD_FOLDER, '.admission'),
+    max_per_process=int(os.getenv('ADMISSION_MAX_PER_PROCESS', '2')),
+    max_per_node=int(os.getenv('ADMISSION_MAX_PER_NODE', str(os.cpu_count() or 2))),
+    queue_size=int(os.getenv('ADMISSION_QUEUE_SIZE', str(2 * (os.cpu_count() or 2)))),
+    wait_timeout=float(os.getenv('ADMISSION_WAIT_TIMEOUT', '30')),
+    max_per_client=int(os.getenv('ADMISSION_MAX_PER_CLIENT', '4')),
+    scheduler=FairScheduler(
+        aging_rate=float(os.getenv('SCHEDULER_AGING_RATE', '1.0')),
+        max_wait=float(os.getenv('SCHEDULER_MAX_WAIT', '120'))
+    )
+)
 
 # Create uploads directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-bucket_name = 'word-to-pdf-converters'
-pdf_bucket_name = 'word-to-pdf-converters'
+# Kill office processes whose worker died; waitress has no startup hook to do this
+OFFICE_ORPHANS_REAPED.inc(reap_orphans())
+
+@contextmanager
+def timed_stage(stage):
+    """Record how long the enclosed block takes as one conversion stage"""
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start_time
+        STAGE_DURATION.labels(stage=stage).observe(duration)
+        timings = stage_timings.get()
+        if timings is not None:
+            timings.append((stage, duration))
+        logger.info(f"Stage {stage} took {duration * 1000:.1f}ms",
+                    extra={'stage': stage, 'duration_ms': round(duration * 1000, 1)})
+
+def pdf_etag(pdf_path, stat=None):
+    """
+    Strong ETag for a local PDF: the SHA-256 of its content, memoized per file version
+    Args:
+        pdf_path (str): Path to the PDF
+        stat (os.stat_result, optional): Already-fetched stat of the file
+    Returns:
+        str: Hex digest of the file content
+    """
+    stat = stat or os.stat(pdf_path)
+    key = (pdf_path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    with _etag_lock:
+        if key in _etag_cache:
+            _etag_cache.move_to_end(key)
+            return _etag_cache[key]
+
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+
+    with _etag_lock:
+        _etag_cache[key] = etag
+        while len(_etag_cache) > ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+def local_download_url(pdf_path):
+    """Versioned /download URL; the version lets browsers cache it as immutable"""
+    return f"/download/{os.path.basename(pdf_path)}?v={pdf_etag(pdf_path)[:16]}"
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def store_upload(file, file_path):
+    """
+    Put an uploaded document at file_path, hashing it on the way
+    Args:
+        file (FileStorage): The uploaded file
+        file_path (str): Destination path
+    Returns:
+        tuple: (size in bytes, SHA-256 hex digest, Future of the streamed
+        S3 archive upload or None if the document was not streamed)
+    """
+    if isinstance(file.stream, IngestSink):
+        # Already written and hashed while the request was parsed
+        file.stream.claim(file_path)
+        if file.stream.upload_future is not None:
+            track_streamed_archive(file.stream.upload_future, secure_filename(file.filename))
+        return file.stream.size, file.stream.hexdigest(), file.stream.upload_future
+
+    size, digest = save_upload(file, file_path)
+    return size, digest, None
+
+def save_upload(file, file_path):
+    """
+    Save an uploaded file in chunks, hashing it on the way to disk
+    Args:
+        file (FileStorage): The uploaded file
+        file_path (str): Destination path
+    Returns:
+        tuple: (size in bytes, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'wb') as out:
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+# What a conversion hands back to the client; thumbnail_url and pages are None
+# when the converter that ran could not produce them
+ConversionOutputs = namedtuple('ConversionOutputs', ['download_url', 'thumbnail_url', 'pages'])
+
+def thumbnail_name(pdf_filename):
+    return os.path.splitext(pdf_filename)[0] + '.png'
+
+def cached_download_url(entry, pdf_filename):
+    """
+    Build a download URL for a cached PDF without converting again
+    Args:
+        entry (CacheEntry): The cache hit
+        pdf_filename (str): File name offered to the browser
+    Returns:
+        str: Download URL, or None if the cached copy cannot be served
+    """
+    if entry.s3_key:
+        download_url = s3_manager.get_presigned_url(entry.s3_key, is_pdf=True, download_name=pdf_filename)
+        if download_url:
+            return download_url
+
+    if entry.local_path:
+        try:
+            return conversion_cache.publish(entry.digest, download_name=pdf_filename)
+        except Exception as e:
+            logger.error(f"Failed to publish cached PDF to S3: {str(e)}")
+            queue_pdf_upload(entry.digest, pdf_filename)
+        pdf_path = converted_store.add(entry.local_path, local_name(entry.digest, pdf_filename))
+        return local_download_url(pdf_path)
+
+    return None
+
+def cached_thumbnail_url(entry, pdf_filename):
+    """
+    Build a URL for a cached document's thumbnail; call after cached_download_url,
+    which shares a locally cached document when it can
+    Args:
+        entry (CacheEntry): The cache hit
+        pdf_filename (str): File name offered to the browser for the PDF
+    Returns:
+        str: Thumbnail URL, or None if the document has no thumbnail
+    """
+    if entry.thumbnail_key or (entry.thumbnail_path and conversion_cache.is_shared(entry.digest)):
+        thumbnail_url = conversion_cache.thumbnail_url(entry.digest)
+        if thumbnail_url:
+            return thumbnail_url
+
+    if entry.thumbnail_path:
+        return local_download_url(converted_store.add(entry.thumbnail_path,
+                                                      local_name(entry.digest, thumbnail_name(pdf_filename))))
+
+    return None
+
+def get_uploaded_file():
+    """
+    Validate the uploaded Word document on the current request
+    Returns:
+        tuple: (FileStorage, None) if valid, otherwise (None, error response)
+    """
+    # Check if file was uploaded
+    with timed_stage('request_read'):
+        files = request.files
+    if 'file' not in files:
+        logger.error("No file part in the request")
+        return None, (jsonify({"error": "No file uploaded"}), 400)
+    
+    file = request.files['file']
+    
+    # Check if a file was selected
+    if file.filename == '':
+        logger.error("No file selected")
+        return None, (jsonify({"error": "No file selected"}), 400)
+        
+    # Check if file is a Word document
+    if not allowed_file(file.filename):
+        logger.error(f"Invalid file type: {file.filename}")
+        return None, (jsonify({"error": "Only .docx files are allowed"}), 400)
+
+    return file, None
+
+def requested_profile():
+    """
+    The export profile the current request asks for, from ?profile=, a form field or a JSON body
+    Returns:
+        tuple: (ExportProfile, None) if valid, otherwise (None, error response)
+    """
+    name = request.args.get('profile') or request.form.get('profile')
+    if not name and request.is_json:
+        name = (request.get_json(silent=True) or {}).get('profile')
+    try:
+        return get_profile(name), None
+    except UnknownProfileError as e:
+        logger.error(str(e))
+        return None, (jsonify({"error": str(e)}), 400)
+
+def track_streamed_archive(future, filename):
+    """Log and count the outcome of an archive upload streamed during ingest"""
+    def done(upload):
+        if upload.exception() is not None:
+            logger.error(f"Failed to stream Word document to S3: {str(upload.exception())}")
+            S3_UPLOAD_FAILURE.inc()
+        else:
+            logger.info(f"Word document streamed to S3: {filename}")
+            S3_UPLOAD_SUCCESS.inc()
+    future.add_done_callback(done)
+
+def archive_docx(file_path, filename):
+    """Upload the source Word document to S3; failures go to the outbox, not the caller"""
+    try:
+        with timed_stage('docx_s3_upload'):
+            s3_manager.upload_file(file_path, filename, is_pdf=False)
+        logger.info(f"Word document uploaded to S3: {filename}")
+        S3_UPLOAD_SUCCESS.inc()
+    except Exception as e:
+        logger.error(f"Failed to upload Word document to S3: {str(e)}")
+        S3_UPLOAD_FAILURE.inc()
+        queue_docx_upload(file_path, filename)
+
+def queue_docx_upload(file_path, filename):
+    """Leave a Word document that could not be archived for the outbox to upload later"""
+    try:
+        outbox.add(file_path, filename, is_pdf=False, kind='docx')
+    except OSError as e:
+        logger.error(f"Failed to queue {filename} in the S3 outbox: {str(e)}")
+
+def queue_pdf_upload(pdf_digest, pdf_filename):
+    """Leave a cached PDF and its thumbnail that could not be shared for the outbox to upload later"""
+    served_names = {
+        conversion_cache.s3_key(pdf_digest): ('pdf', local_name(pdf_digest, pdf_filename)),
+        conversion_cache.thumbnail_key(pdf_digest): ('thumbnail', local_name(pdf_digest, thumbnail_name(pdf_filename)))
+    }
+    try:
+        # In upload order: the thumbnail lands before the PDF whose metadata announces it
+        for path, key, is_pdf, metadata, content_type in conversion_cache.uploads(pdf_digest):
+            kind, served_name = served_names[key]
+            outbox.add(path, key, is_pdf=is_pdf, kind=kind, meta={'digest': pdf_digest, 'served_name': served_name},
+                       metadata=metadata, content_type=content_type)
+    except OSError as e:
+        logger.error(f"Failed to queue the PDF for {pdf_filename} in the S3 outbox: {str(e)}")
+
+def finish_streamed_archive(upload, workspace, file_path, filename):
+    """Done callback for an archive upload streamed during ingest; owns the workspace"""
+    try:
+        if upload.exception() is not None:
+            queue_docx_upload(file_path, filename)
+    finally:
+        workspace.cleanup()
+
+def publish_pdf(pdf_digest, pdf_filename, served_name=None, served_thumbnail=None):
+    """
+    Upload a converted PDF and its thumbnail to the shared cache tier, concurrently, and presign them
+    Args:
+        pdf_digest (str): Cache key of the PDF, from export_profiles.cache_digest
+        pdf_filename (str): File name offered to the browser
+        served_name (str, optional): Name of a local copy in converted/ that
+            becomes evictable once the upload succeeds
+        served_thumbnail (str, optional): Same, for the thumbnail
+    Returns:
+        tuple: Presigned URLs of the PDF and the thumbnail; None for the
+            thumbnail if there is none, and (None, None) if the upload failed
+    """
+    try:
+        with timed_stage('pdf_s3_upload'):
+            conversion_cache.upload(pdf_digest)
+        S3_UPLOAD_SUCCESS.inc()
+        if served_name is not None:
+            converted_store.mark_in_s3(served_name, conversion_cache.s3_key(pdf_digest))
+        if served_thumbnail is not None:
+            converted_store.mark_in_s3(served_thumbnail, conversion_cache.thumbnail_key(pdf_digest))
+    except Exception as e:
+        logger.error(f"Failed to upload PDF to S3: {str(e)}")
+        S3_UPLOAD_FAILURE.inc()
+        queue_pdf_upload(pdf_digest, pdf_filename)
+        return None, None
+
+    with timed_stage('presign'):
+        download_url = conversion_cache.presigned_url(pdf_digest, download_name=pdf_filename)
+        thumbnail_url = None
+        if os.path.exists(conversion_cache.thumbnail_path(pdf_digest)):
+            thumbnail_url = conversion_cache.thumbnail_url(pdf_digest)
+    logger.info(f"PDF uploaded to S3 and presigned URL generated")
+    return download_url, thumbnail_url
+
+@IN_FLIGHT.track_inprogress()
+def run_conversion(workspace, file_path, filename, file_digest, streamed_archive=None, write_behind=False, profile=None):
+    """
+    Convert a saved upload to PDF, reusing cached conversions where possible
+    Args:
+        workspace (Workspace): The upload's workspace (cleaned up when done)
+        file_path (str): Path to the saved Word document, inside the workspace
+        filename (str): Sanitized name of the uploaded document
+        file_digest (str): SHA-256 hex digest of the document
+        streamed_archive (Future, optional): S3 archive upload already
+            streamed during ingest; replaces the upload from disk
+        write_behind (bool): Return the local download URL without waiting
+            for the S3 uploads to finish
+        profile (ExportProfile, optional): Export profile; the default profile when None
+    Returns:
+        ConversionOutputs: Download URL for the PDF, thumbnail URL and page count
+    """
+    profile = profile or get_profile()
+    # Each profile of a document is a different PDF, cached under its own key
+    pdf_digest = cache_digest(file_digest, profile)
+    pdf_filename = os.path.splitext(filename)[0] + '.pdf'
+    pdf_path = workspace.file(pdf_filename)
+    served_name = local_name(pdf_digest, pdf_filename)
+    served_thumbnail = local_name(pdf_digest, thumbnail_name(pdf_filename))
+    docx_upload = None
+
+    try:
+        # Serve repeat documents from the cache without converting again
+        cached = conversion_cache.lookup(pdf_digest)
+        if cached is not None:
+            download_url = cached_download_url(cached, pdf_filename)
+            if download_url:
+                logger.info(f"Cache hit ({cached.source}) for {filename}")
+                CACHE_HIT_COUNT.labels(tier=cached.source).inc()
+                return ConversionOutputs(download_url, cached_thumbnail_url(cached, pdf_filename), cached.pages)
+        CACHE_MISS_COUNT.inc()
+        
+        # Archive the Word document to S3 while the conversion runs
+        upload_executor = get_upload_executor()
+        if streamed_archive is None:
+            docx_upload = upload_executor.submit(in_context(archive_docx), file_path, filename)
+        
+        # Convert to PDF, with the thumbnail and page count from the same document load;
+        # partial output goes away with the workspace
+        with timed_stage('office_conversion'):
+            result = convert_document(file_path, pdf_path, profile=profile,
+                                      thumbnail_path=workspace.file(thumbnail_name(pdf_filename)))
+        logger.info(f"Converted {filename} ({profile.name}) on the {result.path} path in {result.duration:.2f}s")
+        CACHE_EVICTION_COUNT.inc(conversion_cache.store(pdf_digest, pdf_path, thumbnail_path=result.thumbnail_path,
+                                                        metadata={'pages': result.pages}))
+        if result.thumbnail_path is None:
+            served_thumbnail = None
+        
+        if write_behind:
+            # Serve the local copies now; the shared tier catches up in the background
+            served_path = converted_store.add(pdf_path, served_name)
+            thumbnail_url = None
+            if served_thumbnail is not None:
+                thumbnail_url = local_download_url(converted_store.add(result.thumbnail_path, served_thumbnail))
+            upload_executor.submit(in_context(publish_pdf), pdf_digest, pdf_filename, served_name, served_thumbnail)
+            return ConversionOutputs(local_download_url(served_path), thumbnail_url, result.pages)
+
+        # Try to upload the PDF and thumbnail to S3
+        download_url, thumbnail_url = publish_pdf(pdf_digest, pdf_filename)
+        if download_url is None:
+            download_url = local_download_url(converted_store.add(pdf_path, served_name))
+            if served_thumbnail is not None:
+                thumbnail_url = local_download_url(converted_store.add(result.thumbnail_path, served_thumbnail))
+        archive_upload = docx_upload or streamed_archive
+        if archive_upload is not None:
+            futures.wait([archive_upload])
+        
+        return ConversionOutputs(download_url, thumbnail_url, result.pages)
+    finally:
+        # Drop the workspace once the archive upload is done with the Word file
+        if docx_upload is not None:
+            docx_upload.add_done_callback(lambda _: workspace.cleanup())
+        elif streamed_archive is not None:
+            streamed_archive.add_done_callback(
+                lambda upload: finish_streamed_archive(upload, workspace, file_path, filename))
+        else:
+            workspace.cleanup()
+
+def run_job(job_id, workspace, file_path, filename, file_digest, streamed_archive=None, profile=None):
+    """Job queue handler: convert a queued upload and record the outcome"""
+    # Background jobs share the node's conversion slots with /convert but never shed
+    release = admission.acquire('run_job', queued=False, cost=estimate_cost(os.path.getsize(file_path), file_path))
+    start_time = time.time()
+    try:
+        outputs = run_conversion(workspace, file_path, filename, file_digest, streamed_archive=streamed_archive,
+                                 profile=profile)
+        CONVERSION_SUCCESS_COUNT.inc()
+        return outputs.download_url
+    except Exception:
+        CONVERSION_FAILURE_COUNT.inc()
+        raise
+    finally:
+        release()
+        admission.record_latency(time.time() - start_time)
+        CONVERSION_DURATION.observe(time.time() - start_time)
+
+# Background conversion jobs; state is shared by all workers on this node
+job_store = JobStore(os.getenv('JOB_DB_PATH', 'jobs.db'), ttl=int(os.getenv('JOB_TTL', str(24 * 3600))))
+# Jobs queued in a worker that has since died will never run; nothing can be queued here yet
+job_store.fail_orphaned(os.getpid())
+job_queue = JobQueue(
+    job_store,
+    run_job,
+    workers=int(os.getenv('JOB_WORKERS', '2')),
+    max_pending=int(os.getenv('JOB_QUEUE_SIZE', '32')),
+    scheduler=FairScheduler(
+        aging_rate=float(os.getenv('SCHEDULER_AGING_RATE', '1.0')),
+        max_wait=float(os.getenv('SCHEDULER_MAX_WAIT', '120'))
+    )
+)
+
+@app.before_request
+def start_outbox():
+    # Started per worker on first use; only one worker per node drains at a time
+    outbox.start()
+
+@app.before_request
+def warm_up_converters():
+    # gunicorn warms each worker before it serves (post_worker_init); other servers warm up in the background
+    readiness.start_warm_up()
+
+@app.before_request
+def reject_oversized_uploads():
+    # Refuse from the Content-Length header rather than after reading the body
+    return reject_oversized(request.endpoint or 'unknown', request.max_content_length)
+
+def shed_if_job_queue_full(endpoint):
+    """A 503 response when no job can be queued, checked before the upload is read"""
+    if not job_queue.full():
+        return None
+    CONVERSION_FAILURE_COUNT.inc()
+    return shed_response(admission.shed(endpoint, SHED_QUEUE_FULL, 503, "Server is busy, try again later"))
+
+@app.teardown_request
+def discard_unclaimed_uploads(error=None):
+    # Scratch files from rejected or failed requests are never converted
+    for sink in getattr(request, 'ingest_sinks', []):
+        if not sink.claimed:
+            sink.discard()
+    workspace = request.__dict__.get('workspace')
+    if workspace is not None and not workspace.handed_off:
+        workspace.cleanup()
+
 @app.route('/')
 def index():
     return render_template('index.html', version=version_info)
@@ -98,92 +700,105 @@ def index():
 def version():
     return jsonify(version_info)
 
+@app.route('/healthz')
+def healthz():
+    # Liveness only: dependencies and warm-up are for /readyz
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    ready, checks = readiness.status()
+    return jsonify({"ready": ready, "checks": checks}), 200 if ready else 503
+
 @app.route('/metrics')
 def metrics():
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    return latest_metrics(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+# Bearer token for the /admin endpoints; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+
+def require_admin(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+            logger.warning(f"Rejected unauthenticated {request.path} request from {request.remote_addr}")
+            return jsonify({"error": "Unauthorized"}), 401, {'WWW-Authenticate': 'Bearer'}
+        return view(*args, **kwargs)
+    return wrapped
+
+@app.route('/admin/profile', methods=['POST'])
+@require_admin
+def profile_worker():
+    """
+    Sample this worker's request threads for ?seconds=N, or until ?requests=N more requests finish
+    (bounded by PROFILE_MAX_SECONDS), and return collapsed stacks; ?format=json adds child process times
+    """
+    try:
+        requests = request.args.get('requests', type=int)
+        seconds = float(request.args.get('seconds', PROFILE_MAX_SECONDS if requests else 10))
+        interval_ms = float(request.args.get('interval_ms', PROFILE_INTERVAL_MS))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    if (requests is not None and requests < 1) or not 0 < seconds <= PROFILE_MAX_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({"error": f"Expected requests >= 1, 0 < seconds <= {PROFILE_MAX_SECONDS:g}, "
+                                 f"1 <= interval_ms <= 1000"}), 400
+
+    try:
+        profiler = SamplingProfiler(interval_ms / 1000).run(seconds, requests=requests)
+    except ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    logger.info(f"Profiled worker {os.getpid()} for {profiler.wall_seconds:.1f}s: "
+                f"{profiler.samples} samples, {profiler.requests} requests")
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.summary())
+    return Response(profiler.collapsed(), mimetype='text/plain', headers={'X-Profile-Pid': str(os.getpid())})
 
 @app.route('/convert', methods=['POST'])
+@admission.admit('convert')
 def convert():
     CONVERSION_REQUEST_COUNT.inc()
     start_time = time.time()
     
     try:
-        # Check if file was uploaded
-        if 'file' not in request.files:
-            logger.error("No file part in the request")
+        file, error_response = get_uploaded_file()
+        if error_response:
             CONVERSION_FAILURE_COUNT.inc()
-            return jsonify({"error": "No file uploaded"}), 400
-        
-        file = request.files['file']
-        
-        # Check if a file was selected
-        if file.filename == '':
-            logger.error("No file selected")
-            CONVERSION_FAILURE_COUNT.inc()
-            return jsonify({"error": "No file selected"}), 400
-            
-        # Check if file is a Word document
-        if not allowed_file(file.filename):
-            logger.error(f"Invalid file type: {file.filename}")
+            return error_response
+        profile, error_response = requested_profile()
+        if error_response:
             CONVERSION_FAILURE_COUNT.inc()
-            return jsonify({"error": "Only .docx files are allowed"}), 400
+            return error_response
 
-        # Save the uploaded file
+        # Save the uploaded file into this request's workspace
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        workspace = request.workspace
+        file_path = workspace.file(filename)
+        with timed_stage('disk_save'):
+            file_size, file_digest, streamed_archive = store_upload(file, file_path)
         
         # Record file size
-        file_size = os.path.getsize(file_path)
         FILE_SIZE.observe(file_size)
         
-        # Upload Word document to S3
+        workspace.hand_off()
         try:
-            s3_manager.upload_file(file_path, filename, is_pdf=False)
-            logger.info(f"Word document uploaded to S3: {filename}")
-            S3_UPLOAD_SUCCESS.inc()
-        except Exception as e:
-            logger.error(f"Failed to upload Word document to S3: {str(e)}")
-            S3_UPLOAD_FAILURE.inc()
-        
-        try:
-            # Convert to PDF
-            pdf_filename = os.path.splitext(filename)[0] + '.pdf'
-            pdf_path = os.path.join(CONVERTED_FOLDER, pdf_filename)
-            
-            convert_word_to_pdf(file_path, pdf_path)
-            
-            # Try to upload PDF to S3
-            try:
-                s3_manager.upload_file(pdf_path, pdf_filename, is_pdf=True)
-                download_url = s3_manager.get_presigned_url(pdf_filename, is_pdf=True)
-                logger.info(f"PDF uploaded to S3 and presigned URL generated")
-                S3_UPLOAD_SUCCESS.inc()
-            except Exception as e:
-                logger.error(f"Failed to upload PDF to S3: {str(e)}")
-                S3_UPLOAD_FAILURE.inc()
-                download_url = f"/download/{pdf_filename}"
-            
-            # Clean up the original Word file
-            os.remove(file_path)
-            
-            CONVERSION_SUCCESS_COUNT.inc()
-            CONVERSION_DURATION.observe(time.time() - start_time)
-            
-            return jsonify({
-                "message": "Conversion successful",
-                "download_url": download_url
-            })
-                
+            outputs = run_conversion(workspace, file_path, filename, file_digest, streamed_archive=streamed_archive,
+                                     write_behind=S3_WRITE_BEHIND, profile=profile)
         except Exception as e:
             logger.error(f"PDF conversion failed: {str(e)}")
             CONVERSION_FAILURE_COUNT.inc()
-            # Clean up files in case of error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
             return jsonify({"error": "Conversion failed"}), 500
+
+        CONVERSION_SUCCESS_COUNT.inc()
+        return jsonify({
+            "message": "Conversion successful",
+            "download_url": outputs.download_url,
+            "thumbnail_url": outputs.thumbnail_url,
+            "pages": outputs.pages
+        })
             
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -192,17 +807,408 @@ def convert():
     finally:
         CONVERSION_DURATION.observe(time.time() - start_time)
 
+def queue_job(workspace, file_path, filename, file_digest, streamed_archive=None, profile=None):
+    """
+    Queue a saved upload for background conversion
+    Args:
+        workspace (Workspace): The upload's workspace, handed to the job
+        file_path (str): Path to the saved Word document, inside the workspace
+        filename (str): Sanitized name of the uploaded document
+        file_digest (str): SHA-256 hex digest of the document
+        streamed_archive (Future, optional): S3 archive upload streamed during ingest
+        profile (ExportProfile, optional): Export profile for the conversion
+    Returns:
+        tuple: JSON response and status code (202, or 503 when the queue is full)
+    """
+    job_id = job_store.create(filename)
+
+    # The workspace now belongs to the job, which cleans it up when done
+    workspace.hand_off()
+    try:
+        job_queue.submit(job_id, workspace, file_path, filename, file_digest, streamed_archive, profile,
+                         cost=estimate_cost(os.path.getsize(file_path), file_path), client=client_id())
+    except QueueFullError:
+        logger.error(f"Job queue full, rejecting {filename}")
+        CONVERSION_FAILURE_COUNT.inc()
+        job_store.update(job_id, JOB_FAILED, error="Conversion queue is full")
+        workspace.cleanup()
+        return jsonify({"error": "Server is busy, try again later"}), 503
+
+    return jsonify({
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "status_url": f"/jobs/{job_id}"
+    }), 202
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    CONVERSION_REQUEST_COUNT.inc()
+    shed = shed_if_job_queue_full('create_job')
+    if shed is not None:
+        return shed
+
+    try:
+        file, error_response = get_uploaded_file()
+        if error_response:
+            CONVERSION_FAILURE_COUNT.inc()
+            return error_response
+        profile, error_response = requested_profile()
+        if error_response:
+            CONVERSION_FAILURE_COUNT.inc()
+            return error_response
+
+        filename = secure_filename(file.filename)
+        workspace = request.workspace
+        file_path = workspace.file(filename)
+        with timed_stage('disk_save'):
+            file_size, file_digest, streamed_archive = store_upload(file, file_path)
+        FILE_SIZE.observe(file_size)
+
+        return queue_job(workspace, file_path, filename, file_digest, streamed_archive, profile)
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        CONVERSION_FAILURE_COUNT.inc()
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {"job_id": job['id'], "status": job['status']}
+    if job['status'] == JOB_DONE:
+        response['download_url'] = job['download_url']
+    elif job['status'] == JOB_FAILED:
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable upload: {"filename": ..., "size": ...} -> upload id and chunk layout"""
+    body = request.get_json(silent=True) or {}
+    filename = secure_filename(str(body.get('filename', '')))
+    if not filename or not allowed_file(filename):
+        logger.error(f"Invalid file type for chunked upload: {filename}")
+        return jsonify({"error": "Only .docx files are allowed"}), 400
+    try:
+        size = int(body.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer"}), 400
+
+    try:
+        manifest = chunked_uploads.create(filename, size)
+    except ChunkError as e:
+        status = 413 if size > chunked_uploads.max_bytes else 400
+        return jsonify({"error": str(e)}), status
+
+    upload_id = manifest['upload_id']
+    return jsonify({
+        "upload_id": upload_id,
+        "chunk_size": manifest['chunk_size'],
+        "total_chunks": manifest['total_chunks'],
+        "status_url": f"/uploads/{upload_id}",
+        "chunk_url": f"/uploads/{upload_id}/chunks/{{index}}",
+        "complete_url": f"/uploads/{upload_id}/complete"
+    }), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    try:
+        status = chunked_uploads.status(upload_id)
+    except UploadNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify({
+        "upload_id": upload_id,
+        "filename": status['filename'],
+        "size": status['size'],
+        "chunk_size": status['chunk_size'],
+        "total_chunks": status['total_chunks'],
+        "received": status['received'],
+        "missing": status['missing']
+    })
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """Store one chunk; an X-Chunk-SHA256 header, if sent, is checked against the body"""
+    try:
+        with timed_stage('chunk_save'):
+            digest = chunked_uploads.put_chunk(upload_id, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+    except UploadNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+    except ChunkError as e:
+        logger.error(f"Rejected chunk {index} of upload {upload_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"index": index, "sha256": digest})
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Assemble a finished upload and queue it for conversion, like POST /jobs"""
+    CONVERSION_REQUEST_COUNT.inc()
+    shed = shed_if_job_queue_full('complete_upload')
+    if shed is not None:
+        return shed
+
+    try:
+        profile, error_response = requested_profile()
+        if error_response:
+            CONVERSION_FAILURE_COUNT.inc()
+            return error_response
+        try:
+            status = chunked_uploads.status(upload_id)
+        except UploadNotFoundError:
+            CONVERSION_FAILURE_COUNT.inc()
+            return jsonify({"error": "Upload not found"}), 404
+
+        filename = status['filename']
+        workspace = workspaces.create(status['size'])
+        request.__dict__['workspace'] = workspace
+        file_path = workspace.file(filename)
+        try:
+            with timed_stage('disk_save'):
+                _, file_size, file_digest = chunked_uploads.assemble(upload_id, file_path)
+        except UploadNotFoundError:
+            CONVERSION_FAILURE_COUNT.inc()
+            return jsonify({"error": "Upload not found"}), 404
+        except ChunkError as e:
+            CONVERSION_FAILURE_COUNT.inc()
+            return jsonify({"error": str(e), "missing": chunked_uploads.status(upload_id)['missing']}), 409
+        FILE_SIZE.observe(file_size)
+
+        # The chunks are kept until the job is queued, so a client told to try
+        # again later can repeat /complete without uploading again
+        try:
+            response, status_code = queue_job(workspace, file_path, filename, file_digest, profile=profile)
+        except Exception:
+            chunked_uploads.reopen(upload_id)
+            raise
+        if status_code == 202:
+            chunked_uploads.finish(upload_id)
+        else:
+            chunked_uploads.reopen(upload_id)
+        return response, status_code
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        CONVERSION_FAILURE_COUNT.inc()
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    try:
+        chunked_uploads.abort(upload_id)
+    except UploadNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+    return '', 204
+
+def unique_stem(name, used):
+    """Return a file stem for name that is not yet in used, and reserve it"""
+    stem = os.path.splitext(secure_filename(name))[0] or 'document'
+    candidate = stem
+    counter = 1
+    while candidate in used:
+        candidate = f"{stem}-{counter}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+def stage_batch_inputs(files, input_dir):
+    """
+    Save batch uploads, given as .docx parts or a single .zip, under unique names
+    Args:
+        files (list): Uploaded FileStorage objects
+        input_dir (str): Directory to stage the documents in
+    Returns:
+        tuple: (list of (original name, staged path), list of (name, None, error))
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    documents = []
+    errors = []
+    used = set()
+
+    def add(name, source):
+        if not allowed_file(name):
+            errors.append((name, None, "Only .docx files are allowed"))
+            return
+        if len(documents) >= BATCH_MAX_FILES:
+            raise ValueError(f"Batches are limited to {BATCH_MAX_FILES} documents")
+        path = os.path.join(input_dir, unique_stem(name, used) + '.docx')
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(source, out, UPLOAD_CHUNK_SIZE)
+        documents.append((name, path))
+
+    for file in files:
+        if file.filename == '':
+            continue
+        if file.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(file.stream) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                # Refuse archives that would expand far beyond the upload limit
+                if sum(info.file_size for info in members) > 4 * BATCH_MAX_CONTENT_LENGTH:
+                    raise ValueError("Archive is too large when extracted")
+                for info in members:
+                    with archive.open(info) as source:
+                        add(os.path.basename(info.filename), source)
+        else:
+            add(file.filename, file.stream)
+
+    return documents, errors
+
+class ZipStream:
+    """Write-only buffer that lets zipfile build an archive while it is streamed out"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_batch_zip(results):
+    """Stream a zip of PDFs as each finishes, with a manifest.json of per-file status"""
+    buffer = ZipStream()
+    manifest = []
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for name, output_path, error in results:
+            if error:
+                manifest.append({"file": name, "status": "failed", "error": error})
+            else:
+                pdf_name = os.path.basename(output_path)
+                archive.write(output_path, pdf_name)
+                manifest.append({"file": name, "status": "converted", "pdf": pdf_name})
+            yield buffer.drain()
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    yield buffer.drain()
+
+def stream_batch_manifest(results, batch_id):
+    """Stream one JSON line per document with a presigned URL as each finishes"""
+    for name, output_path, error in results:
+        if not error:
+            pdf_name = os.path.basename(output_path)
+            try:
+                download_url = s3_manager.upload_file(output_path, f"batch/{batch_id}/{pdf_name}", is_pdf=True)
+                S3_UPLOAD_SUCCESS.inc()
+                yield json.dumps({"file": name, "status": "converted", "download_url": download_url}) + '\n'
+                continue
+            except Exception as e:
+                logger.error(f"Failed to upload batch PDF to S3: {str(e)}")
+                S3_UPLOAD_FAILURE.inc()
+                error = "Upload failed"
+        yield json.dumps({"file": name, "status": "failed", "error": error}) + '\n'
+
+@app.route('/batch', methods=['POST'])
+@admission.admit('batch_convert')
+def batch_convert():
+    files = request.files.getlist('file')
+    if not any(file.filename for file in files):
+        logger.error("No files in batch request")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    output_format = request.args.get('format', request.form.get('format', 'zip'))
+    if output_format not in ('zip', 'json'):
+        return jsonify({"error": "format must be 'zip' or 'json'"}), 400
+    profile, error_response = requested_profile()
+    if error_response:
+        return error_response
+
+    batch_id = uuid.uuid4().hex
+    workspace = request.workspace
+    batch_dir = workspace.path
+    try:
+        documents, errors = stage_batch_inputs(files, os.path.join(batch_dir, 'in'))
+    except (zipfile.BadZipFile, ValueError) as e:
+        logger.error(f"Rejected batch upload: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    CONVERSION_REQUEST_COUNT.inc(len(documents) + len(errors))
+    names = {path: name for name, path in documents}
+    logger.info(f"Batch {batch_id}: converting {len(documents)} documents")
+
+    def results():
+        for error in errors:
+            CONVERSION_FAILURE_COUNT.inc()
+            yield error
+        if documents:
+            # The conversions run as the body streams, after the request has ended
+            with busy():
+                for input_path, output_path, error in convert_batch(list(names), os.path.join(batch_dir, 'out'),
+                                                                    profile):
+                    if error:
+                        CONVERSION_FAILURE_COUNT.inc()
+                    else:
+                        CONVERSION_SUCCESS_COUNT.inc()
+                    yield names[input_path], output_path, error
+
+    if output_format == 'zip':
+        response = Response(stream_batch_zip(results()), mimetype='application/zip')
+        response.headers['Content-Disposition'] = 'attachment; filename=converted.zip'
+    else:
+        response = Response(stream_batch_manifest(results(), batch_id), mimetype='application/x-ndjson')
+    # The response streams after the request ends, so it owns the workspace
+    workspace.hand_off()
+    response.call_on_close(workspace.cleanup)
+    return response
+
+def set_download_cache_headers(response, etag):
+    # Versioned URLs never change content; anything else must be revalidated
+    if request.args.get('v') == etag[:16]:
+        response.headers['Cache-Control'] = f"public, max-age={DOWNLOAD_CACHE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def offloaded_download(pdf_path, filename, etag):
+    """Let the front proxy stream the file; only headers come from the worker"""
+    response = make_response('')
+    response.set_etag(etag)
+    response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename="{display_name(filename)}"'
+    if DOWNLOAD_OFFLOAD == 'nginx':
+        response.headers['X-Accel-Redirect'] = f"{DOWNLOAD_ACCEL_PREFIX.rstrip('/')}/{filename}"
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(pdf_path)
+    return response.make_conditional(request)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
         # First check if file exists locally
-        pdf_path = os.path.join(CONVERTED_FOLDER, filename)
-        if os.path.exists(pdf_path):
-            return send_file(pdf_path, as_attachment=True)
+        filename = secure_filename(filename)
+        pdf_path = converted_store.path(filename)
+        try:
+            stat = os.stat(pdf_path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None:
+            with timed_stage('download_lookup'):
+                converted_store.touch(pdf_path, stat)
+                etag = pdf_etag(pdf_path, stat)
+            if DOWNLOAD_OFFLOAD in ('nginx', 'apache'):
+                response = offloaded_download(pdf_path, filename, etag)
+            else:
+                # conditional=True answers If-None-Match with 304 and honours Range
+                response = send_file(os.path.abspath(pdf_path), as_attachment=True, conditional=True, etag=etag,
+                                     download_name=display_name(filename))
+            return set_download_cache_headers(response, etag)
         
-        # If not found locally, try to get from S3
+        # If not found locally (or evicted once it reached S3), redirect to S3
         try:
-            download_url = s3_manager.get_presigned_url(filename, is_pdf=True)
+            s3_key = converted_store.s3_key(filename)
+            with timed_stage('presign'):
+                if s3_key:
+                    download_url = s3_manager.get_presigned_url(s3_key, is_pdf=True,
+                                                                download_name=display_name(filename))
+                else:
+                    download_url = s3_manager.get_presigned_url(filename, is_pdf=True)
             if download_url:
                 return redirect(download_url)
         except Exception as e:
@@ -218,14 +1224,12 @@ def request_entity_too_large(error):
     CONVERSION_FAILURE_COUNT.inc()
     return jsonify({"error": "File too large"}), 413
 
-from prometheus_client import ProcessCollector
-
-def register_process_collector():
-    ProcessCollector()
-
 if __name__ == '__main__':
-    # Register Prometheus process collector only in main process
-    register_process_collector()
+    # Validate S3 access up front when running standalone
+    if not s3_manager.check_ready():
+        logger.error("S3 is not reachable; conversions will fall back to local downloads")
+    # Warm the converters before the first request rather than on it
+    readiness.warm_up()
     # Start Prometheus metrics server
-    start_http_server(8000)
+    start_metrics_server(8000)
     app.run(debug=True, host='0.0.0.0', port=5000)
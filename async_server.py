@@ -0,0 +1,222 @@
+import os
+import sys
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+from aiohttp import web
+from werkzeug.wsgi import FileWrapper
+
+# This one process serves the whole node, so it gets a conversion slot per core
+# unless ADMISSION_MAX_PER_PROCESS says otherwise; app reads it on import
+os.environ.setdefault('ADMISSION_MAX_PER_PROCESS', str(os.cpu_count() or 2))
+
+from app import app as flask_app, admission, readiness, BATCH_MAX_CONTENT_LENGTH
+from metrics import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# Routes that convert while the handler runs (or, for /batch, while the response
+# is iterated); they run on the bounded conversion executor, everything else on
+# the I/O executor so downloads and probes never queue behind a conversion
+CONVERSION_PATHS = ('/convert', '/batch')
+
+# Threads for short handler calls and for reading response chunks (downloads)
+IO_THREADS = int(os.getenv('ASYNC_IO_THREADS', '32'))
+
+# Request bodies are held in memory up to this size, then spill to a temp file
+SPOOL_MAX_MEMORY = int(os.getenv('ASYNC_SPOOL_MAX_MEMORY', str(1024 * 1024)))
+
+RECEIVE_CHUNK_SIZE = 64 * 1024
+
+# Files are read in blocks this large, so a download takes few executor hops
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+def _file_wrapper(file, buffer_size=8192):
+    return FileWrapper(file, max(buffer_size, FILE_CHUNK_SIZE))
+
+
+class WsgiBridge:
+    """
+    Serves the Flask app from an asyncio event loop
+
+    The request body is received on the event loop and spooled before the app
+    sees it, and the response is written back chunk by chunk with the loop
+    waiting on the client. Threads only run the app itself and read response
+    chunks, so a slow client costs a socket and a buffer, not a thread.
+    """
+
+    def __init__(self, wsgi_app, conversion_executor, io_executor):
+        self.wsgi_app = wsgi_app
+        self.conversion_executor = conversion_executor
+        self.io_executor = io_executor
+
+    def max_content_length(self, path):
+        # Same limits as app.ConverterRequest, enforced before the body is spooled
+        if path == '/batch':
+            return BATCH_MAX_CONTENT_LENGTH
+        return flask_app.config['MAX_CONTENT_LENGTH']
+
+    async def receive(self, request, body, limit):
+        """
+        Spool the request body; once it outgrows memory, writes go to disk from the I/O executor
+        Args:
+            request (web.Request): The incoming request
+            body (file): Where to write the body
+            limit (int): Stop reading once the body is larger than this
+        Returns:
+            int: Bytes received; over limit if the body was too large
+        """
+        loop = asyncio.get_running_loop()
+        size = 0
+        async for chunk in request.content.iter_chunked(RECEIVE_CHUNK_SIZE):
+            size += len(chunk)
+            if size > limit:
+                break
+            if size > SPOOL_MAX_MEMORY:
+                # This write rolls the spool over to a temp file, or appends to it
+                await loop.run_in_executor(self.io_executor, body.write, chunk)
+            else:
+                body.write(chunk)
+        return size
+
+    def environ(self, request, body, content_length):
+        """Build the WSGI environ for a request whose body has been spooled"""
+        path, _, _ = request.raw_path.partition('?')
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': request.url.host or 'localhost',
+            'SERVER_PORT': str(request.url.port or ''),
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '',
+            'CONTENT_LENGTH': str(content_length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': _file_wrapper
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            # The body is spooled whole, so it is no longer chunked and its length is known
+            if key in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+                continue
+            if key != 'CONTENT_TYPE':
+                key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def call(self, environ):
+        """
+        Run the app up to its first response chunk; runs on an executor thread
+        Returns:
+            tuple: (status line, headers, first chunk or None, chunk iterator, the app's iterable)
+        """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+            return written.append
+
+        written = []
+        result = self.wsgi_app(environ, start_response)
+        chunks = iter(result)
+        first = next(chunks, None)
+        if written:
+            first = b''.join(written) + (first or b'')
+        return started[0], started[1], first, chunks, result
+
+    async def handle(self, request):
+        loop = asyncio.get_running_loop()
+        path = request.path
+        executor = self.conversion_executor if path in CONVERSION_PATHS else self.io_executor
+        limit = self.max_content_length(path)
+
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        try:
+            declared = request.content_length
+            if declared is not None and declared > limit:
+                # The app answers 413 from the length alone; the body is never read
+                content_length = declared
+            else:
+                content_length = await self.receive(request, body, limit)
+            body.seek(0)
+
+            status, headers, first, chunks, result = await loop.run_in_executor(
+                executor, self.call, self.environ(request, body, content_length))
+            try:
+                code, _, reason = status.partition(' ')
+                response = web.StreamResponse(status=int(code), reason=reason or None)
+                for name, value in headers:
+                    response.headers.add(name, value)
+                await response.prepare(request)
+                if request.method != 'HEAD':
+                    chunk = first
+                    while chunk is not None:
+                        if chunk:
+                            # Waits on the client without holding a thread
+                            await response.write(chunk)
+                        chunk = await loop.run_in_executor(executor, next, chunks, None)
+                await response.write_eof()
+                return response
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    await loop.run_in_executor(executor, close)
+        finally:
+            body.close()
+
+
+def build_app():
+    """
+    Build the aiohttp application serving every Flask route
+    Returns:
+        web.Application: The application, with its executors shut down on cleanup
+    """
+    # Conversions are capped by admission control at ADMISSION_MAX_PER_PROCESS;
+    # the extra threads hold requests waiting in its queue, so it can still shed
+    conversion_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv('ASYNC_CONVERSION_THREADS',
+                                  str(admission.max_per_process + admission.queue_size))),
+        thread_name_prefix='convert'
+    )
+    io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix='async-io')
+    bridge = WsgiBridge(flask_app, conversion_executor, io_executor)
+
+    # No client_max_size: bodies are streamed by the bridge, which enforces the app's limits
+    application = web.Application()
+    application.router.add_route('*', '/{path:.*}', bridge.handle)
+
+    async def warm_up(application):
+        # Before the listener opens, as gunicorn's post_worker_init does
+        await asyncio.get_running_loop().run_in_executor(io_executor, readiness.warm_up)
+
+    async def shut_down(application):
+        conversion_executor.shutdown(wait=False)
+        io_executor.shutdown(wait=False)
+
+    application.on_startup.append(warm_up)
+    application.on_cleanup.append(shut_down)
+    return application
+
+
+def main():
+    host = os.getenv('ASYNC_HOST', '0.0.0.0')
+    port = int(os.getenv('ASYNC_PORT', '5000'))
+    start_metrics_server(int(os.getenv('METRICS_PORT', '8000')))
+    logger.info(f"Serving on {host}:{port} with {admission.max_per_process} conversion slots")
+    web.run_app(build_app(), host=host, port=port, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+"""
+Benchmark harness for the Word to PDF converter
+
+Replays a synthetic corpus either against /convert over HTTP ("http" mode)
+or straight through convert_document ("direct" mode), then reports
+throughput, latency percentiles, CPU time, peak RSS and, in direct mode,
+which converter path each document took. Every run is written to
+benchmarks/results/ as JSON so later runs can be compared against it.
+
+Examples:
+    python benchmarks/bench.py http --concurrency 8 --requests 60 --unique
+    python benchmarks/bench.py direct --concurrency 2
+    python benchmarks/bench.py http --compare benchmarks/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus, make_unique
+
+# Environment knobs that change service behaviour, recorded with each run
+ENV_KNOBS = (
+    'CONVERTER_FAST_PATH', 'OFFICE_POOL_SIZE', 'OFFICE_POOL_MAX_JOBS', 'S3_WRITE_BEHIND', 'S3_STREAM_ARCHIVE',
+    'S3_UPLOAD_WORKERS', 'S3_MAX_POOL_CONNECTIONS', 'CACHE_MAX_BYTES', 'JOB_WORKERS', 'GUNICORN_THREADS',
+    'ADMISSION_MAX_PER_PROCESS', 'ADMISSION_MAX_PER_NODE', 'ADMISSION_QUEUE_SIZE', 'PDF_EXPORT_PROFILE',
+)
+
+# (metric, True if higher is better) compared by --compare
+COMPARED_METRICS = (
+    ('throughput_rps', True),
+    ('latency_p50', False),
+    ('latency_p95', False),
+    ('latency_p99', False),
+    ('cpu_seconds_per_request', False),
+    ('peak_rss_bytes', False),
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _process_tree(root_pid):
+    """root_pid and all of its descendants, read from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, so split after its closing paren
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, ()))
+    return tree
+
+
+class RssSampler:
+    """
+    Track the peak combined RSS of a process and its children (LibreOffice included)
+
+    Sampling needs /proc; elsewhere only getrusage's per-process peaks are reported.
+    """
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            total = sum(_rss_bytes(pid) for pid in _process_tree(self.pid))
+            self.peak = max(self.peak, total)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.isdir('/proc'):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def cpu_time():
+    """CPU seconds used by this process and its reaped children (LibreOffice)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def encode_multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        'Content-Type: application/vnd.openxmlformats-officedocument.wordprocessingml.document\r\n\r\n'
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def prepare_environment(s3_root):
+    """
+    Make the app importable offline: dummy credentials and bucket names
+    (only used where the real ones are not set) and the repo as working directory
+    """
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIABENCHMARK0000000')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark-secret')
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ.setdefault('WORD_DOCUMENTS_BUCKET', 'bench-word')
+    os.environ.setdefault('PDF_FILES_BUCKET', 'bench-pdf')
+    os.chdir(REPO_ROOT)
+    os.makedirs(s3_root, exist_ok=True)
+
+
+def start_local_server(s3_root, s3_latency):
+    """
+    Serve the app in-process on an ephemeral port with S3 replaced by a local stand-in,
+    its converters already warmed up as a gunicorn worker's would be
+    Returns:
+        tuple: (base URL, werkzeug server)
+    """
+    from werkzeug.serving import make_server
+    import local_s3
+    import app as app_module
+
+    local_s3.install(app_module.s3_manager, s3_root, latency=s3_latency)
+    app_module.readiness.warm_up()
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def load_payloads(corpus, total, unique):
+    """Yield (name, size class, bytes) for each request, cycling through the corpus"""
+    blobs = {}
+    for index in range(total):
+        path, size_class = corpus[index % len(corpus)]
+        if path not in blobs:
+            with open(path, 'rb') as f:
+                blobs[path] = f.read()
+        data = make_unique(blobs[path], f"{os.getpid()}-{index}") if unique else blobs[path]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        # Distinct names keep concurrent requests from sharing an upload path
+        yield f"{stem}-r{index:05d}.docx", size_class, data
+
+
+def http_request(url, name, data, timeout):
+    body, content_type = encode_multipart('file', name, data)
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/convert", data=body, method='POST',
+        headers={'Content-Type': content_type}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def timed_map(one, payloads, concurrency):
+    """
+    Run one() over the payloads on a thread pool; the only part of a run that is timed
+    Returns:
+        tuple: (results, elapsed seconds, CPU seconds)
+    """
+    cpu_start = cpu_time()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, payloads))
+    return results, time.perf_counter() - start, cpu_time() - cpu_start
+
+
+def run_http(args, payloads):
+    server = None
+    url = args.url
+    if not url:
+        url, server = start_local_server(args.s3_root, args.s3_latency)
+
+    def one(item):
+        name, size_class, data = item
+        start = time.perf_counter()
+        try:
+            status = http_request(url, name, data, args.timeout)
+            error = None if status == 200 else f"HTTP {status}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return size_class, time.perf_counter() - start, error, None
+
+    try:
+        return timed_map(one, payloads, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+def run_direct(args, payloads):
+    from word_to_pdf import convert_document
+
+    scratch = tempfile.mkdtemp(prefix='bench-direct-')
+
+    def one(item):
+        name, size_class, data = item
+        input_path = os.path.join(scratch, name)
+        with open(input_path, 'wb') as f:
+            f.write(data)
+        start = time.perf_counter()
+        path = None
+        try:
+            result = convert_document(input_path, input_path[:-len('.docx')] + '.pdf')
+            path = result.path
+            error = None if os.path.exists(result.output_path) else 'no output'
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return size_class, time.perf_counter() - start, error, path
+
+    try:
+        return timed_map(one, payloads, args.concurrency)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': max(latencies) if latencies else None,
+    }
+
+
+def build_report(args, results, elapsed, peak_rss, cpu_seconds):
+    ok = [latency for _, latency, error, _ in results if error is None]
+    errors = {}
+    for _, _, error, _ in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+
+    by_class = {}
+    paths = {}
+    for size_class, latency, error, path in results:
+        if error is None:
+            by_class.setdefault(size_class, []).append(latency)
+        if path is not None:
+            paths[path] = paths.get(path, 0) + 1
+
+    # ru_maxrss is in kilobytes on Linux
+    rusage_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    rusage_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+    report = {
+        'mode': args.mode,
+        'label': args.label,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(time.time() - elapsed)),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'url': args.url,
+            'concurrency': args.concurrency,
+            'requests': len(results),
+            'corpus_count': args.count,
+            'seed': args.seed,
+            'unique': args.unique,
+            's3_latency': args.s3_latency,
+        },
+        'env': {knob: os.getenv(knob) for knob in ENV_KNOBS if os.getenv(knob) is not None},
+        'elapsed_seconds': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed > 0 else None,
+        'errors': sum(errors.values()),
+        'error_breakdown': errors,
+        'cpu_seconds': cpu_seconds,
+        'cpu_seconds_per_request': cpu_seconds / len(results) if results else None,
+        'conversion_paths': paths,
+        'peak_rss_bytes': peak_rss or None,
+        'max_rss_self_bytes': rusage_self,
+        'max_rss_children_bytes': rusage_children,
+        'by_size_class': {name: summarize(values) for name, values in sorted(by_class.items())},
+    }
+    report.update(summarize(ok))
+    return report
+
+
+def print_report(report):
+    def ms(value):
+        return f"{value * 1000:9.1f} ms" if value is not None else '        n/a'
+
+    print(f"mode={report['mode']} requests={report['config']['requests']} "
+          f"concurrency={report['config']['concurrency']} rev={report['git_revision']}")
+    print(f"  throughput  {report['throughput_rps'] or 0:9.2f} req/s  ({report['errors']} errors)")
+    print(f"  p50 {ms(report['latency_p50'])}   p95 {ms(report['latency_p95'])}   p99 {ms(report['latency_p99'])}")
+    print(f"  CPU         {report['cpu_seconds']:9.2f} s  ({(report['cpu_seconds_per_request'] or 0) * 1000:.1f} ms/request)")
+    if report['conversion_paths']:
+        print(f"  paths       {', '.join(f'{name}={count}' for name, count in sorted(report['conversion_paths'].items()))}")
+    if report['peak_rss_bytes']:
+        print(f"  peak RSS    {report['peak_rss_bytes'] / 1024 / 1024:9.1f} MB (process tree)")
+    for name, stats in report['by_size_class'].items():
+        print(f"  {name:8} n={stats['count']:<5} p50 {ms(stats['latency_p50'])}   p95 {ms(stats['latency_p95'])}")
+    for error, count in report['error_breakdown'].items():
+        print(f"  error x{count}: {error}")
+
+
+def compare(report, baseline, threshold):
+    """
+    Print the change of each headline metric against a baseline run
+    Args:
+        report (dict): This run
+        baseline (dict): Earlier run loaded from JSON
+        threshold (float): Allowed regression in percent
+    Returns:
+        bool: True if any metric regressed by more than the threshold
+    """
+    regressed = False
+    print(f"compared with {baseline.get('git_revision')} ({baseline.get('started_at')}):")
+    for metric, higher_is_better in COMPARED_METRICS:
+        old, new = baseline.get(metric), report.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {metric:16} {old:14.4f} -> {new:14.4f}  {change:+7.1f}%{flag}")
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Word to PDF converter')
+    parser.add_argument('mode', choices=('http', 'direct'),
+                        help='http: POST to /convert; direct: call convert_document')
+    parser.add_argument('--url', help='Target a running server instead of an in-process one (http mode)')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, help='Requests to send (default: one per document)')
+    parser.add_argument('--count', type=int, default=30, help='Documents in the corpus')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--corpus-dir', default=os.path.join(BENCH_DIR, 'corpus'))
+    parser.add_argument('--unique', action='store_true',
+                        help='Make every request a distinct document so the conversion cache never hits')
+    parser.add_argument('--s3-root', default=os.path.join(tempfile.gettempdir(), 'wordtopdf-bench-s3'))
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='Simulated S3 round trip in seconds')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--label', help='Free-form tag stored with the results')
+    parser.add_argument('--results-dir', default=os.path.join(BENCH_DIR, 'results'))
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    prepare_environment(args.s3_root)
+
+    corpus = generate_corpus(args.corpus_dir, args.count, args.seed)
+    total = args.requests or len(corpus)
+    payloads = list(load_payloads(corpus, total, args.unique))
+
+    # Runners time only their request loop, not server start-up or warm-up
+    runner = run_http if args.mode == 'http' else run_direct
+    with RssSampler(os.getpid()) as sampler:
+        results, elapsed, cpu_seconds = runner(args, payloads)
+
+    # A remote server's memory is not visible from here
+    peak_rss = sampler.peak if not args.url else None
+    report = build_report(args, results, elapsed, peak_rss, cpu_seconds)
+    print_report(report)
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    suffix = f"-{args.label}" if args.label else ''
+    results_path = os.path.join(args.results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.mode}{suffix}.json")
+    with open(results_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {results_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
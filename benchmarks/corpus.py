@@ -0,0 +1,128 @@
+"""
+Synthetic .docx corpus for benchmarking the converter
+
+Documents come in size classes so results show how latency scales with
+document complexity. Generation is seeded, so a corpus is reproducible.
+"""
+import io
+import os
+import random
+import struct
+import zlib
+import zipfile
+import argparse
+
+from docx import Document
+from docx.shared import Inches
+
+WORDS = (
+    'agreement party service term payment invoice delivery schedule clause notice '
+    'confidential warranty liability period renewal client supplier amount total report'
+).split()
+
+# name: (paragraphs, tables, images, headings)
+SIZE_CLASSES = {
+    'small': (5, 0, 0, 1),
+    'medium': (60, 2, 1, 6),
+    'large': (400, 8, 6, 30),
+}
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _png(rng, width=320, height=200):
+    """A small solid-colour PNG, built without any imaging library"""
+    colour = bytes(rng.randrange(256) for _ in range(3))
+    raw = b''.join(b'\x00' + colour * width for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+
+def build_document(rng, size_class):
+    """
+    Build one synthetic document
+    Args:
+        rng (random.Random): Seeded random source
+        size_class (str): One of SIZE_CLASSES
+    Returns:
+        Document: The python-docx document
+    """
+    paragraphs, tables, images, headings = SIZE_CLASSES[size_class]
+    document = Document()
+    document.add_heading(_sentence(rng, 4), level=0)
+
+    # Spread headings, tables and images evenly through the body text
+    every_heading = max(1, paragraphs // max(1, headings))
+    every_table = max(1, paragraphs // (tables + 1)) if tables else None
+    every_image = max(1, paragraphs // (images + 1)) if images else None
+
+    for index in range(1, paragraphs + 1):
+        if index % every_heading == 0:
+            document.add_heading(_sentence(rng, 5), level=rng.choice((1, 2)))
+        if rng.random() < 0.2:
+            document.add_paragraph(_sentence(rng), style='List Bullet')
+        else:
+            document.add_paragraph(' '.join(_sentence(rng) for _ in range(rng.randint(2, 6))))
+        if every_table and index % every_table == 0:
+            rows, cols = rng.randint(3, 12), rng.randint(2, 5)
+            table = document.add_table(rows=rows, cols=cols)
+            table.style = 'Table Grid'
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = _sentence(rng, 3)
+        if every_image and index % every_image == 0:
+            document.add_picture(io.BytesIO(_png(rng)), width=Inches(rng.uniform(2, 5)))
+
+    return document
+
+
+def generate_corpus(out_dir, count=30, seed=1234, mix=('small', 'medium', 'large')):
+    """
+    Write a reproducible corpus of synthetic documents
+    Args:
+        out_dir (str): Directory for the documents
+        count (int): Number of documents to generate
+        seed (int): Random seed
+        mix (tuple): Size classes to cycle through
+    Returns:
+        list: (path, size class) for each document
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = []
+    for index in range(count):
+        size_class = mix[index % len(mix)]
+        path = os.path.join(out_dir, f"{size_class}-{index:04d}.docx")
+        if not os.path.exists(path):
+            # One seeded source per document keeps partial regeneration reproducible
+            rng = random.Random(f"{seed}-{index}")
+            build_document(rng, size_class).save(path)
+        corpus.append((path, size_class))
+    return corpus
+
+
+def make_unique(data, token):
+    """
+    Return the .docx bytes with a zip comment added, so the content hash
+    differs while the document itself is unchanged. Used to defeat the
+    conversion cache when measuring raw conversion cost.
+    """
+    buffer = io.BytesIO(data)
+    with zipfile.ZipFile(buffer, 'a') as archive:
+        archive.comment = f"bench-{token}".encode()
+    return buffer.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic .docx corpus')
+    parser.add_argument('out_dir')
+    parser.add_argument('--count', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    for path, size_class in generate_corpus(args.out_dir, args.count, args.seed):
+        print(f"{size_class:6} {os.path.getsize(path):>9} {path}")
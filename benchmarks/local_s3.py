@@ -0,0 +1,118 @@
+"""
+Local stand-in for the boto3 S3 client, so benchmarks measure the service
+rather than network round trips to AWS
+
+Only the calls S3Manager makes are implemented. Objects are plain files
+under root/<bucket>/<key>.
+"""
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+
+
+def _not_found(operation):
+    return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+
+class LocalS3Client:
+    """
+    Filesystem-backed subset of the boto3 S3 client API
+    Args:
+        root (str): Directory that holds one sub-directory per bucket
+        latency (float): Seconds to sleep per call, to approximate a real round trip
+    """
+
+    def __init__(self, root, latency=0.0):
+        self.root = root
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, key)
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def head_bucket(self, Bucket):
+        self._call('head_bucket')
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, Config=None, **kwargs):
+        self._call('upload_file')
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None, **kwargs):
+        self._call('upload_fileobj')
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            while True:
+                chunk = Fileobj.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._call('download_file')
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise _not_found('HeadObject')
+        shutil.copyfile(path, Filename)
+
+    def head_object(self, Bucket, Key):
+        self._call('head_object')
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise _not_found('HeadObject')
+        return {'ContentLength': os.path.getsize(path)}
+
+    def delete_object(self, Bucket, Key):
+        self._call('delete_object')
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        self._call('delete_objects')
+        deleted = []
+        for item in Delete['Objects']:
+            try:
+                os.remove(self._path(Bucket, item['Key']))
+            except FileNotFoundError:
+                pass
+            deleted.append({'Key': item['Key']})
+        return {'Deleted': deleted, 'Errors': []}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        self._call('generate_presigned_url')
+        Params = Params or {}
+        return f"file://{quote(self._path(Params.get('Bucket', ''), Params.get('Key', '')))}?expires={ExpiresIn}"
+
+
+def install(s3_manager, root, latency=0.0):
+    """
+    Point an S3Manager at a LocalS3Client for the current process
+    Args:
+        s3_manager (S3Manager): Manager to patch
+        root (str): Directory for the fake buckets
+        latency (float): Per-call delay in seconds
+    Returns:
+        LocalS3Client: The installed client
+    """
+    client = LocalS3Client(root, latency=latency)
+    s3_manager._client = client
+    s3_manager._client_pid = os.getpid()
+    return client
@@ -0,0 +1,299 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+from metrics import CHUNKED_UPLOAD_COUNT, CHUNKED_UPLOAD_CHUNKS
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MANIFEST = 'manifest.json'
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Stored chunks are named <index>-<sha256>.chunk, so listing the session
+# directory is enough to know which chunks arrived and what they contained
+CHUNK_NAME_PATTERN = re.compile(r'^(\d{6})-([0-9a-f]{64})\.chunk$')
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadNotFoundError(Exception):
+    """Raised for an unknown, expired or already completed upload session"""
+
+
+class ChunkError(ValueError):
+    """Raised when a chunk or a completion request does not match the session"""
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads sent as numbered chunks: init, PUT each chunk, complete
+
+    Sessions live on disk under directory, so any worker on the node can take
+    any chunk, and a client that lost its connection only re-sends the chunks
+    missing from status().
+    """
+
+    def __init__(self, directory, max_bytes, chunk_size=8 * MB, ttl=24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _session_dir(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadNotFoundError(f"Unknown upload {upload_id}")
+        return os.path.join(self.directory, upload_id)
+
+    def _manifest(self, upload_id):
+        try:
+            with open(os.path.join(self._session_dir(upload_id), MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFoundError(f"Unknown upload {upload_id}")
+
+    def _chunks(self, upload_id):
+        """Map of chunk index to (sha256, path) for every stored chunk"""
+        session_dir = self._session_dir(upload_id)
+        chunks = {}
+        for name in os.listdir(session_dir):
+            match = CHUNK_NAME_PATTERN.match(name)
+            if match:
+                chunks[int(match.group(1))] = (match.group(2), os.path.join(session_dir, name))
+        return chunks
+
+    def create(self, filename, size):
+        """
+        Start an upload session
+        Args:
+            filename (str): Sanitized name of the document
+            size (int): Total size of the document in bytes
+        Returns:
+            dict: The session manifest (upload_id, filename, size, chunk_size, total_chunks)
+        Raises:
+            ChunkError: If the size is not acceptable
+        """
+        if size <= 0:
+            raise ChunkError("Upload size must be positive")
+        if size > self.max_bytes:
+            raise ChunkError(f"Uploads are limited to {self.max_bytes // MB}MB")
+        self.expire()
+
+        manifest = {
+            'upload_id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': -(-size // self.chunk_size),
+            'created_at': time.time()
+        }
+        session_dir = os.path.join(self.directory, manifest['upload_id'])
+        os.makedirs(session_dir)
+        with open(os.path.join(session_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        CHUNKED_UPLOAD_COUNT.labels(outcome='started').inc()
+        logger.info(f"Started chunked upload {manifest['upload_id']} for {filename} ({size} bytes)")
+        return manifest
+
+    def status(self, upload_id):
+        """
+        Describe a session, including which chunks are still missing
+        Args:
+            upload_id (str): The session id
+        Returns:
+            dict: The manifest plus received ({index: sha256}) and missing ([index])
+        """
+        manifest = self._manifest(upload_id)
+        chunks = self._chunks(upload_id)
+        return dict(
+            manifest,
+            received={index: digest for index, (digest, _) in sorted(chunks.items())},
+            missing=[index for index in range(manifest['total_chunks']) if index not in chunks]
+        )
+
+    def _expected_size(self, manifest, index):
+        if index == manifest['total_chunks'] - 1:
+            return manifest['size'] - index * manifest['chunk_size']
+        return manifest['chunk_size']
+
+    def put_chunk(self, upload_id, index, stream, expected_sha256=None):
+        """
+        Store one chunk, hashing it on the way to disk
+        Args:
+            upload_id (str): The session id
+            index (int): Zero-based chunk number
+            stream (file): Readable stream with the chunk body
+            expected_sha256 (str, optional): Hex digest the client computed; mismatches are rejected
+        Returns:
+            str: Hex SHA-256 digest of the stored chunk
+        Raises:
+            ChunkError: If the chunk is out of range, the wrong size or corrupt
+        """
+        manifest = self._manifest(upload_id)
+        if not 0 <= index < manifest['total_chunks']:
+            raise ChunkError(f"Chunk {index} is out of range (0-{manifest['total_chunks'] - 1})")
+        expected_size = self._expected_size(manifest, index)
+
+        session_dir = self._session_dir(upload_id)
+        tmp_path = os.path.join(session_dir, f"{index:06d}.{uuid.uuid4().hex}.tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                for data in iter(lambda: stream.read(COPY_BUFFER_SIZE), b''):
+                    size += len(data)
+                    if size > expected_size:
+                        break
+                    digest.update(data)
+                    out.write(data)
+            if size != expected_size:
+                CHUNKED_UPLOAD_CHUNKS.labels(result='rejected').inc()
+                raise ChunkError(f"Chunk {index} must be {expected_size} bytes")
+            chunk_digest = digest.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != chunk_digest:
+                CHUNKED_UPLOAD_CHUNKS.labels(result='corrupt').inc()
+                raise ChunkError(f"Chunk {index} does not match its SHA-256")
+
+            previous = self._chunks(upload_id).get(index)
+            try:
+                os.replace(tmp_path, os.path.join(session_dir, f"{index:06d}-{chunk_digest}.chunk"))
+            except FileNotFoundError:
+                # Completed or aborted while this chunk was arriving
+                raise UploadNotFoundError(f"Unknown upload {upload_id}")
+            if previous is not None and previous[0] != chunk_digest:
+                _remove(previous[1])
+            CHUNKED_UPLOAD_CHUNKS.labels(result='duplicate' if previous else 'stored').inc()
+            return chunk_digest
+        finally:
+            _remove(tmp_path)
+
+    def complete(self, upload_id, destination):
+        """
+        Assemble the chunks, in order, into one file and end the session
+        Args:
+            upload_id (str): The session id
+            destination (str): Path to write the assembled document to
+        Returns:
+            tuple: (manifest, size in bytes, SHA-256 hex digest of the document)
+        Raises:
+            ChunkError, OSError: As assemble(); the session stays open
+        """
+        result = self.assemble(upload_id, destination)
+        self.finish(upload_id)
+        return result
+
+    def assemble(self, upload_id, destination):
+        """
+        Assemble the chunks, in order, into one file, holding the session until finish() or reopen()
+        Args:
+            upload_id (str): The session id
+            destination (str): Path to write the assembled document to
+        Returns:
+            tuple: (manifest, size in bytes, SHA-256 hex digest of the document)
+        Raises:
+            ChunkError: If chunks are missing; the session stays open so they can be sent
+            OSError: If the document cannot be written; the session stays open so complete can be retried
+        """
+        manifest = self._manifest(upload_id)
+        missing = self.status(upload_id)['missing']
+        if missing:
+            raise ChunkError(f"{len(missing)} chunks are missing")
+
+        # Renaming the session claims it, so a repeated complete cannot assemble it twice
+        session_dir = self._session_dir(upload_id)
+        claimed_dir = f"{session_dir}.assembling"
+        try:
+            os.rename(session_dir, claimed_dir)
+        except FileNotFoundError:
+            raise UploadNotFoundError(f"Unknown upload {upload_id}")
+
+        try:
+            chunks = {}
+            for name in os.listdir(claimed_dir):
+                match = CHUNK_NAME_PATTERN.match(name)
+                if match:
+                    chunks[int(match.group(1))] = os.path.join(claimed_dir, name)
+            missing = [index for index in range(manifest['total_chunks']) if index not in chunks]
+            if missing:
+                raise ChunkError(f"{len(missing)} chunks are missing")
+            digest = hashlib.sha256()
+            size = 0
+            with open(destination, 'wb') as out:
+                for index in range(manifest['total_chunks']):
+                    with open(chunks[index], 'rb') as part:
+                        for data in iter(lambda: part.read(COPY_BUFFER_SIZE), b''):
+                            digest.update(data)
+                            out.write(data)
+                            size += len(data)
+        except BaseException:
+            # Hand the chunks back to the session so the client can retry, and drop the partial document
+            _remove(destination)
+            self.reopen(upload_id)
+            raise
+
+        logger.info(f"Assembled chunked upload {upload_id}: {manifest['total_chunks']} chunks, {size} bytes")
+        return manifest, size, digest.hexdigest()
+
+    def finish(self, upload_id):
+        """End a session assembled with assemble(), deleting its chunks"""
+        shutil.rmtree(f"{self._session_dir(upload_id)}.assembling", ignore_errors=True)
+        CHUNKED_UPLOAD_COUNT.labels(outcome='completed').inc()
+
+    def reopen(self, upload_id):
+        """Give an assembled session its chunks back, e.g. when the document could not be queued"""
+        session_dir = self._session_dir(upload_id)
+        try:
+            os.rename(f"{session_dir}.assembling", session_dir)
+        except OSError as e:
+            logger.error(f"Could not reopen chunked upload {upload_id}: {str(e)}")
+
+    def abort(self, upload_id):
+        """Drop a session and its chunks"""
+        session_dir = self._session_dir(upload_id)
+        if not os.path.isdir(session_dir):
+            raise UploadNotFoundError(f"Unknown upload {upload_id}")
+        shutil.rmtree(session_dir, ignore_errors=True)
+        CHUNKED_UPLOAD_COUNT.labels(outcome='aborted').inc()
+
+    def expire(self):
+        """
+        Remove sessions that have not received a chunk within the TTL
+        Returns:
+            int: Number of sessions removed
+        """
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                idle = now - max(entry.stat().st_mtime for entry in os.scandir(path))
+            except (OSError, ValueError):
+                continue
+            if idle > self.ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            CHUNKED_UPLOAD_COUNT.labels(outcome='expired').inc(removed)
+            logger.info(f"Expired {removed} idle chunked uploads")
+        return removed
+
+    def total_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except FileNotFoundError:
+                    continue
+        return total
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
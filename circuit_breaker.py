@@ -0,0 +1,106 @@
+import time
+import logging
+import threading
+from collections import deque
+from metrics import BREAKER_STATE, BREAKER_TRANSITIONS, BREAKER_REJECTED
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_HALF_OPEN = 'half_open'
+STATE_OPEN = 'open'
+
+# Values of the breaker state gauge
+STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a dependency fast once too many of them fail
+
+    Closed: calls go through and outcomes are recorded over a sliding window.
+    Once at least minimum_calls are in the window and failure_rate of them
+    failed, the breaker opens and rejects calls for open_seconds. It then
+    half-opens and lets probe_calls through; a success closes it again, a
+    failure re-opens it.
+    """
+
+    def __init__(self, name, failure_rate=0.5, minimum_calls=5, window_seconds=30.0, open_seconds=30.0, probe_calls=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.probe_calls = probe_calls
+        self._outcomes = deque()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        BREAKER_STATE.labels(breaker=name).set(STATE_VALUES[STATE_CLOSED])
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def _transition(self, state):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit breaker {self.name}: {self._state} -> {state}")
+        self._state = state
+        self._probes = 0
+        if state == STATE_OPEN:
+            self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        BREAKER_STATE.labels(breaker=self.name).set(STATE_VALUES[state])
+        BREAKER_TRANSITIONS.labels(breaker=self.name, state=state).inc()
+
+    def _refresh(self, now):
+        if self._state == STATE_OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(STATE_HALF_OPEN)
+
+    def allow(self):
+        """
+        Whether a call may go ahead now; every allowed call must be followed by
+        record_success() or record_failure()
+        Returns:
+            bool: False while the circuit is open or its probes are taken
+        """
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN and self._probes < self.probe_calls:
+                self._probes += 1
+                return True
+        BREAKER_REJECTED.labels(breaker=self.name).inc()
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._transition(STATE_CLOSED)
+            else:
+                self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._transition(STATE_OPEN)
+            elif self._state == STATE_CLOSED:
+                self._record(False)
+                failures = sum(1 for _, ok in self._outcomes if not ok)
+                if len(self._outcomes) >= self.minimum_calls and failures >= self.failure_rate * len(self._outcomes):
+                    self._transition(STATE_OPEN)
+
+    def _record(self, ok):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
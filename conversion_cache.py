@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import errno
+import shutil
+import logging
+import threading
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Result of a cache lookup. local_path is set when the PDF is on this node,
+# s3_key when the PDF is known to be in the shared S3 tier. pages and
+# thumbnail_key (S3) or thumbnail_path (local) are None when not recorded.
+CacheEntry = namedtuple('CacheEntry', ['digest', 'source', 'local_path', 's3_key', 'pages', 'thumbnail_path',
+                                       'thumbnail_key'], defaults=(None, None, None))
+
+SHARED_MARKER_SUFFIX = '.s3'
+
+# Sidecars kept next to each cached PDF: the first-page thumbnail and what the
+# converter reported about the document. In S3 the thumbnail is its own object
+# and the metadata rides on the PDF as x-amz-meta-* headers.
+THUMBNAIL_SUFFIX = '.png'
+METADATA_SUFFIX = '.json'
+
+
+class ConversionCache:
+    """
+    Content-addressed cache of converted PDFs keyed on the SHA-256 of the source .docx
+
+    The local tier lives on disk and is shared by every worker on the node:
+    lookups go to the disk, not to a per-process index, and the size budget is
+    enforced node-wide by whichever worker holds the eviction lock, which
+    drops least-recently-used entries from a scan of the directory. Between
+    scans each worker adds what it stores to the total it last scanned, and
+    only rescans once that is over budget or rescan_interval has passed, so
+    stores made by other workers can overshoot the budget until then. The shared
+    tier is the PDF bucket, so a document converted on any node is a hit
+    everywhere.
+    """
+
+    def __init__(self, cache_dir, max_bytes, s3_manager=None, s3_prefix='cache/', rescan_interval=60.0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self.s3_manager = s3_manager
+        self.s3_prefix = s3_prefix
+        # Digests this process has seen in S3 without a local copy to mark
+        self._shared = set()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = self._scan()
+        self._total_bytes = sum(size for _, _, size in entries)
+        self._scanned_at = time.monotonic()
+        logger.info(f"Found {len(entries)} cached PDFs ({self._total_bytes} bytes)")
+
+    def _scan(self):
+        """
+        List the local tier from disk
+        Returns:
+            list: (last use, digest, bytes including sidecars) per cached PDF, least recently used first
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.pdf'):
+                continue
+            digest = entry.name[:-len('.pdf')]
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, digest, self._entry_size(digest)))
+        return sorted(entries)
+
+    @property
+    def total_bytes(self):
+        """Bytes held in the local tier, node-wide as of the last scan plus this worker's stores since"""
+        return self._total_bytes
+
+    def local_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.pdf")
+
+    def _marker_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}{SHARED_MARKER_SUFFIX}")
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}{THUMBNAIL_SUFFIX}")
+
+    def _metadata_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}{METADATA_SUFFIX}")
+
+    def _entry_size(self, digest):
+        size = 0
+        for path in (self.local_path(digest), self.thumbnail_path(digest), self._metadata_path(digest)):
+            try:
+                size += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return size
+
+    def metadata(self, digest):
+        """
+        What the converter reported about a locally cached document
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+        Returns:
+            dict: e.g. {'pages': 3}; empty if nothing was recorded
+        """
+        try:
+            with open(self._metadata_path(digest)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def s3_key(self, digest):
+        return f"{self.s3_prefix}{digest}.pdf"
+
+    def thumbnail_key(self, digest):
+        return f"{self.s3_prefix}{digest}{THUMBNAIL_SUFFIX}"
+
+    def lookup(self, digest):
+        """
+        Find a cached PDF for a document digest
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+        Returns:
+            CacheEntry: The cached PDF, or None on a miss
+        """
+        # Whichever worker stored it, the PDF is on this node's disk
+        local_path = self.local_path(digest)
+        try:
+            # The modification time doubles as the last use, for eviction
+            os.utime(local_path)
+        except FileNotFoundError:
+            pass
+        else:
+            s3_key = self.s3_key(digest) if self.is_shared(digest) else None
+            thumbnail_path = self.thumbnail_path(digest)
+            if not os.path.exists(thumbnail_path):
+                thumbnail_path = None
+            thumbnail_key = self.thumbnail_key(digest) if s3_key and thumbnail_path else None
+            return CacheEntry(digest, 'local', local_path, s3_key, self.metadata(digest).get('pages'),
+                              thumbnail_path, thumbnail_key)
+
+        if self.s3_manager is not None:
+            try:
+                metadata = self.s3_manager.object_metadata(self.s3_key(digest), is_pdf=True)
+                if metadata is not None:
+                    self.mark_shared(digest)
+                    pages = metadata.get('pages')
+                    thumbnail_key = self.thumbnail_key(digest) if metadata.get('thumbnail') == '1' else None
+                    return CacheEntry(digest, 's3', None, self.s3_key(digest),
+                                      int(pages) if pages and pages.isdigit() else None, None, thumbnail_key)
+            except Exception as e:
+                logger.error(f"Failed to check shared cache for {digest}: {str(e)}")
+
+        return None
+
+    def store(self, digest, pdf_path, thumbnail_path=None, metadata=None):
+        """
+        Add a converted PDF to the local tier
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+            pdf_path (str): Path to the converted PDF
+            thumbnail_path (str, optional): First-page PNG made alongside the PDF
+            metadata (dict, optional): What the converter reported, e.g. {'pages': 3}
+        Returns:
+            int: Number of entries evicted to stay within the size budget
+        """
+        replaced = self._entry_size(digest)
+        # Sidecars go in first, so whoever sees the PDF also sees them
+        if thumbnail_path:
+            _place(thumbnail_path, self.thumbnail_path(digest))
+        if metadata:
+            tmp_path = f"{self._metadata_path(digest)}.tmp{threading.get_ident()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(metadata, f)
+            os.replace(tmp_path, self._metadata_path(digest))
+        _place(pdf_path, self.local_path(digest))
+        if digest in self._shared:
+            open(self._marker_path(digest), 'a').close()
+
+        with self._lock:
+            self._total_bytes += self._entry_size(digest) - replaced
+            due = (self._total_bytes > self.max_bytes
+                   or time.monotonic() - self._scanned_at >= self.rescan_interval)
+        return self.evict_if_leader() if due else 0
+
+    def publish(self, digest, download_name=None):
+        """
+        Upload a locally cached PDF to the shared S3 tier
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+            download_name (str, optional): File name offered to the browser
+        Returns:
+            str: Presigned URL of the shared copy
+        """
+        self.upload(digest)
+        return self.presigned_url(digest, download_name=download_name)
+
+    def upload(self, digest):
+        """
+        Copy a locally cached PDF, and its thumbnail if any, into the shared S3 tier
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+        """
+        self.s3_manager.upload_files(self.uploads(digest))
+        self.mark_shared(digest)
+
+    def uploads(self, digest):
+        """
+        The S3 uploads that publish a cached document, thumbnail first
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+        Returns:
+            list: S3Manager.upload_file argument tuples
+        """
+        metadata = {key: str(value) for key, value in self.metadata(digest).items() if value is not None}
+        uploads = []
+        if os.path.exists(self.thumbnail_path(digest)):
+            uploads.append((self.thumbnail_path(digest), self.thumbnail_key(digest), True, None, 'image/png'))
+            metadata['thumbnail'] = '1'
+        uploads.append((self.local_path(digest), self.s3_key(digest), True, metadata, 'application/pdf'))
+        return uploads
+
+    def presigned_url(self, digest, download_name=None):
+        """
+        Presign the shared copy of a cached PDF
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+            download_name (str, optional): File name offered to the browser
+        Returns:
+            str: Presigned URL, or None if signing failed
+        """
+        return self.s3_manager.get_presigned_url(self.s3_key(digest), is_pdf=True, download_name=download_name)
+
+    def thumbnail_url(self, digest):
+        """
+        Presign the shared copy of a cached document's thumbnail
+        Args:
+            digest (str): SHA-256 hex digest of the source document
+        Returns:
+            str: Presigned URL, or None if signing failed
+        """
+        return self.s3_manager.get_presigned_url(self.thumbnail_key(digest), is_pdf=True)
+
+    def is_shared(self, digest):
+        """Whether the PDF for a digest is known, by any worker on the node, to be in the shared tier"""
+        return digest in self._shared or os.path.exists(self._marker_path(digest))
+
+    def mark_shared(self, digest):
+        """Record that the PDF for a digest is in the shared tier"""
+        with self._lock:
+            self._shared.add(digest)
+        if os.path.exists(self.local_path(digest)):
+            open(self._marker_path(digest), 'a').close()
+
+    def evict_if_leader(self):
+        """
+        Enforce the node-wide budget unless another worker is already doing it
+        Returns:
+            int: Number of entries evicted
+        """
+        if fcntl is None:
+            with self._lock:
+                return self._evict()
+        with open(os.path.join(self.cache_dir, '.evict.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return 0
+                raise
+            return self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the directory is under budget; caller holds the lock"""
+        entries = self._scan()
+        total = sum(size for _, _, size in entries)
+        evicted = 0
+        # The newest entry always stays, even if it alone is over budget
+        for _, digest, size in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            for path in (self.local_path(digest), self._marker_path(digest), self.thumbnail_path(digest),
+                         self._metadata_path(digest)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+            logger.info(f"Evicted cached PDF {digest} ({size} bytes)")
+        self._total_bytes = total
+        self._scanned_at = time.monotonic()
+        return evicted
+
+
+def _place(source_path, path):
+    """Hard-link or copy a file into place atomically"""
+    tmp_path = f"{path}.tmp{threading.get_ident()}"
+    try:
+        os.link(source_path, tmp_path)
+    except OSError:
+        shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, path)
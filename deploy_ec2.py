@@ -1,5 +1,11 @@
 import boto3
 import os
+import sys
+import math
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 import logging
 from dotenv import load_dotenv
@@ -14,122 +20,215 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_AMI_ID = 'ami-0989fb15ce71ba39e'  # Amazon Linux 2 AMI ID
+
+USER_DATA = '''#!/bin/bash
+                    yum update -y
+                    yum install -y python3-pip
+                    yum install -y git
+                    cd /home/ec2-user
+                    git clone https://github.com/yourusername/word-to-pdf-converter.git
+                    cd word-to-pdf-converter
+                    pip3 install -r requirements.txt
+                    python3 app.py
+                '''
+
+# Instances the fleet controller manages carry this tag; its value names the fleet
+FLEET_TAG_KEY = 'Fleet'
+DEFAULT_FLEET = os.getenv('FLEET_NAME', 'WordToPDFConverter')
+
+# Instance states that count as fleet capacity; pending ones are already paid for
+LIVE_STATES = ['pending', 'running']
+
+# Where the controller reads an instance's load: the aggregated metrics server
+# of the gunicorn master, reached over the VPC
+DEFAULT_METRICS_URL = os.getenv('FLEET_METRICS_URL', 'http://{private_ip}:8000/metrics')
+
 class EC2Manager:
-    def __init__(self):
-        self.ec2_client = boto3.client(
+    def __init__(self, ec2_client=None, ec2_resource=None):
+        # EC2_ENDPOINT_URL points the clients at a local stand-in such as moto_server
+        self.ec2_client = ec2_client or boto3.client(
             'ec2',
             aws_access_key_id=os.getenv('MY_AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=os.getenv('MY_AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('MY_AWS_REGION')
+            region_name=os.getenv('MY_AWS_REGION'),
+            endpoint_url=os.getenv('EC2_ENDPOINT_URL')
         )
-        self.ec2_resource = boto3.resource(
+        self.ec2_resource = ec2_resource or boto3.resource(
             'ec2',
             aws_access_key_id=os.getenv('MY_AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=os.getenv('MY_AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('MY_AWS_REGION')
+            region_name=os.getenv('MY_AWS_REGION'),
+            endpoint_url=os.getenv('EC2_ENDPOINT_URL')
         )
 
     def create_security_group(self):
-        """Create a security group for the EC2 instance"""
+        """Create a security group for the EC2 instance, or bring an existing one's rules up to date"""
         try:
             security_group = self.ec2_client.create_security_group(
                 GroupName='WordToPDFConverter-SG',
                 Description='Security group for Word to PDF Converter'
             )
-            
-            # Add inbound rules
-            self.ec2_client.authorize_security_group_ingress(
-                GroupId=security_group['GroupId'],
-                IpPermissions=[
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 80,
-                        'ToPort': 80,
-                        'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
-                    },
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 443,
-                        'ToPort': 443,
-                        'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
-                    },
-                    {
-                        'IpProtocol': 'tcp',
-                        'FromPort': 22,
-                        'ToPort': 22,
-                        'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
-                    }
-                ]
-            )
-            
-            logger.info(f"Created security group: {security_group['GroupId']}")
-            return security_group['GroupId']
-            
+            group_id = security_group['GroupId']
+            logger.info(f"Created security group: {group_id}")
         except ClientError as e:
             if e.response['Error']['Code'] == 'InvalidGroup.Duplicate':
                 # Get existing security group
                 security_groups = self.ec2_client.describe_security_groups(
                     GroupNames=['WordToPDFConverter-SG']
                 )
-                return security_groups['SecurityGroups'][0]['GroupId']
+                group_id = security_groups['SecurityGroups'][0]['GroupId']
             else:
                 logger.error(f"Error creating security group: {str(e)}")
                 raise
 
-    def create_instance(self):
-        """Create and launch an EC2 instance"""
+        # Groups created before a rule was added get it here too
+        self.authorize_ingress(group_id)
+        return group_id
+
+    def metrics_cidr(self, group_id):
+        """
+        Addresses allowed to read instance metrics: FLEET_METRICS_CIDR, else the group's whole VPC
+        Args:
+            group_id (str): The security group
+        Returns:
+            str: CIDR block
+        """
+        cidr = os.getenv('FLEET_METRICS_CIDR')
+        if cidr:
+            return cidr
+        group = self.ec2_client.describe_security_groups(GroupIds=[group_id])['SecurityGroups'][0]
+        return self.ec2_client.describe_vpcs(VpcIds=[group['VpcId']])['Vpcs'][0]['CidrBlock']
+
+    def authorize_ingress(self, group_id):
+        """
+        Add the inbound rules, skipping any the group already has
+        Args:
+            group_id (str): The security group
+        """
+        permissions = [
+            {
+                'IpProtocol': 'tcp',
+                'FromPort': 80,
+                'ToPort': 80,
+                'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
+            },
+            {
+                'IpProtocol': 'tcp',
+                'FromPort': 443,
+                'ToPort': 443,
+                'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
+            },
+            {
+                'IpProtocol': 'tcp',
+                'FromPort': 22,
+                'ToPort': 22,
+                'IpRanges': [{'CidrIp': '0.0.0.0/0'}]
+            },
+            {
+                # Metrics for the fleet controller, from inside the VPC only
+                'IpProtocol': 'tcp',
+                'FromPort': 8000,
+                'ToPort': 8000,
+                'IpRanges': [{'CidrIp': self.metrics_cidr(group_id)}]
+            }
+        ]
+        # One call per rule: a call with a rule that already exists adds nothing
+        for permission in permissions:
+            try:
+                self.ec2_client.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[permission])
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidPermission.Duplicate':
+                    logger.error(f"Error authorizing port {permission['FromPort']} on {group_id}: {str(e)}")
+                    raise
+
+    def launch_instances(self, count, tags=None):
+        """
+        Launch instances in a single request; EC2 brings them up in parallel
+        Args:
+            count (int): Number of instances to launch
+            tags (dict, optional): Tags added to the Name tag
+        Returns:
+            list: Ids of the launched instances, still pending
+        """
         try:
             # Create security group
             security_group_id = self.create_security_group()
             
-            # Create instance
+            tags = dict({'Name': 'WordToPDFConverter'}, **(tags or {}))
             instances = self.ec2_resource.create_instances(
-                ImageId='ami-0989fb15ce71ba39e',  # Amazon Linux 2 AMI ID
-                MinCount=1,
-                MaxCount=1,
-                InstanceType='t2.micro',
+                ImageId=os.getenv('EC2_AMI_ID', DEFAULT_AMI_ID),
+                MinCount=count,
+                MaxCount=count,
+                InstanceType=os.getenv('EC2_INSTANCE_TYPE', 't2.micro'),
                 KeyName=os.getenv('EC2_KEY_PAIR_NAME', 'word-to-pdf-converter-key'),
                 SecurityGroupIds=[security_group_id],
-                UserData='''#!/bin/bash
-                    yum update -y
-                    yum install -y python3-pip
-                    yum install -y git
-                    cd /home/ec2-user
-                    git clone https://github.com/yourusername/word-to-pdf-converter.git
-                    cd word-to-pdf-converter
-                    pip3 install -r requirements.txt
-                    python3 app.py
-                ''',
+                UserData=USER_DATA,
                 TagSpecifications=[
                     {
                         'ResourceType': 'instance',
-                        'Tags': [
-                            {
-                                'Key': 'Name',
-                                'Value': 'WordToPDFConverter'
-                            }
-                        ]
+                        'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]
                     }
                 ]
             )
-            
-            instance = instances[0]
-            logger.info(f"Created EC2 instance: {instance.id}")
-            
-            # Wait for instance to be running
-            instance.wait_until_running()
-            
-            # Get instance public IP
-            instance.load()
-            public_ip = instance.public_ip_address
-            logger.info(f"Instance is running at: {public_ip}")
-            
-            return instance.id, public_ip
-            
+
+            instance_ids = [instance.id for instance in instances]
+            logger.info(f"Created EC2 instances: {', '.join(instance_ids)}")
+            return instance_ids
+
         except ClientError as e:
-            logger.error(f"Error creating EC2 instance: {str(e)}")
+            logger.error(f"Error creating EC2 instances: {str(e)}")
             raise
 
+    def wait_until_running(self, instance_ids):
+        """
+        Wait for several instances at once rather than one after another
+        Args:
+            instance_ids (list): Instances to wait for
+        Returns:
+            dict: Maps each instance id to its public IP
+        """
+        self.ec2_client.get_waiter('instance_running').wait(InstanceIds=instance_ids)
+        reservations = self.ec2_client.describe_instances(InstanceIds=instance_ids)['Reservations']
+        return {instance['InstanceId']: instance.get('PublicIpAddress')
+                for reservation in reservations for instance in reservation['Instances']}
+
+    def create_instance(self):
+        """Create and launch an EC2 instance"""
+        instance_id = self.launch_instances(1)[0]
+
+        # Wait for instance to be running
+        public_ip = self.wait_until_running([instance_id])[instance_id]
+        logger.info(f"Instance is running at: {public_ip}")
+
+        return instance_id, public_ip
+
+    def fleet_instances(self, fleet=DEFAULT_FLEET):
+        """
+        Pending and running instances tagged as members of a fleet
+        Args:
+            fleet (str): Value of the Fleet tag
+        Returns:
+            list: Dicts with id, state, launch_time, private_ip and public_ip, oldest first
+        """
+        instances = []
+        paginator = self.ec2_client.get_paginator('describe_instances')
+        pages = paginator.paginate(Filters=[
+            {'Name': f"tag:{FLEET_TAG_KEY}", 'Values': [fleet]},
+            {'Name': 'instance-state-name', 'Values': LIVE_STATES}
+        ])
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    instances.append({
+                        'id': instance['InstanceId'],
+                        'state': instance['State']['Name'],
+                        'launch_time': instance['LaunchTime'],
+                        'private_ip': instance.get('PrivateIpAddress'),
+                        'public_ip': instance.get('PublicIpAddress')
+                    })
+        return sorted(instances, key=lambda instance: instance['launch_time'])
+
     def terminate_instance(self, instance_id):
         """Terminate an EC2 instance"""
         try:
@@ -141,10 +240,327 @@ class EC2Manager:
             logger.error(f"Error terminating instance: {str(e)}")
             raise
 
-if __name__ == '__main__':
+    def terminate_instances(self, instance_ids):
+        """Terminate several EC2 instances in a single request"""
+        try:
+            response = self.ec2_client.terminate_instances(InstanceIds=instance_ids)
+            logger.info(f"Terminated instances: {', '.join(instance_ids)}")
+            return response
+        except ClientError as e:
+            logger.error(f"Error terminating instances: {str(e)}")
+            raise
+
+def scrape_metrics(url, timeout=5.0):
+    """
+    Read one instance's conversion load from its Prometheus metrics
+    Args:
+        url (str): The instance's /metrics URL
+        timeout (float): Seconds to wait for the response
+    Returns:
+        dict: in_flight, waiting (queued jobs plus requests waiting for a slot),
+            and the duration_sum and duration_count of the conversion time histogram
+    """
+    from prometheus_client.parser import text_string_to_metric_families
+
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        text = response.read().decode()
+    load = {'in_flight': 0.0, 'waiting': 0.0, 'duration_sum': 0.0, 'duration_count': 0.0}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == 'pdf_conversion_in_flight':
+                load['in_flight'] += sample.value
+            elif sample.name in ('pdf_conversion_queue_depth', 'admission_waiting'):
+                load['waiting'] += sample.value
+            elif sample.name == 'pdf_conversion_duration_seconds_sum':
+                load['duration_sum'] += sample.value
+            elif sample.name == 'pdf_conversion_duration_seconds_count':
+                load['duration_count'] += sample.value
+    return load
+
+class ScalingPolicy:
+    """
+    Target instance count for a fleet, from its conversion load
+
+    Demand is the conversions running plus waiting across the fleet; the
+    target keeps each instance's conversion slots at most target_utilization
+    busy. A fleet whose average conversion time is over target_duration gets
+    one more instance even when its slots look sufficient. Scaling out and in
+    each have a cooldown (scaling in also waits out a recent scale-out), and
+    one decision moves at most max_step instances. The min/max bounds are
+    enforced regardless of cooldowns. Demand read from only part of the fleet
+    understates the load, so it never scales the fleet in, except down to
+    max_instances.
+    """
+
+    def __init__(self, min_instances=1, max_instances=10, slots_per_instance=2, target_utilization=0.7,
+                 target_duration=None, scale_out_cooldown=300.0, scale_in_cooldown=900.0, max_step=4):
+        self.min_instances = min_instances
+        self.max_instances = max_instances
+        self.slots_per_instance = slots_per_instance
+        self.target_utilization = target_utilization
+        self.target_duration = target_duration
+        self.scale_out_cooldown = scale_out_cooldown
+        self.scale_in_cooldown = scale_in_cooldown
+        self.max_step = max_step
+        self.last_scale_out = None
+        self.last_scale_in = None
+
+    def desired(self, current, demand, avg_duration=None):
+        """Instance count the load calls for, before cooldowns and step limits"""
+        target = math.ceil(demand / (self.slots_per_instance * self.target_utilization))
+        if self.target_duration and avg_duration is not None and avg_duration > self.target_duration:
+            target = max(target, current + 1)
+        return max(self.min_instances, min(self.max_instances, target))
+
+    def _since(self, *times, now):
+        times = [t for t in times if t is not None]
+        return now - max(times) if times else float('inf')
+
+    def decide(self, current, demand, avg_duration=None, now=None, complete=True):
+        """
+        Decide the fleet size for this step and start the cooldown if it changes
+        Args:
+            current (int): Pending plus running instances
+            demand (float): Conversions running plus waiting across the fleet
+            avg_duration (float, optional): Average conversion time since the last step
+            now (float, optional): Monotonic time; defaults to the current time
+            complete (bool): Whether every running instance reported its load
+        Returns:
+            tuple: (target instance count, reason)
+        """
+        now = time.monotonic() if now is None else now
+        desired = self.desired(current, demand, avg_duration)
+        if current < self.min_instances or current > self.max_instances:
+            if current > self.max_instances and not complete:
+                # Partial demand understates the load, so shrink only as far as the bound
+                desired = self.max_instances
+            target, reason = desired, 'bounds'
+        elif desired < current and not complete:
+            return current, 'metrics incomplete'
+        elif desired > current:
+            if self._since(self.last_scale_out, now=now) < self.scale_out_cooldown:
+                return current, 'scale-out cooldown'
+            target, reason = min(desired, current + self.max_step), 'scale out'
+        elif desired < current:
+            if self._since(self.last_scale_out, self.last_scale_in, now=now) < self.scale_in_cooldown:
+                return current, 'scale-in cooldown'
+            target, reason = max(desired, current - self.max_step), 'scale in'
+        else:
+            return current, 'steady'
+
+        if target > current:
+            self.last_scale_out = now
+        elif target < current:
+            self.last_scale_in = now
+        return target, reason
+
+class FleetController:
+    """
+    Keeps a tagged EC2 fleet sized to its conversion load
+
+    Each step lists the fleet, reads every running instance's /metrics in
+    parallel, asks the policy for a target and launches or terminates the
+    difference in one request, without waiting for new instances to boot:
+    pending instances already count as capacity. Scaling in removes idle
+    instances first, then the newest, and only ever instances that reported
+    their load. While any running instance does not answer, the fleet may
+    grow but is never shrunk. In dry-run mode decisions are logged but
+    nothing is launched or terminated.
+    """
+
+    def __init__(self, manager, policy, fleet=DEFAULT_FLEET, metrics_url=DEFAULT_METRICS_URL, dry_run=False,
+                 scrape=scrape_metrics, scrape_timeout=5.0):
+        self.manager = manager
+        self.policy = policy
+        self.fleet = fleet
+        self.metrics_url = metrics_url
+        self.dry_run = dry_run
+        self.scrape = scrape
+        self.scrape_timeout = scrape_timeout
+        # Histogram totals per instance at the previous step
+        self._previous = {}
+
+    def observe(self, instances):
+        """
+        Read the load of the fleet's running instances
+        Args:
+            instances (list): Fleet members, from EC2Manager.fleet_instances
+        Returns:
+            tuple: (demand, average conversion seconds since the last step or None, dict of load per instance id)
+        """
+        running = [instance for instance in instances if instance['state'] == 'running']
+        loads = {}
+        if running:
+            with ThreadPoolExecutor(max_workers=min(32, len(running)), thread_name_prefix='fleet-scrape') as executor:
+                pending = {
+                    instance['id']: executor.submit(self.scrape, self.metrics_url.format(**instance), self.scrape_timeout)
+                    for instance in running
+                }
+                for instance_id, future in pending.items():
+                    try:
+                        loads[instance_id] = future.result()
+                    except Exception as e:
+                        logger.warning(f"Could not read metrics from {instance_id}: {str(e)}")
+
+        demand = sum(load['in_flight'] + load['waiting'] for load in loads.values())
+        duration_sum = duration_count = 0.0
+        for instance_id, load in loads.items():
+            previous_sum, previous_count = self._previous.get(instance_id, (None, None))
+            if previous_count is None:
+                continue
+            if load['duration_count'] < previous_count:
+                # The server restarted and its counters with it
+                previous_sum, previous_count = 0.0, 0.0
+            duration_sum += load['duration_sum'] - previous_sum
+            duration_count += load['duration_count'] - previous_count
+        self._previous = {instance_id: (load['duration_sum'], load['duration_count']) for instance_id, load in loads.items()}
+        avg_duration = duration_sum / duration_count if duration_count else None
+        return demand, avg_duration, loads
+
+    def scale_in_candidates(self, instances, loads, count):
+        """
+        The instances to remove: least busy first, newest first among equals
+        Args:
+            instances (list): Fleet members, from EC2Manager.fleet_instances
+            loads (dict): Load per instance id, from observe
+            count (int): Most instances to remove
+        Returns:
+            list: Ids of reporting instances only; pending or silent ones are never picked
+        """
+        def key(instance):
+            load = loads[instance['id']]
+            return (load['in_flight'] + load['waiting'], -instance['launch_time'].timestamp())
+        reporting = [instance for instance in instances if instance['id'] in loads]
+        return [instance['id'] for instance in sorted(reporting, key=key)[:count]]
+
+    def step(self, now=None):
+        """
+        Run one observe-decide-act cycle
+        Args:
+            now (float, optional): Monotonic time, for the policy's cooldowns
+        Returns:
+            dict: current, target, reason, demand and avg_duration for this step
+        """
+        instances = self.manager.fleet_instances(self.fleet)
+        demand, avg_duration, loads = self.observe(instances)
+        current = len(instances)
+        running = sum(1 for instance in instances if instance['state'] == 'running')
+        target, reason = self.policy.decide(current, demand, avg_duration, now, complete=len(loads) == running)
+        duration = f"{avg_duration:.1f}s" if avg_duration is not None else 'n/a'
+        logger.info(f"Fleet {self.fleet}: {current} instances ({len(loads)} reporting), demand {demand:g}, "
+                    f"avg conversion {duration} -> {target} ({reason})")
+
+        prefix = 'Dry run: would have ' if self.dry_run else ''
+        if target > current:
+            logger.info(f"{prefix}launched {target - current} instances")
+            if not self.dry_run:
+                self.manager.launch_instances(target - current, tags={FLEET_TAG_KEY: self.fleet})
+        elif target < current:
+            instance_ids = self.scale_in_candidates(instances, loads, current - target)
+            if instance_ids:
+                logger.info(f"{prefix}terminated {', '.join(instance_ids)}")
+                if not self.dry_run:
+                    self.manager.terminate_instances(instance_ids)
+        return {'current': current, 'target': target, 'reason': reason, 'demand': demand,
+                'avg_duration': avg_duration}
+
+    def run(self, interval=60.0):
+        """Step every interval seconds until interrupted"""
+        while True:
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"Fleet controller step failed: {str(e)}")
+            time.sleep(interval)
+
+def simulate(policy, demand, interval=60.0, avg_duration=None):
+    """
+    Replay a demand series through a policy, with instances that boot instantly
+    Args:
+        policy (ScalingPolicy): Policy to try out
+        demand (list): Fleet demand at each step
+        interval (float): Seconds between steps, for the cooldowns
+        avg_duration (float, optional): Average conversion time at every step
+    Returns:
+        list: (seconds, demand, current, target, reason) per step
+    """
+    current = policy.min_instances
+    rows = []
+    for index, value in enumerate(demand):
+        target, reason = policy.decide(current, value, avg_duration, now=index * interval)
+        rows.append((index * interval, value, current, target, reason))
+        current = target
+    return rows
+
+def policy_from_args(args):
+    return ScalingPolicy(
+        min_instances=args.min,
+        max_instances=args.max,
+        slots_per_instance=args.slots,
+        target_utilization=args.utilization,
+        target_duration=args.target_duration,
+        scale_out_cooldown=args.scale_out_cooldown,
+        scale_in_cooldown=args.scale_in_cooldown,
+        max_step=args.max_step
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Launch the converter on EC2, or keep a fleet of it sized to load')
+    commands = parser.add_subparsers(dest='command')
+
+    policy = argparse.ArgumentParser(add_help=False)
+    policy.add_argument('--min', type=int, default=int(os.getenv('FLEET_MIN', '1')), help='Fewest instances')
+    policy.add_argument('--max', type=int, default=int(os.getenv('FLEET_MAX', '10')), help='Most instances')
+    policy.add_argument('--slots', type=int, default=int(os.getenv('FLEET_SLOTS_PER_INSTANCE', '2')),
+                        help='Conversions one instance runs at once (its ADMISSION_MAX_PER_NODE)')
+    policy.add_argument('--utilization', type=float, default=float(os.getenv('FLEET_TARGET_UTILIZATION', '0.7')),
+                        help='Share of the slots to keep busy')
+    policy.add_argument('--target-duration', type=float, default=float(os.getenv('FLEET_TARGET_DURATION', '0')) or None,
+                        help='Add an instance while the average conversion takes longer than this (seconds)')
+    policy.add_argument('--scale-out-cooldown', type=float, default=float(os.getenv('FLEET_SCALE_OUT_COOLDOWN', '300')))
+    policy.add_argument('--scale-in-cooldown', type=float, default=float(os.getenv('FLEET_SCALE_IN_COOLDOWN', '900')))
+    policy.add_argument('--max-step', type=int, default=int(os.getenv('FLEET_MAX_STEP', '4')),
+                        help='Most instances added or removed in one step')
+    policy.add_argument('--interval', type=float, default=float(os.getenv('FLEET_INTERVAL', '60')),
+                        help='Seconds between steps')
+
+    fleet = commands.add_parser('fleet', parents=[policy], help='Run the fleet controller')
+    fleet.add_argument('--fleet', default=DEFAULT_FLEET, help='Value of the Fleet tag')
+    fleet.add_argument('--metrics-url', default=DEFAULT_METRICS_URL,
+                       help='Metrics URL template; {private_ip} and {public_ip} are filled in')
+    fleet.add_argument('--dry-run', action='store_true', help='Log decisions without launching or terminating')
+    fleet.add_argument('--once', action='store_true', help='Run a single step and exit')
+
+    simulation = commands.add_parser('simulate', parents=[policy], help='Replay a demand series through the policy')
+    simulation.add_argument('demand', help='Comma-separated fleet demand, one value per step')
+    simulation.add_argument('--avg-duration', type=float, help='Average conversion time at every step (seconds)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'fleet':
+        controller = FleetController(EC2Manager(), policy_from_args(args), fleet=args.fleet,
+                                     metrics_url=args.metrics_url, dry_run=args.dry_run)
+        if args.once:
+            controller.step()
+        else:
+            try:
+                controller.run(args.interval)
+            except KeyboardInterrupt:
+                return 130
+        return 0
+
+    if args.command == 'simulate':
+        demand = [float(value) for value in args.demand.split(',') if value.strip()]
+        print(f"{'t (s)':>8} {'demand':>8} {'current':>8} {'target':>8}  reason")
+        for seconds, value, current, target, reason in simulate(policy_from_args(args), demand, args.interval,
+                                                                args.avg_duration):
+            print(f"{seconds:>8.0f} {value:>8g} {current:>8} {target:>8}  {reason}")
+        return 0
+
     # Create EC2 manager
     ec2_manager = EC2Manager()
-    
+
     try:
         # Create new instance
         instance_id, public_ip = ec2_manager.create_instance()
@@ -152,12 +568,17 @@ if __name__ == '__main__':
         EC2 Instance successfully created!
         Instance ID: {instance_id}
         Public IP: {public_ip}
-        
+
         Your application will be available at: http://{public_ip}
         Allow a few minutes for the instance to complete setup.
-        
+
         To SSH into the instance:
         ssh -i your-key-pair.pem ec2-user@{public_ip}
         """)
     except Exception as e:
-        print(f"Failed to create EC2 instance: {str(e)}") 
\ No newline at end of file
+        print(f"Failed to create EC2 instance: {str(e)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
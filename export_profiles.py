@@ -0,0 +1,169 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from collections import namedtuple
+from office_watchdog import ConversionError, run_supervised
+from metrics import PDF_OUTPUT_BYTES, PDF_COMPRESSION_RATIO, PDF_OPTIMIZE_SAVED, PDF_OPTIMIZE_FAILURES
+
+logger = logging.getLogger(__name__)
+
+PROFILE_WEB = 'web'
+PROFILE_PRINT = 'print'
+PROFILE_ARCHIVE = 'archive'
+
+# filter_data: LibreOffice writer_pdf_Export options
+# fast_path: whether the in-process renderer may produce this profile
+# optimize: run the qpdf pass (stream recompression and object streams)
+# linearize: have qpdf linearize so browsers can show page one before the rest arrives
+ExportProfile = namedtuple('ExportProfile', ['name', 'filter_data', 'fast_path', 'optimize', 'linearize'])
+
+PROFILES = {
+    PROFILE_WEB: ExportProfile(
+        PROFILE_WEB,
+        {'UseLosslessCompression': False, 'Quality': 75, 'ReduceImageResolution': True, 'MaxImageResolution': 150},
+        fast_path=True, optimize=True, linearize=True
+    ),
+    PROFILE_PRINT: ExportProfile(
+        PROFILE_PRINT,
+        {'UseLosslessCompression': False, 'Quality': 90, 'ReduceImageResolution': True, 'MaxImageResolution': 300},
+        fast_path=True, optimize=True, linearize=True
+    ),
+    # PDF/A-2b; left exactly as LibreOffice wrote it so it stays conformant
+    PROFILE_ARCHIVE: ExportProfile(
+        PROFILE_ARCHIVE,
+        {'UseLosslessCompression': True, 'ReduceImageResolution': False, 'SelectPdfVersion': 2, 'UseTaggedPDF': True},
+        fast_path=False, optimize=False, linearize=False
+    ),
+}
+
+# qpdf exit status for "succeeded with warnings"
+QPDF_WARNINGS = 3
+
+_qpdf_missing_logged = False
+
+
+class UnknownProfileError(ValueError):
+    """Raised for an export profile name that is not in PROFILES"""
+
+
+def default_profile_name():
+    return os.getenv('PDF_EXPORT_PROFILE', PROFILE_WEB)
+
+
+def get_profile(name=None):
+    """
+    Look up an export profile
+    Args:
+        name (str, optional): Profile name; PDF_EXPORT_PROFILE (default web) when empty.
+            An ExportProfile is returned as is.
+    Returns:
+        ExportProfile: The profile
+    Raises:
+        UnknownProfileError: If there is no such profile
+    """
+    if isinstance(name, ExportProfile):
+        return name
+    name = name or default_profile_name()
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise UnknownProfileError(f"Unknown export profile '{name}' (expected one of: {', '.join(PROFILES)})")
+
+
+def cache_digest(file_digest, profile):
+    """
+    Cache key for one document exported with one profile
+    Args:
+        file_digest (str): SHA-256 hex digest of the source document
+        profile (ExportProfile): The export profile
+    Returns:
+        str: Hex digest naming the PDF in the conversion cache
+    """
+    return hashlib.sha256(f"{file_digest}:{profile.name}".encode()).hexdigest()
+
+
+def export_filter(profile):
+    """
+    The --convert-to argument selecting the PDF filter and its options
+    Args:
+        profile (ExportProfile): The export profile
+    Returns:
+        str: e.g. pdf:writer_pdf_Export:{"Quality":{"type":"long","value":"75"}}
+    """
+    options = {}
+    for key, value in profile.filter_data.items():
+        if isinstance(value, bool):
+            options[key] = {'type': 'boolean', 'value': 'true' if value else 'false'}
+        else:
+            options[key] = {'type': 'long', 'value': str(value)}
+    return f"pdf:writer_pdf_Export:{json.dumps(options, separators=(',', ':'))}"
+
+
+def qpdf_binary():
+    return os.getenv('QPDF_BINARY') or shutil.which('qpdf')
+
+
+def optimize_pdf(pdf_path, profile):
+    """
+    Recompress streams and linearize a PDF in place, as the profile asks
+
+    The unoptimized PDF is kept if qpdf is missing or fails; the pass only
+    ever makes output smaller or faster to display, never breaks a conversion.
+    Args:
+        pdf_path (str): The PDF to rewrite
+        profile (ExportProfile): The export profile
+    Returns:
+        bool: True if the PDF was rewritten
+    """
+    global _qpdf_missing_logged
+
+    if not profile.optimize:
+        return False
+    qpdf = qpdf_binary()
+    if qpdf is None:
+        if not _qpdf_missing_logged:
+            logger.warning("qpdf not found; PDFs are served without linearization or recompression")
+            _qpdf_missing_logged = True
+        return False
+
+    cmd = [qpdf, '--object-streams=generate', '--compress-streams=y', '--recompress-flate']
+    if profile.linearize:
+        cmd.append('--linearize')
+    tmp_path = f"{pdf_path}.optimized"
+    cmd += [pdf_path, tmp_path]
+    try:
+        process = run_supervised(cmd, float(os.getenv('PDF_OPTIMIZE_TIMEOUT', '60')))
+        if process.returncode not in (0, QPDF_WARNINGS) or not os.path.exists(tmp_path):
+            raise ConversionError(f"qpdf failed: {process.stderr.strip()}")
+        before = os.path.getsize(pdf_path)
+        after = os.path.getsize(tmp_path)
+        os.replace(tmp_path, pdf_path)
+    except (ConversionError, OSError) as e:
+        logger.warning(f"Keeping unoptimized {pdf_path}: {str(e)}")
+        PDF_OPTIMIZE_FAILURES.labels(profile=profile.name).inc()
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    PDF_OPTIMIZE_SAVED.labels(profile=profile.name).inc(max(0, before - after))
+    logger.info(f"Optimized {pdf_path} for {profile.name}: {before} -> {after} bytes")
+    return True
+
+
+def finish_pdf(input_path, pdf_path, profile):
+    """
+    Post-process a freshly exported PDF and record its size
+    Args:
+        input_path (str): The source document
+        pdf_path (str): The exported PDF
+        profile (ExportProfile): The export profile
+    """
+    optimize_pdf(pdf_path, profile)
+    size = os.path.getsize(pdf_path)
+    PDF_OUTPUT_BYTES.labels(profile=profile.name).observe(size)
+    source_size = os.path.getsize(input_path)
+    if source_size:
+        PDF_COMPRESSION_RATIO.labels(profile=profile.name).observe(size / source_size)
@@ -0,0 +1,58 @@
+import os
+import time
+import shutil
+
+bind = '0.0.0.0:5000'
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+# Threads accept requests beyond the conversion slots, so admission control in
+# the app, not the listen backlog, decides what waits and what is shed
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Outlast the conversion watchdog so a slow job is killed by it, not by gunicorn
+timeout = int(os.getenv('GUNICORN_TIMEOUT', str(int(float(os.getenv('OFFICE_TIMEOUT_MAX', '300'))) + 30)))
+# Import the app once in the master and fork workers from it, so each worker
+# starts without paying for the imports again
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+# Workers report their time to ready from here
+os.environ.setdefault('SERVER_STARTED_AT', str(time.time()))
+
+# Metric files from a previous run would be aggregated into this one. This has
+# to happen as the config is read: a preloaded app creates its metric files
+# before on_starting. The marker keeps a config reload from wiping live files.
+if os.getenv('PROMETHEUS_MULTIPROC_DIR') and not os.getenv('PROMETHEUS_MULTIPROC_DIR_RESET'):
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    os.environ['PROMETHEUS_MULTIPROC_DIR_RESET'] = '1'
+
+
+def on_starting(server):
+    # Office processes a previous, uncleanly stopped server left running
+    from metrics import OFFICE_ORPHANS_REAPED
+    from office_watchdog import reap_orphans
+    OFFICE_ORPHANS_REAPED.inc(reap_orphans())
+
+
+def when_ready(server):
+    # Aggregated metrics for every worker, served by the master on its own port
+    from metrics import start_metrics_server
+    start_metrics_server(int(os.getenv('METRICS_PORT', '8000')))
+
+
+def post_worker_init(worker):
+    # Warm this worker's converters before it takes its first request
+    from app import readiness
+    readiness.warm_up()
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead, OFFICE_ORPHANS_REAPED
+    from office_watchdog import reap_orphans
+    from job_queue import JobStore
+    mark_process_dead(worker.pid)
+
+    # A worker killed mid-conversion (e.g. on gunicorn's timeout) leaves its office processes behind
+    OFFICE_ORPHANS_REAPED.inc(reap_orphans(worker.pid))
+
+    # Jobs in its queue will never run; fail them rather than report them queued or running forever
+    JobStore(os.getenv('JOB_DB_PATH', 'jobs.db')).fail_orphaned(worker.pid)
@@ -0,0 +1,175 @@
+import os
+import queue
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import Future
+from log_pipeline import in_context
+
+logger = logging.getLogger(__name__)
+
+_EOF = object()
+_ABORT = object()
+
+
+class UploadPipe:
+    """
+    Bounded in-memory pipe that lets S3Manager.upload_fileobj read bytes as they arrive
+
+    The writer blocks once max_chunks chunks are buffered, so a slow S3 upload
+    applies back-pressure to the request instead of growing memory.
+    """
+
+    def __init__(self, max_chunks=16):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = bytearray()
+        self._eof = False
+        self.future = Future()
+
+    def start(self, s3_manager, file_name, is_pdf=False):
+        """
+        Start streaming the pipe's contents to S3 on a dedicated thread
+        Args:
+            s3_manager (S3Manager): Manager to upload with
+            file_name (str): Name to give the file in S3
+            is_pdf (bool): Whether the file is a PDF (determines which bucket to use)
+        Returns:
+            Future: Resolves to the presigned URL once the upload completes
+        """
+        def run():
+            try:
+                self.future.set_result(s3_manager.upload_fileobj(self, file_name, is_pdf=is_pdf))
+            except Exception as e:
+                self.future.set_exception(e)
+
+        self.future.set_running_or_notify_cancel()
+        threading.Thread(target=in_context(run), name=f"s3-stream-{file_name}", daemon=True).start()
+        return self.future
+
+    def _put(self, item):
+        # Stop feeding an upload that has already given up
+        while not self.future.done():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self._put(bytes(data))
+
+    def close(self):
+        self._put(_EOF)
+
+    def abort(self):
+        self._put(_ABORT)
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = self._queue.get()
+            if chunk is _EOF:
+                self._eof = True
+            elif chunk is _ABORT:
+                raise IOError("Upload aborted by the client")
+            else:
+                self._buffer += chunk
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class IngestSink:
+    """
+    Write target for an uploaded file that handles it in a single pass
+
+    Each chunk the form parser writes is hashed, counted, written to a scratch
+    file and, when a pipe is attached, forwarded to a streaming S3 upload.
+    Once the parser seeks back to the start, reads come from the scratch file.
+    """
+
+    def __init__(self, directory, pipe=None):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._complete = False
+        self.claimed = False
+        self.size = 0
+        self.pipe = pipe
+
+    @property
+    def upload_future(self):
+        return self.pipe.future if self.pipe is not None else None
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        self._digest.update(data)
+        self._file.write(data)
+        self.size += len(data)
+        if self.pipe is not None:
+            self.pipe.write(data)
+        return len(data)
+
+    def _finish(self):
+        self._complete = True
+        self._file.flush()
+        if self.pipe is not None:
+            self.pipe.close()
+
+    def seek(self, offset, whence=0):
+        # The parser seeks to the start once the part has been fully written
+        if not self._complete:
+            self._finish()
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return not self._complete
+
+    def seekable(self):
+        return True
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def claim(self, path):
+        """
+        Move the scratch file to its final location without copying it
+        Args:
+            path (str): Destination path
+        """
+        if not self._complete:
+            self._finish()
+        self._file.close()
+        os.replace(self.path, path)
+        self.path = path
+        self.claimed = True
+
+    def discard(self):
+        """Abort any streaming upload and remove the scratch file"""
+        if self.pipe is not None and not self._complete:
+            self.pipe.abort()
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,223 @@
+import os
+import time
+import uuid
+import queue
+import sqlite3
+import logging
+import threading
+from metrics import QUEUE_DEPTH
+from scheduler import FairScheduler
+from log_pipeline import in_context
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Finished jobs are pruned at most this often, from whichever process is creating jobs
+PRUNE_INTERVAL = 60
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class JobStore:
+    """
+    Job state in a local SQLite database so every gunicorn worker on the node sees it
+
+    Each job records the pid of the worker whose in-process queue holds it.
+    Finished jobs are deleted ttl seconds after they finish.
+    """
+
+    def __init__(self, db_path, ttl=24 * 3600):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._pruned_at = 0.0
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                '''CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    download_url TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner_pid INTEGER
+                )'''
+            )
+            # Databases created before jobs had owners
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'owner_pid' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner_pid INTEGER')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at)')
+
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and forks
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def create(self, filename):
+        """
+        Record a new queued job
+        Args:
+            filename (str): Name of the uploaded document
+        Returns:
+            str: The new job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, filename, created_at, updated_at, owner_pid) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, JOB_QUEUED, filename, now, now, os.getpid())
+            )
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            self._pruned_at = now
+            self.prune()
+        return job_id
+
+    def update(self, job_id, status, download_url=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, download_url = ?, error = ?, updated_at = ? WHERE id = ?',
+                (status, download_url, error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        """
+        Look up a job
+        Args:
+            job_id (str): The job id
+        Returns:
+            dict: The job's fields, or None if it does not exist
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def prune(self):
+        """
+        Delete jobs that finished more than ttl seconds ago
+        Returns:
+            int: Number of jobs deleted
+        """
+        with self._connect() as conn:
+            deleted = conn.execute(
+                'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                (JOB_DONE, JOB_FAILED, time.time() - self.ttl)
+            ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} finished jobs")
+        return deleted
+
+    def fail_orphaned(self, owner_pid=None):
+        """
+        Fail unfinished jobs whose worker no longer exists; their queue died with it
+        Args:
+            owner_pid (int, optional): Also fail this worker's jobs even if the pid is live,
+                e.g. a worker that just exited or a process that has only just started
+        Returns:
+            int: Number of jobs failed
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, owner_pid FROM jobs WHERE status IN (?, ?)', (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+            orphaned = [job_id for job_id, pid in rows if pid is None or pid == owner_pid or not _is_alive(pid)]
+            # Only jobs still unfinished; one may have completed since the SELECT
+            conn.executemany(
+                'UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)',
+                [(JOB_FAILED, "Conversion was interrupted, please retry", time.time(), job_id, JOB_QUEUED, JOB_RUNNING)
+                 for job_id in orphaned]
+            )
+        if orphaned:
+            logger.warning(f"Failed {len(orphaned)} jobs left behind by workers that exited")
+        return len(orphaned)
+
+
+class JobQueue:
+    """
+    Bounded in-process queue drained by a pool of conversion worker threads
+
+    Jobs are started in scheduler order (cheap documents and light clients
+    first, see FairScheduler) rather than arrival order. Worker threads are
+    started lazily in the process that first submits work, so the queue is
+    safe to create before gunicorn forks.
+    """
+
+    def __init__(self, store, handler, workers=2, max_pending=32, scheduler=None):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._queue = scheduler or FairScheduler()
+        self._queue.max_pending = max_pending
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"conversion-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def full(self):
+        return self._queue.full()
+
+    def submit(self, job_id, *args, cost=1.0, client=None):
+        """
+        Queue a job for the worker pool
+        Args:
+            job_id (str): Id of a job already recorded in the store
+            *args: Arguments passed to the handler after the job id
+            cost (float): Estimated conversion time, for scheduling
+            client (str, optional): Client the job counts against for fair share
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        self._ensure_workers()
+        QUEUE_DEPTH.inc()
+        try:
+            # The job runs, and logs, under the ID of the request that queued it
+            self._queue.add((job_id, args, in_context(self._run)), cost, client)
+        except queue.Full:
+            QUEUE_DEPTH.dec()
+            raise QueueFullError("Conversion queue is full")
+
+    def _work(self):
+        while True:
+            job_id, args, run = self._queue.get().item
+            QUEUE_DEPTH.dec()
+            run(job_id, args)
+
+    def _run(self, job_id, args):
+        try:
+            self.store.update(job_id, JOB_RUNNING)
+            download_url = self.handler(job_id, *args)
+            self.store.update(job_id, JOB_DONE, download_url=download_url)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.store.update(job_id, JOB_FAILED, error="Conversion failed")
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
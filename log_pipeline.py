@@ -0,0 +1,200 @@
+import os
+import sys
+import copy
+import json
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+from functools import wraps
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from metrics import LOG_RECORDS_DROPPED
+from sampling_profiler import busy
+
+# ID of the request being served; every record logged under it carries it
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Attributes passed with extra= that are copied into the JSON records
+EXTRA_FIELDS = ('stage', 'duration_ms')
+
+# Formats tracebacks on the calling thread, while the frames they refer to still exist
+_traceback_formatter = logging.Formatter()
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def in_context(fn):
+    """
+    Wrap a callable so it runs with the caller's request ID on whatever thread calls it
+
+    The thread counts as busy for the sampling profiler while it runs.
+    Args:
+        fn (callable): Function to hand to an executor or thread
+    Returns:
+        callable: The wrapped function; safe to call from several threads at once
+    """
+    context = contextvars.copy_context()
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        with busy():
+            return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request ID and any EXTRA_FIELDS"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'pid': record.process,
+            'thread': record.threadName
+        }
+        for field in EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Size-rotated log file appended to by every worker on the node
+
+    Rotation is decided from the file's size on disk and done under an flock,
+    so exactly one worker rotates and the others follow it to the new file.
+    """
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        if current is None or current.st_ino != os.fstat(self.stream.fileno()).st_ino:
+            # Another worker rotated the file away from under us
+            self.stream.close()
+            self.stream = self._open()
+            current = os.fstat(self.stream.fileno())
+        return self.maxBytes > 0 and current.st_size >= self.maxBytes
+
+    def doRollover(self):
+        with open(f"{self.baseFilename}.lock", 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                size = os.stat(self.baseFilename).st_size
+            except FileNotFoundError:
+                size = 0
+            if size >= self.maxBytes:
+                super().doRollover()
+            elif self.stream is not None:
+                # Rotated by another worker while we waited for the lock
+                self.stream.close()
+                self.stream = self._open()
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a writer thread instead of doing I/O on the caller's thread
+
+    The writer thread is started lazily in each process, so the handler is safe
+    to install before gunicorn forks. When the queue is full records are
+    dropped and counted rather than making the caller wait for the disk.
+    """
+
+    def __init__(self, build_handlers, queue_size):
+        super().__init__(None)
+        self.build_handlers = build_handlers
+        self.queue_size = queue_size
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Whatever the parent had queued was already written by the parent
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self._listener = logging.handlers.QueueListener(self.queue, *self.build_handlers(),
+                                                            respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self._listener.stop)
+
+    def prepare(self, record):
+        # Resolve everything tied to the calling thread before the record leaves it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._ensure_listener()
+        super().emit(record)
+
+
+def _build_handlers():
+    formatter = JsonFormatter()
+    handlers = []
+    log_file = os.getenv('LOG_FILE', 'app.log')
+    if log_file:
+        file_handler = SharedRotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv('LOG_MAX_BYTES', str(50 * 1024 * 1024))),
+            backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5'))
+        )
+        handlers.append(file_handler)
+    if os.getenv('LOG_STDERR', '1') == '1':
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(level=None):
+    """
+    Route the root logger through the queue to the JSON file and stderr writers
+    Args:
+        level (str, optional): Root log level; LOG_LEVEL (default INFO) when None
+    """
+    root = logging.getLogger()
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO').upper())
+    if any(isinstance(handler, AsyncQueueHandler) for handler in root.handlers):
+        return
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(AsyncQueueHandler(_build_handlers, int(os.getenv('LOG_QUEUE_SIZE', '10000'))))
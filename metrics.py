@@ -0,0 +1,106 @@
+import os
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, multiprocess, start_http_server
+)
+
+# Under gunicorn each worker keeps its own metric values. Setting
+# PROMETHEUS_MULTIPROC_DIR (before prometheus_client is imported) makes every
+# worker write to shared files that /metrics aggregates.
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# Stage latencies range from milliseconds (presign) to minutes (large conversions)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Initialize Prometheus metrics
+CONVERSION_REQUEST_COUNT = Counter('pdf_conversion_requests_total', 'Total number of PDF conversion requests')
+CONVERSION_SUCCESS_COUNT = Counter('pdf_conversion_success_total', 'Total number of successful PDF conversions')
+CONVERSION_FAILURE_COUNT = Counter('pdf_conversion_failure_total', 'Total number of failed PDF conversions')
+CONVERSION_FAILURE_REASONS = Counter('pdf_conversion_failure_reasons_total',
+                                     'Failed office conversions by reason (timeout, cpu_limit, killed, error)', ['reason'])
+OFFICE_ORPHANS_REAPED = Counter('office_orphans_reaped_total', 'Orphaned office processes killed')
+CONVERSION_PATH_COUNT = Counter('pdf_conversion_path_total', 'Conversions by converter path (fast, office, docx2pdf)', ['path'])
+CONVERSION_PATH_DURATION = Histogram('pdf_conversion_path_duration_seconds', 'Time spent converting, by converter path',
+                                     ['path'], buckets=STAGE_BUCKETS)
+FAST_PATH_REJECTED = Counter('pdf_fast_path_rejected_total',
+                             'Documents sent to the office suite, by the first unsupported feature found', ['feature'])
+CONVERSION_DURATION = Histogram('pdf_conversion_duration_seconds', 'Time spent processing PDF conversion', buckets=STAGE_BUCKETS)
+FILE_SIZE = Histogram('uploaded_file_size_bytes', 'Size of uploaded files', buckets=[1024*1024, 2*1024*1024, 5*1024*1024, 10*1024*1024])
+S3_UPLOAD_SUCCESS = Counter('s3_upload_success_total', 'Successful S3 uploads')
+S3_UPLOAD_FAILURE = Counter('s3_upload_failure_total', 'Failed S3 uploads')
+CACHE_HIT_COUNT = Counter('pdf_conversion_cache_hits_total', 'Conversions served from the PDF cache', ['tier'])
+CACHE_MISS_COUNT = Counter('pdf_conversion_cache_misses_total', 'Conversions not found in the PDF cache')
+CACHE_EVICTION_COUNT = Counter('pdf_conversion_cache_evictions_total', 'PDFs evicted from the local cache tier')
+STAGE_DURATION = Histogram('pdf_conversion_stage_duration_seconds', 'Time spent in each stage of a conversion',
+                           ['stage'], buckets=STAGE_BUCKETS)
+WORKSPACE_CREATED = Counter('conversion_workspaces_created_total', 'Per-request scratch workspaces created', ['medium'])
+CONVERTED_EVICTION_COUNT = Counter('converted_pdf_evictions_total', 'Local PDFs evicted from converted/ because they are in S3')
+CONVERTED_EVICTED_BYTES = Counter('converted_pdf_evicted_bytes_total', 'Bytes freed by evicting local PDFs from converted/')
+DISK_USAGE_BYTES = Gauge('converter_disk_usage_bytes', 'Local bytes used, by area (converted, cache, chunked, scratch_disk, scratch_tmpfs)',
+                         ['area'], multiprocess_mode='livemax')
+CHUNKED_UPLOAD_COUNT = Counter('chunked_uploads_total', 'Chunked upload sessions by outcome (started, completed, aborted, expired)',
+                               ['outcome'])
+CHUNKED_UPLOAD_CHUNKS = Counter('chunked_upload_chunks_total', 'Chunks received, by result (stored, duplicate, rejected, corrupt)',
+                                ['result'])
+DISK_BUDGET_BYTES = Gauge('converter_disk_budget_bytes', 'Configured byte budget, by area', ['area'], multiprocess_mode='livemax')
+ADMISSION_ADMITTED = Counter('admission_admitted_total', 'Requests admitted to convert', ['endpoint'])
+ADMISSION_SHED = Counter('admission_shed_total', 'Requests refused by admission control, by reason '
+                         '(too_large, client_limit, queue_full, wait_timeout)', ['endpoint', 'reason'])
+ADMISSION_QUEUED = Counter('admission_queued_total', 'Requests that had to wait for a conversion slot', ['endpoint'])
+ADMISSION_WAITING = Gauge('admission_waiting', 'Requests currently waiting for a conversion slot', multiprocess_mode='livesum')
+QUEUE_WAIT = Histogram('pdf_conversion_queue_wait_seconds', 'Time conversions waited to start, by priority class '
+                       '(small, medium, large estimated cost)', ['priority_class'], buckets=STAGE_BUCKETS)
+BREAKER_STATE = Gauge('circuit_breaker_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', ['breaker'],
+                      multiprocess_mode='livemax')
+BREAKER_TRANSITIONS = Counter('circuit_breaker_transitions_total', 'Circuit breaker state changes, by new state',
+                              ['breaker', 'state'])
+BREAKER_REJECTED = Counter('circuit_breaker_rejected_total', 'Calls failed fast by an open circuit breaker', ['breaker'])
+OUTBOX_DEPTH = Gauge('s3_outbox_depth', 'Files waiting in the durable S3 outbox', multiprocess_mode='livemax')
+OUTBOX_ENQUEUED = Counter('s3_outbox_enqueued_total', 'Files queued in the S3 outbox after a failed upload', ['kind'])
+OUTBOX_DELIVERED = Counter('s3_outbox_delivered_total', 'Files uploaded from the S3 outbox', ['kind'])
+OUTBOX_FAILURES = Counter('s3_outbox_failures_total', 'Failed attempts to upload a file from the S3 outbox', ['kind'])
+OUTBOX_DEAD_LETTERED = Counter('s3_outbox_dead_lettered_total', 'S3 outbox files given up on after too many failed uploads',
+                               ['kind'])
+OUTBOX_DEAD_LETTER_DEPTH = Gauge('s3_outbox_dead_letter_depth', 'Files in the S3 outbox dead-letter directory',
+                                 multiprocess_mode='livemax')
+PDF_OUTPUT_BYTES = Histogram('pdf_output_size_bytes', 'Size of converted PDFs, by export profile (web, print, archive)', ['profile'],
+                             buckets=(64*1024, 256*1024, 1024*1024, 4*1024*1024, 16*1024*1024, 64*1024*1024))
+PDF_COMPRESSION_RATIO = Histogram('pdf_compression_ratio', 'Converted PDF size divided by source document size, by export profile',
+                                  ['profile'], buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 4, 8))
+PDF_OPTIMIZE_SAVED = Counter('pdf_optimize_saved_bytes_total', 'Bytes removed from PDFs by the qpdf optimization pass', ['profile'])
+PDF_OPTIMIZE_FAILURES = Counter('pdf_optimize_failures_total', 'PDFs served unoptimized because the qpdf pass failed', ['profile'])
+TIME_TO_READY = Gauge('converter_time_to_ready_seconds', 'Seconds from server start until a worker finished warming up',
+                      multiprocess_mode='livemax')
+WARMUP_DURATION = Gauge('converter_warmup_duration_seconds', 'Seconds a worker spent warming up its converters',
+                        multiprocess_mode='livemax')
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records discarded because the log writer queue was full')
+IN_FLIGHT = Gauge('pdf_conversion_in_flight', 'Conversions currently being processed', multiprocess_mode='livesum')
+QUEUE_DEPTH = Gauge('pdf_conversion_queue_depth', 'Conversion jobs waiting for a worker', multiprocess_mode='livesum')
+
+
+def build_registry():
+    """
+    Registry to expose: the aggregate of all workers in multiprocess mode,
+    otherwise this process's default registry
+    Returns:
+        CollectorRegistry: Registry to collect from
+    """
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def latest_metrics():
+    return generate_latest(build_registry())
+
+
+def start_metrics_server(port):
+    """Serve the (aggregated) metrics on a separate port"""
+    start_http_server(port, registry=build_registry())
+
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges; call from gunicorn's child_exit hook"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import atexit
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from office_watchdog import (
+    ConversionError, ConversionKilledError, run_supervised, memory_limit, owner_env, limited, kill_process_group
+)
+
+logger = logging.getLogger(__name__)
+
+# Python interpreter that ships the LibreOffice UNO bindings (python3-uno)
+DEFAULT_UNO_PYTHON = '/usr/bin/python3'
+
+
+class OfficePoolError(Exception):
+    """Raised when the pool cannot complete a conversion"""
+
+
+class OfficeInstance:
+    """
+    A long-lived headless LibreOffice process with its own profile and listener
+    """
+
+    def __init__(self, index, soffice_bin, profile_root, uno_python, start_timeout):
+        self.index = index
+        self.soffice_bin = soffice_bin
+        self.uno_python = uno_python
+        self.start_timeout = start_timeout
+        self.pipe_name = f"wordtopdf_{os.getpid()}_{index}"
+        self.profile_dir = Path(profile_root) / f"profile-{os.getpid()}-{index}"
+        self.process = None
+        self.jobs = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the office process listening on a private UNO pipe"""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            self.soffice_bin,
+            '--headless',
+            '--invisible',
+            '--nologo',
+            '--norestore',
+            '--nodefault',
+            '--nolockcheck',
+            f"-env:UserInstallation={self.profile_dir.absolute().as_uri()}",
+            f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+        ]
+        # A long-lived instance gets the memory cap only: a CPU rlimit would
+        # count every job it ever ran, so per-job limits are the timeout's job
+        self.process = subprocess.Popen(
+            limited(cmd, memory_bytes=memory_limit()),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            env=owner_env()
+        )
+        self.jobs = 0
+        logger.info(f"Started office instance {self.index} (pid {self.process.pid})")
+
+    def stop(self):
+        """Terminate the office process, killing it if it does not exit"""
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                kill_process_group(self.process)
+                self.process.wait()
+        # Helpers the office forked may outlive it
+        kill_process_group(self.process)
+        logger.info(f"Stopped office instance {self.index} after {self.jobs} jobs")
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def convert(self, input_path, output_path, timeout=None, filter_data=None, thumbnail=None):
+        """
+        Convert a document through this instance's UNO listener
+        Args:
+            input_path (str): Path to the input Word document
+            output_path (str): Path for the output PDF file
+            timeout (float, optional): Seconds to wait for the conversion
+            filter_data (dict, optional): writer_pdf_Export options, e.g. {'Quality': 75}
+            thumbnail (tuple, optional): (path, width in pixels) of a first-page
+                PNG exported from the same loaded document
+        Returns:
+            dict: What the office reported about the document: pages (int or None)
+        Raises:
+            OfficePoolError: If the instance could not convert the document
+            ConversionError: If the conversion timed out or the office was killed
+        """
+        if not self.is_alive():
+            self.start()
+
+        cmd = [
+            self.uno_python,
+            os.path.abspath(__file__),
+            '--convert',
+            self.pipe_name,
+            str(Path(input_path).absolute()),
+            str(Path(output_path).absolute()),
+            str(self.start_timeout),
+            json.dumps(filter_data or {}),
+        ]
+        if thumbnail is not None:
+            cmd.append(json.dumps({'path': str(Path(thumbnail[0]).absolute()), 'width': thumbnail[1]}))
+        process = run_supervised(cmd, timeout, label='office-pool')
+
+        self.jobs += 1
+        if process.returncode != 0:
+            if self.process.poll() is not None and self.process.returncode < 0:
+                signum = -self.process.returncode
+                raise ConversionKilledError(
+                    f"Office instance {self.index} was killed by signal {signum}", signum=signum)
+            raise OfficePoolError(f"Office instance {self.index} failed: {process.stderr.strip()}")
+        if not os.path.exists(output_path):
+            raise OfficePoolError(f"Office instance {self.index} produced no output for {input_path}")
+        try:
+            return json.loads(process.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            return {'pages': None}
+
+
+class OfficePool:
+    """
+    Pool of warm headless LibreOffice instances
+
+    Conversions are dispatched to idle instances. An instance is recycled after
+    max_jobs conversions, or immediately if it crashes or a conversion fails.
+    """
+
+    def __init__(self, size, max_jobs=200, soffice_bin=None, profile_root=None,
+                 uno_python=None, start_timeout=30, acquire_timeout=60):
+        if size < 1:
+            raise ValueError("Office pool size must be at least 1")
+
+        self.size = size
+        self.max_jobs = max_jobs
+        self.acquire_timeout = acquire_timeout
+        self.soffice_bin = soffice_bin or shutil.which('soffice') or 'libreoffice'
+        self.uno_python = uno_python or DEFAULT_UNO_PYTHON
+        self._owns_profile_root = profile_root is None
+        self.profile_root = profile_root or tempfile.mkdtemp(prefix='word-to-pdf-office-')
+        self._idle = queue.Queue()
+        self._instances = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for index in range(size):
+            instance = OfficeInstance(index, self.soffice_bin, self.profile_root,
+                                      self.uno_python, start_timeout)
+            self._instances.append(instance)
+            self._idle.put(instance)
+
+    def start(self):
+        """Warm every instance up front instead of on first use"""
+        for instance in self._instances:
+            if not instance.is_alive():
+                instance.start()
+
+    def convert(self, input_path, output_path, timeout=None, filter_data=None, thumbnail=None):
+        """
+        Convert a document on the next idle instance
+        Args:
+            input_path (str): Path to the input Word document
+            output_path (str): Path for the output PDF file
+            timeout (float, optional): Seconds to wait for the conversion
+            filter_data (dict, optional): writer_pdf_Export options
+            thumbnail (tuple, optional): (path, width in pixels) of a first-page PNG
+        Returns:
+            dict: What the office reported about the document: pages (int or None)
+        """
+        if self._closed:
+            raise OfficePoolError("Office pool is closed")
+
+        try:
+            instance = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise OfficePoolError("No idle office instance available")
+
+        try:
+            outputs = instance.convert(input_path, output_path, timeout=timeout, filter_data=filter_data,
+                                       thumbnail=thumbnail)
+            if instance.jobs >= self.max_jobs:
+                logger.info(f"Recycling office instance {instance.index} after {instance.jobs} jobs")
+                instance.restart()
+            return outputs
+        except (OfficePoolError, ConversionError):
+            # A failed, timed-out or crashed instance may be wedged; start it fresh
+            logger.warning(f"Restarting office instance {instance.index} after failure")
+            try:
+                instance.restart()
+            except OSError:
+                instance.stop()
+            raise
+        except OSError as e:
+            # The office binary or UNO interpreter is missing or not runnable
+            instance.stop()
+            raise OfficePoolError(f"Office instance {instance.index} could not run: {str(e)}")
+        finally:
+            self._idle.put(instance)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for instance in self._instances:
+            instance.stop()
+        if self._owns_profile_root:
+            shutil.rmtree(self.profile_root, ignore_errors=True)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_office_pool():
+    """
+    Return this process's office pool, creating it on first use
+    Returns:
+        OfficePool: The pool, or None if OFFICE_POOL_SIZE is 0
+    """
+    global _pool, _pool_pid
+
+    size = int(os.getenv('OFFICE_POOL_SIZE', '0'))
+    if size <= 0:
+        return None
+
+    with _pool_lock:
+        # Pools are per process; never reuse one inherited across fork
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = OfficePool(
+                size,
+                max_jobs=int(os.getenv('OFFICE_POOL_MAX_JOBS', '200')),
+                soffice_bin=os.getenv('OFFICE_BINARY'),
+                profile_root=os.getenv('OFFICE_PROFILE_ROOT'),
+                uno_python=os.getenv('OFFICE_UNO_PYTHON'),
+                start_timeout=float(os.getenv('OFFICE_START_TIMEOUT', '30')),
+            )
+            _pool_pid = os.getpid()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def _uno_convert(pipe_name, input_path, output_path, start_timeout, filter_data, thumbnail=None):
+    """
+    Run inside the UNO-enabled interpreter: convert via a running office
+
+    The PDF, the optional first-page PNG and the page count all come from one
+    load of the document. The page count is printed to stdout as JSON.
+    """
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+
+    def prop(name, value):
+        p = PropertyValue()
+        p.Name = name
+        p.Value = value
+        return p
+
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext(
+        'com.sun.star.bridge.UnoUrlResolver', local_context)
+
+    # The office may still be starting; keep retrying until it listens
+    deadline = time.monotonic() + start_timeout
+    while True:
+        try:
+            context = resolver.resolve(f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+            break
+        except NoConnectException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+    desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(input_path), '_blank', 0, (prop('Hidden', True),))
+    try:
+        properties = (prop('FilterName', 'writer_pdf_Export'),)
+        if filter_data:
+            options = tuple(prop(name, value) for name, value in filter_data.items())
+            properties += (prop('FilterData', uno.Any('[]com.sun.star.beans.PropertyValue', options)),)
+        # uno.invoke keeps the typed Any that a plain method call would unwrap
+        uno.invoke(document, 'storeToURL', (uno.systemPathToFileUrl(output_path), properties))
+
+        # Exporting laid the document out, so the page count is now exact
+        try:
+            pages = document.getCurrentController().PageCount
+        except Exception:
+            pages = None
+
+        if thumbnail:
+            # Size the PNG to the first page's proportions (page styles are in 1/100 mm)
+            cursor = document.getText().createTextCursor()
+            page_style = document.getStyleFamilies().getByName('PageStyles').getByName(cursor.PageStyleName)
+            width = int(thumbnail['width'])
+            height = max(1, round(width * page_style.Height / page_style.Width))
+            options = (prop('PixelWidth', width), prop('PixelHeight', height))
+            properties = (prop('FilterName', 'writer_png_Export'),
+                          prop('FilterData', uno.Any('[]com.sun.star.beans.PropertyValue', options)))
+            uno.invoke(document, 'storeToURL', (uno.systemPathToFileUrl(thumbnail['path']), properties))
+    finally:
+        document.close(True)
+    print(json.dumps({'pages': pages}))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) in (6, 7, 8) and sys.argv[1] == '--convert':
+        _uno_convert(sys.argv[2], sys.argv[3], sys.argv[4], float(sys.argv[5]),
+                     json.loads(sys.argv[6]) if len(sys.argv) >= 7 else {},
+                     json.loads(sys.argv[7]) if len(sys.argv) == 8 else None)
+    else:
+        print(f"Usage: {sys.argv[0]} --convert PIPE_NAME INPUT OUTPUT START_TIMEOUT [FILTER_DATA_JSON [THUMBNAIL_JSON]]",
+              file=sys.stderr)
+        sys.exit(2)
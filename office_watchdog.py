@@ -0,0 +1,212 @@
+import os
+import shutil
+import signal
+import logging
+import subprocess
+from sampling_profiler import child_process
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Every office process we start carries this variable, naming the worker that
+# owns it, so processes left behind by a dead worker can be found and killed.
+OWNER_ENV = 'WORDTOPDF_OFFICE_OWNER'
+
+# util-linux prlimit sets rlimits on itself and then execs the command; it is
+# missing outside Linux, where office processes run without rlimits
+PRLIMIT = shutil.which('prlimit')
+
+# Failure reasons reported on pdf_conversion_failure_reasons_total
+REASON_TIMEOUT = 'timeout'
+REASON_CPU_LIMIT = 'cpu_limit'
+REASON_KILLED = 'killed'
+REASON_ERROR = 'error'
+
+
+class ConversionError(Exception):
+    """A supervised office process failed; reason classifies the failure"""
+    reason = REASON_ERROR
+
+
+class ConversionTimeoutError(ConversionError):
+    """The office process exceeded its wall-clock budget and was killed"""
+    reason = REASON_TIMEOUT
+
+
+class ConversionKilledError(ConversionError):
+    """The office process was terminated by a signal (rlimit, OOM killer, crash)"""
+    reason = REASON_KILLED
+
+    def __init__(self, message, signum=None):
+        super().__init__(message)
+        self.signum = signum
+        if signum == getattr(signal, 'SIGXCPU', None):
+            self.reason = REASON_CPU_LIMIT
+
+
+def failure_reason(error):
+    return getattr(error, 'reason', REASON_ERROR)
+
+
+def job_timeout(file_size):
+    """
+    Wall-clock budget for converting one document, scaled by its size
+    Args:
+        file_size (int): Size of the input document in bytes
+    Returns:
+        float: Timeout in seconds
+    """
+    base = float(os.getenv('OFFICE_TIMEOUT_BASE', '30'))
+    per_mb = float(os.getenv('OFFICE_TIMEOUT_PER_MB', '10'))
+    ceiling = float(os.getenv('OFFICE_TIMEOUT_MAX', '300'))
+    return min(ceiling, base + per_mb * file_size / MB)
+
+
+def cpu_limit_for(timeout):
+    """CPU seconds allowed for a one-shot conversion with the given wall-clock timeout"""
+    return int(timeout) + 1
+
+
+def memory_limit():
+    """
+    Address-space cap for office processes
+    Returns:
+        int: Bytes, or None when OFFICE_MEMORY_LIMIT_MB is 0
+    """
+    limit_mb = int(os.getenv('OFFICE_MEMORY_LIMIT_MB', '3072'))
+    return limit_mb * MB if limit_mb > 0 else None
+
+
+def owner_env():
+    """Environment for an office process owned by this worker"""
+    return dict(os.environ, **{OWNER_ENV: str(os.getpid())})
+
+
+def limited(cmd, cpu_seconds=None, memory_bytes=None):
+    """
+    Wrap a command in prlimit so its rlimits are in place before it execs
+
+    A preexec_fn would do the same from Python between fork and exec, which
+    is not safe in a process running threads, as every worker here is.
+    Args:
+        cmd (list): Command to run
+        cpu_seconds (int, optional): RLIMIT_CPU; SIGXCPU at the soft limit, SIGKILL a little later
+        memory_bytes (int, optional): RLIMIT_AS
+    Returns:
+        list: The command to run; unchanged if there is nothing to apply or no prlimit
+    """
+    limits = []
+    if cpu_seconds is not None:
+        limits.append(f"--cpu={cpu_seconds}:{cpu_seconds + 5}")
+    if memory_bytes is not None:
+        limits.append(f"--as={memory_bytes}:{memory_bytes}")
+    if not limits or PRLIMIT is None:
+        return list(cmd)
+    return [PRLIMIT] + limits + ['--'] + list(cmd)
+
+
+def kill_process_group(process):
+    """SIGKILL everything in the process's session, including forked helpers"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_supervised(cmd, timeout, cpu_seconds=None, memory_bytes=None, label=None):
+    """
+    Run a command in its own process group under a wall-clock timeout and rlimits
+    Args:
+        cmd (list): Command to run
+        timeout (float): Seconds before the whole process group is killed
+        cpu_seconds (int, optional): CPU time limit
+        memory_bytes (int, optional): Address-space limit
+        label (str, optional): Name of the child in profiles; the program name when None
+    Returns:
+        subprocess.CompletedProcess: The finished process
+    Raises:
+        ConversionTimeoutError: If the timeout expired
+        ConversionKilledError: If the process died from a signal
+    """
+    with child_process(label or os.path.basename(cmd[0])):
+        process = subprocess.Popen(
+            limited(cmd, cpu_seconds, memory_bytes),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            start_new_session=True,
+            env=owner_env()
+        )
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process)
+            process.communicate()
+            logger.error(f"Killed {cmd[0]} (pid {process.pid}) after {timeout:.0f}s timeout")
+            raise ConversionTimeoutError(f"{cmd[0]} timed out after {timeout:.0f}s")
+        finally:
+            # The leader may exit while a forked helper keeps running
+            kill_process_group(process)
+
+    if process.returncode < 0:
+        signum = -process.returncode
+        logger.error(f"{cmd[0]} (pid {process.pid}) was killed by signal {signum}")
+        raise ConversionKilledError(f"{cmd[0]} was killed by signal {signum}", signum=signum)
+
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _process_owner(pid):
+    try:
+        with open(f"/proc/{pid}/environ", 'rb') as f:
+            environ = f.read().split(b'\0')
+    except OSError:
+        return None
+    prefix = f"{OWNER_ENV}=".encode()
+    for entry in environ:
+        if entry.startswith(prefix):
+            try:
+                return int(entry[len(prefix):])
+            except ValueError:
+                return None
+    return None
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def reap_orphans(owner_pid=None):
+    """
+    Kill office processes left behind by workers that no longer exist
+    Args:
+        owner_pid (int, optional): Reap this worker's processes even if the pid is live
+    Returns:
+        int: Number of processes killed
+    """
+    if not os.path.isdir('/proc'):
+        return 0
+
+    killed = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        owner = _process_owner(entry)
+        if owner is None:
+            continue
+        if owner == owner_pid or (owner_pid is None and not _is_alive(owner)):
+            try:
+                os.kill(int(entry), signal.SIGKILL)
+                killed += 1
+            except (ProcessLookupError, PermissionError):
+                continue
+    if killed:
+        logger.warning(f"Reaped {killed} orphaned office processes")
+    return killed
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import uuid
+import errno
+import shutil
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from circuit_breaker import CircuitOpenError
+from s3_manager import is_outage
+from metrics import (
+    OUTBOX_DEPTH, OUTBOX_ENQUEUED, OUTBOX_DELIVERED, OUTBOX_FAILURES, OUTBOX_DEAD_LETTERED, OUTBOX_DEAD_LETTER_DEPTH
+)
+
+logger = logging.getLogger(__name__)
+
+ENTRY_SUFFIX = '.json'
+DATA_SUFFIX = '.data'
+
+# Data files whose entry never got written (a crash mid-add) are removed after this long
+ORPHAN_DATA_AGE = 3600
+
+# Subdirectory holding entries that failed max_attempts times; they are kept for inspection, not retried
+DEAD_LETTER_DIR = 'dead-letter'
+
+
+class Outbox:
+    """
+    Durable queue of files that still have to reach S3
+
+    Each entry is a copy (or hard link) of the file plus a JSON record of where
+    it goes. The record is written last, so a half-added entry is never
+    uploaded. A background thread, one per node, drains the outbox oldest
+    first whenever the S3 circuit lets calls through. Handlers registered
+    with on_delivered() run after an entry of their kind is uploaded.
+
+    An entry whose upload fails for any reason other than an S3 outage is
+    retried with exponential backoff, doubling from drain_interval up to
+    max_backoff seconds. After max_attempts failures it is moved to the
+    dead-letter directory, so one bad file cannot keep failing forever.
+    """
+
+    def __init__(self, directory, s3_manager, drain_interval=30, max_attempts=10, max_backoff=3600):
+        self.directory = directory
+        self.dead_letter_directory = os.path.join(directory, DEAD_LETTER_DIR)
+        self.s3_manager = s3_manager
+        self.drain_interval = drain_interval
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._handlers = {}
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(self.dead_letter_directory, exist_ok=True)
+        OUTBOX_DEAD_LETTER_DEPTH.set(self.dead_letter_depth())
+
+    def on_delivered(self, kind, handler):
+        """Call handler(meta) after an entry of this kind has been uploaded"""
+        self._handlers[kind] = handler
+
+    def add(self, source_path, key, is_pdf=False, kind='file', meta=None, metadata=None, content_type=None):
+        """
+        Queue a file for upload
+        Args:
+            source_path (str): File to upload; the outbox keeps its own copy
+            key (str): Name to give the file in S3
+            is_pdf (bool): Whether the file goes to the PDF bucket
+            kind (str): Entry type, selecting the on_delivered handler
+            meta (dict, optional): JSON-serializable data passed to the handler
+            metadata (dict, optional): S3 user metadata to store with the object
+            content_type (str, optional): Content-Type to store with the object
+        Returns:
+            str: The entry id
+        """
+        entry_id = f"{time.time():017.6f}-{uuid.uuid4().hex[:8]}"
+        data_path = os.path.join(self.directory, entry_id + DATA_SUFFIX)
+        try:
+            os.link(source_path, data_path)
+        except OSError:
+            shutil.copyfile(source_path, data_path)
+
+        entry = {'key': key, 'is_pdf': is_pdf, 'kind': kind, 'meta': meta or {}, 'attempts': 0,
+                 'metadata': metadata, 'content_type': content_type}
+        self._write_entry(entry_id, entry)
+        OUTBOX_ENQUEUED.labels(kind=kind).inc()
+        OUTBOX_DEPTH.set(self.depth())
+        logger.info(f"Queued {key} in the S3 outbox")
+        self.start()
+        return entry_id
+
+    def _write_entry(self, entry_id, entry, directory=None):
+        path = os.path.join(directory or self.directory, entry_id + ENTRY_SUFFIX)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _entry_ids(self):
+        return sorted(name[:-len(ENTRY_SUFFIX)] for name in os.listdir(self.directory) if name.endswith(ENTRY_SUFFIX))
+
+    def depth(self):
+        return len(self._entry_ids())
+
+    def dead_letter_depth(self):
+        return sum(1 for name in os.listdir(self.dead_letter_directory) if name.endswith(ENTRY_SUFFIX))
+
+    def start(self):
+        """Start the background drainer in this process, once"""
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='s3-outbox', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.drain_if_leader()
+            except Exception as e:
+                logger.error(f"Draining the S3 outbox failed: {str(e)}")
+            time.sleep(self.drain_interval)
+
+    def drain_if_leader(self):
+        """Drain unless another worker on this node is already doing it"""
+        if fcntl is None:
+            return self.drain()
+        with open(os.path.join(self.directory, '.drain.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return 0
+                raise
+            return self.drain()
+
+    def drain(self):
+        """
+        Upload queued files, oldest first, until done or S3 is unavailable
+        Returns:
+            int: Number of entries delivered
+        """
+        self._remove_orphan_data()
+        entry_ids = self._entry_ids()
+        delivered = 0
+        dead_lettered = 0
+        now = time.time()
+        for entry_id in entry_ids:
+            entry_path = os.path.join(self.directory, entry_id + ENTRY_SUFFIX)
+            data_path = os.path.join(self.directory, entry_id + DATA_SUFFIX)
+            try:
+                with open(entry_path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Dropping unreadable outbox entry {entry_id}: {str(e)}")
+                _remove(entry_path)
+                _remove(data_path)
+                continue
+            if entry.get('retry_at', 0) > now:
+                continue
+
+            try:
+                self.s3_manager.upload_file(data_path, entry['key'], is_pdf=entry['is_pdf'],
+                                            metadata=entry.get('metadata'), content_type=entry.get('content_type'))
+            except CircuitOpenError:
+                # Try again once the circuit half-opens
+                break
+            except FileNotFoundError:
+                logger.error(f"Dropping outbox entry {entry_id}: its data file is missing")
+                _remove(entry_path)
+                continue
+            except Exception as e:
+                if is_outage(e):
+                    # S3 itself is failing, not this file; the breaker decides when to try again
+                    logger.warning(f"Outbox upload of {entry['key']} hit an S3 outage: {str(e)}")
+                    break
+                entry['attempts'] += 1
+                entry['last_error'] = str(e)
+                OUTBOX_FAILURES.labels(kind=entry['kind']).inc()
+                logger.error(f"Outbox upload of {entry['key']} failed (attempt {entry['attempts']}): {str(e)}")
+                if entry['attempts'] >= self.max_attempts:
+                    self._dead_letter(entry_id, entry)
+                    dead_lettered += 1
+                else:
+                    entry['retry_at'] = time.time() + min(self.drain_interval * 2 ** (entry['attempts'] - 1),
+                                                          self.max_backoff)
+                    self._write_entry(entry_id, entry)
+                continue
+
+            handler = self._handlers.get(entry['kind'])
+            if handler is not None:
+                try:
+                    handler(entry['meta'])
+                except Exception as e:
+                    logger.error(f"Outbox handler for {entry['key']} failed: {str(e)}")
+            _remove(entry_path)
+            _remove(data_path)
+            delivered += 1
+            OUTBOX_DELIVERED.labels(kind=entry['kind']).inc()
+
+        if delivered:
+            logger.info(f"Delivered {delivered} files from the S3 outbox")
+        OUTBOX_DEPTH.set(len(entry_ids) - delivered - dead_lettered)
+        if dead_lettered:
+            OUTBOX_DEAD_LETTER_DEPTH.set(self.dead_letter_depth())
+        return delivered
+
+    def _dead_letter(self, entry_id, entry):
+        """Move an entry that keeps failing out of the queue, with its final attempt count and error"""
+        os.replace(os.path.join(self.directory, entry_id + DATA_SUFFIX),
+                   os.path.join(self.dead_letter_directory, entry_id + DATA_SUFFIX))
+        self._write_entry(entry_id, entry, self.dead_letter_directory)
+        _remove(os.path.join(self.directory, entry_id + ENTRY_SUFFIX))
+        OUTBOX_DEAD_LETTERED.labels(kind=entry['kind']).inc()
+        logger.error(f"Gave up on outbox upload of {entry['key']} after {entry['attempts']} attempts; "
+                     f"moved to {self.dead_letter_directory}")
+
+    def _remove_orphan_data(self):
+        now = time.time()
+        entries = set(self._entry_ids())
+        for name in os.listdir(self.directory):
+            if not name.endswith(DATA_SUFFIX) or name[:-len(DATA_SUFFIX)] in entries:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                # ctime, not mtime: a hard-linked file keeps its source's mtime
+                if now - os.stat(path).st_ctime > ORPHAN_DATA_AGE:
+                    _remove(path)
+            except FileNotFoundError:
+                continue
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,184 @@
+import zlib
+import unicodedata
+
+# Advance widths (1/1000 em) of the standard Helvetica faces for ASCII 32-126,
+# from the Adobe core font metrics. The oblique faces share these widths.
+_HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_HELVETICA_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+
+# Punctuation outside ASCII that body text commonly contains: (regular, bold)
+_EXTRA_WIDTHS = {
+    '•': (350, 350), '–': (556, 556), '—': (1000, 1000), '…': (1000, 1000),
+    '‘': (222, 278), '’': (222, 278), '“': (333, 500), '”': (333, 500),
+    ' ': (278, 278), '€': (556, 556),
+}
+
+FONTS = {
+    'regular': 'Helvetica',
+    'bold': 'Helvetica-Bold',
+    'italic': 'Helvetica-Oblique',
+    'bold_italic': 'Helvetica-BoldOblique',
+}
+
+
+def can_encode(text):
+    """Whether the text fits the WinAnsi encoding used by the standard fonts"""
+    try:
+        text.encode('cp1252')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def char_width(char, bold=False):
+    """Advance width of one character in 1/1000 em"""
+    code = ord(char)
+    if 32 <= code <= 126:
+        return (_HELVETICA_BOLD_WIDTHS if bold else _HELVETICA_WIDTHS)[code - 32]
+    if char in _EXTRA_WIDTHS:
+        return _EXTRA_WIDTHS[char][1 if bold else 0]
+    # Accented letters are as wide as their base letter
+    base = unicodedata.normalize('NFD', char)[0]
+    if base != char and 32 <= ord(base) <= 126:
+        return char_width(base, bold)
+    return 556
+
+
+def text_width(text, size, bold=False):
+    """
+    Width of a string set in Helvetica
+    Args:
+        text (str): The text
+        size (float): Font size in points
+        bold (bool): Whether the bold face is used
+    Returns:
+        float: Width in points
+    """
+    return sum(char_width(char, bold) for char in text) * size / 1000.0
+
+
+def _pdf_string(text):
+    out = bytearray(b'(')
+    for byte in text.encode('cp1252'):
+        if byte in (0x28, 0x29, 0x5c):
+            out += b'\\' + bytes((byte,))
+        elif byte < 32 or byte > 126:
+            out += b'\\%03o' % byte
+        else:
+            out.append(byte)
+    return bytes(out + b')')
+
+
+def _num(value):
+    return (b'%.2f' % value).rstrip(b'0').rstrip(b'.')
+
+
+class PdfPage:
+    """
+    Drawing operations for one page, in PDF user space (points, origin bottom-left)
+
+    The shapes are also kept as plain tuples so the page can be rasterized
+    into a thumbnail without parsing the content stream.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.shapes = []
+        self._ops = []
+
+    def text(self, x, y, text, font='regular', size=11, color=None):
+        self.shapes.append(('text', x, y, text, font, size, color))
+        colour = b'%s %s %s rg ' % tuple(_num(c) for c in color) if color else b''
+        self._ops.append(b'BT %s/%s %s Tf %s %s Td %s Tj ET' % (
+            colour, font.encode(), _num(size), _num(x), _num(y), _pdf_string(text)))
+
+    def line(self, x1, y1, x2, y2, width=0.5):
+        self.shapes.append(('line', x1, y1, x2, y2))
+        self._ops.append(b'%s w %s %s m %s %s l S' % (
+            _num(width), _num(x1), _num(y1), _num(x2), _num(y2)))
+
+    def rect(self, x, y, width, height, line_width=0.5):
+        self.shapes.append(('rect', x, y, width, height))
+        self._ops.append(b'%s w %s %s %s %s re S' % (
+            _num(line_width), _num(x), _num(y), _num(width), _num(height)))
+
+    def content(self):
+        return b'\n'.join(self._ops)
+
+
+class PdfWriter:
+    """
+    Minimal PDF 1.4 writer: text in the standard Helvetica faces plus lines and rectangles
+
+    Enough for text documents without embedding fonts or images.
+    """
+
+    def __init__(self, title=None):
+        self.title = title
+        self.pages = []
+
+    def add_page(self, width, height):
+        page = PdfPage(width, height)
+        self.pages.append(page)
+        return page
+
+    def save(self, path):
+        """
+        Write the document
+        Args:
+            path (str): Output file path
+        """
+        objects = []
+
+        def add(body):
+            objects.append(body)
+            return len(objects)
+
+        font_refs = {name: add(b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>'
+                               % base.encode()) for name, base in FONTS.items()}
+        resources = b'<< /Font << %s >> >>' % b' '.join(
+            b'/%s %d 0 R' % (name.encode(), ref) for name, ref in font_refs.items())
+        resources_ref = add(resources)
+
+        # Page objects point at the page tree, which is numbered last
+        pages_ref = len(objects) + 2 * len(self.pages) + 1
+        page_refs = []
+        for page in self.pages:
+            data = zlib.compress(page.content())
+            content_ref = add(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data))
+            page_refs.append(add(
+                b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Resources %d 0 R /Contents %d 0 R >>'
+                % (pages_ref, _num(page.width), _num(page.height), resources_ref, content_ref)))
+        add(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % ref for ref in page_refs), len(page_refs)))
+        info = b'<< /Producer (word-to-pdf)%s >>' % (b' /Title ' + _pdf_string(self.title) if self.title else b'')
+        info_ref = add(info)
+        catalog_ref = add(b'<< /Type /Catalog /Pages %d 0 R >>' % pages_ref)
+
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+            offsets = []
+            for number, body in enumerate(objects, 1):
+                offsets.append(f.tell())
+                f.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+            xref = f.tell()
+            f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+            for offset in offsets:
+                f.write(b'%010d 00000 n \n' % offset)
+            f.write(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                    % (len(objects) + 1, catalog_ref, info_ref, xref))
@@ -0,0 +1,140 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from circuit_breaker import STATE_OPEN
+from metrics import TIME_TO_READY, WARMUP_DURATION
+
+logger = logging.getLogger(__name__)
+
+# When the server started: the gunicorn master records it for its workers,
+# anything else counts from the first import of this module
+STARTED_AT = float(os.getenv('SERVER_STARTED_AT') or time.time())
+
+# A failed warm-up is tried again no sooner than this
+WARMUP_RETRY_INTERVAL = 30.0
+
+
+class Readiness:
+    """
+    Whether this worker should be sent traffic
+
+    Ready means the converter has been warmed up in this process, S3 answers
+    and local disk is within budget. S3 and disk results are reused for
+    check_interval seconds so frequent probes stay cheap.
+    """
+
+    def __init__(self, s3_manager, converted_store, directories, min_free_bytes, check_interval=15.0, require_s3=True,
+                 warm_up_enabled=True):
+        self.s3_manager = s3_manager
+        self.converted_store = converted_store
+        self.directories = directories
+        self.min_free_bytes = min_free_bytes
+        self.check_interval = check_interval
+        self.require_s3 = require_s3
+        self.warm_up_enabled = warm_up_enabled
+        self._warm = False
+        self._warm_error = None
+        self._warm_timings = {}
+        self._warm_pid = None
+        self._retry_at = 0.0
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """
+        Run the built-in document through the converters, once per process,
+        and record the time to ready
+        Returns:
+            bool: True if the converters are warm
+        """
+        from word_to_pdf import warm_up
+
+        with self._lock:
+            if not self._should_warm_up():
+                return self._warm
+            # The office pool is per process, so a forked worker warms up again
+            self._warm_pid = os.getpid()
+            self._warm = False
+            self._retry_at = float('inf')
+
+        start_time = time.monotonic()
+        directory = tempfile.mkdtemp(prefix='word-to-pdf-warmup-')
+        try:
+            if self.warm_up_enabled:
+                timings = warm_up(directory)
+                self._warm_timings = {path: round(seconds, 3) for path, seconds in timings.items()}
+            self._warm = True
+            self._warm_error = None
+        except Exception as e:
+            logger.error(f"Converter warm-up failed: {str(e)}")
+            self._warm_error = str(e)
+            self._retry_at = time.monotonic() + WARMUP_RETRY_INTERVAL
+            return False
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        warmup = time.monotonic() - start_time
+        time_to_ready = time.time() - STARTED_AT
+        WARMUP_DURATION.set(warmup)
+        TIME_TO_READY.set(time_to_ready)
+        paths = ', '.join(f"{path} {seconds:.2f}s" for path, seconds in self._warm_timings.items()) or 'skipped'
+        logger.info(f"Worker {os.getpid()} ready {time_to_ready:.2f}s after start (warm-up {warmup:.2f}s: {paths})")
+        return True
+
+    def _should_warm_up(self):
+        if self._warm_pid != os.getpid():
+            return True
+        return not self._warm and time.monotonic() >= self._retry_at
+
+    def start_warm_up(self):
+        """Warm up in the background, for servers without a pre-traffic hook"""
+        with self._lock:
+            if not self._should_warm_up():
+                return
+        threading.Thread(target=self.warm_up, name='converter-warmup', daemon=True).start()
+
+    def _cached(self, name, check):
+        now = time.monotonic()
+        cached = self._checks.get(name)
+        if cached is None or now - cached[0] > self.check_interval:
+            cached = (now, check())
+            self._checks[name] = cached
+        return cached[1]
+
+    def _check_s3(self):
+        state = self.s3_manager.breaker.state
+        if state == STATE_OPEN:
+            # Do not add probe traffic to an S3 that is already failing
+            return {'ok': False, 'breaker': state}
+        return {'ok': self.s3_manager.check_ready(), 'breaker': state}
+
+    def _check_disk(self):
+        free = min(shutil.disk_usage(directory).free for directory in self.directories)
+        converted = self.converted_store.total_bytes()
+        return {
+            'ok': free >= self.min_free_bytes and converted <= self.converted_store.max_bytes,
+            'free_bytes': free,
+            'converted_bytes': converted,
+            'converted_budget_bytes': self.converted_store.max_bytes
+        }
+
+    def status(self):
+        """
+        Run the readiness checks
+        Returns:
+            tuple: (ready, dict of per-check results)
+        """
+        checks = {
+            'converter': {'ok': self._warm, 'timings': self._warm_timings},
+            's3': self._cached('s3', self._check_s3),
+            'disk': self._cached('disk', self._check_disk)
+        }
+        if self._warm_error:
+            checks['converter']['error'] = self._warm_error
+        if not self.require_s3:
+            checks['s3']['required'] = False
+        ready = all(check['ok'] for name, check in checks.items() if name != 's3' or self.require_s3)
+        return ready, checks
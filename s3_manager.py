@@ -1,55 +1,159 @@
-import boto3
 import os
-from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError, PartialCredentialsError
 import logging
 from dotenv import load_dotenv
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from log_pipeline import in_context
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+MB = 1024 * 1024
+PRESIGN_CACHE_SIZE = 4096
+
+# S3 error codes that mean the service is struggling rather than that the request was wrong
+OUTAGE_ERROR_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestTimeout', 'ServiceUnavailable',
+                      'InternalError', 'RequestTimeTooSkewed'}
+
+_upload_executor = None
+_upload_executor_pid = None
+_upload_executor_lock = threading.Lock()
+
+def is_outage(error):
+    """Whether an exception from boto3 counts against the S3 circuit breaker"""
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return status >= 500 or error.response.get('Error', {}).get('Code') in OUTAGE_ERROR_CODES
+    # Connection failures, timeouts and the like; bad credentials are not an outage
+    return isinstance(error, BotoCoreError) and not isinstance(error, (NoCredentialsError, PartialCredentialsError))
+
+def get_upload_executor():
+    """
+    Return the thread pool shared by background S3 uploads in this process
+    Returns:
+        ThreadPoolExecutor: The pool, sized by S3_UPLOAD_WORKERS
+    """
+    global _upload_executor, _upload_executor_pid
+
+    with _upload_executor_lock:
+        # Threads do not survive fork, so each worker process builds its own pool
+        if _upload_executor is None or _upload_executor_pid != os.getpid():
+            _upload_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('S3_UPLOAD_WORKERS', '8')),
+                thread_name_prefix='s3-upload'
+            )
+            _upload_executor_pid = os.getpid()
+        return _upload_executor
+
 class S3Manager:
     def __init__(self):
         # Validate AWS credentials
         self._validate_credentials()
-        
-        # Initialize S3 client
-        try:
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                region_name=os.getenv('AWS_REGION')
-            )
-            # Test the connection
-            self.s3_client.list_buckets()
-            logger.info("Successfully connected to AWS S3")
-        except NoCredentialsError:
-            logger.error("AWS credentials not found")
-            raise
-        except PartialCredentialsError:
-            logger.error("Incomplete AWS credentials")
-            raise
-        except ClientError as e:
-            logger.error(f"AWS authentication error: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error initializing S3 client: {str(e)}")
-            raise
+
+        # boto3 takes a noticeable part of startup to import, so it and the
+        # client and transfer settings are loaded on first use
+        self._transfer_config = None
 
         self.word_bucket = os.getenv('WORD_DOCUMENTS_BUCKET')
         self.pdf_bucket = os.getenv('PDF_FILES_BUCKET')
         
         if not self.word_bucket or not self.pdf_bucket:
             raise ValueError("S3 bucket names not configured in .env file")
-            
-        self._ensure_buckets_exist()
+
+        # Presigned URLs are reused until this fraction of their lifetime has passed
+        self.presign_reuse_fraction = float(os.getenv('S3_PRESIGN_REUSE_FRACTION', '0.75'))
+        self._presign_cache = OrderedDict()
+        self._presign_lock = threading.Lock()
+
+        # Fail fast while S3 is failing instead of waiting out every retry cycle
+        self.breaker = CircuitBreaker(
+            's3',
+            failure_rate=float(os.getenv('S3_BREAKER_FAILURE_RATE', '0.5')),
+            minimum_calls=int(os.getenv('S3_BREAKER_MIN_CALLS', '5')),
+            window_seconds=float(os.getenv('S3_BREAKER_WINDOW', '30')),
+            open_seconds=float(os.getenv('S3_BREAKER_OPEN_SECONDS', '30'))
+        )
+
+        # The client is created on first use in each process, never at import
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def s3_client(self):
+        """S3 client for this process, created lazily and rebuilt after fork"""
+        if self._client is None or self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    try:
+                        import boto3
+                        from botocore.config import Config
+
+                        # Connection pool, retry and timeout settings for the S3 client
+                        client_config = Config(
+                            region_name=os.getenv('AWS_REGION'),
+                            max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', '50')),
+                            connect_timeout=float(os.getenv('S3_CONNECT_TIMEOUT', '5')),
+                            read_timeout=float(os.getenv('S3_READ_TIMEOUT', '30')),
+                            retries={
+                                'total_max_attempts': int(os.getenv('S3_MAX_ATTEMPTS', '3')),
+                                'mode': os.getenv('S3_RETRY_MODE', 'standard')
+                            }
+                        )
+                        self._client = boto3.session.Session().client(
+                            's3',
+                            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                            config=client_config
+                        )
+                        self._client_pid = os.getpid()
+                    except Exception as e:
+                        logger.error(f"Unexpected error initializing S3 client: {str(e)}")
+                        raise
+        return self._client
+
+    @property
+    def transfer_config(self):
+        """Multipart transfer tuning for upload_file and upload_fileobj"""
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(
+                multipart_threshold=int(os.getenv('S3_MULTIPART_THRESHOLD', str(8 * MB))),
+                multipart_chunksize=int(os.getenv('S3_MULTIPART_CHUNKSIZE', str(8 * MB))),
+                max_concurrency=int(os.getenv('S3_MAX_CONCURRENCY', '10')),
+                use_threads=True
+            )
+        return self._transfer_config
+
+    def _guarded(self, operation, call, *args, **kwargs):
+        """
+        Run an S3 call through the circuit breaker
+        Args:
+            operation (str): Name for log messages
+            call (callable): The boto3 call
+        Returns:
+            The call's result
+        Raises:
+            CircuitOpenError: If the circuit is open and the call was not attempted
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"S3 is unavailable, skipped {operation}")
+        try:
+            result = call(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
 
     def _validate_credentials(self):
         """Validate AWS credentials are present and properly formatted"""
@@ -67,28 +171,39 @@ class S3Manager:
         if not access_key.startswith('AKIA'):
             raise ValueError("Invalid AWS access key format")
 
-    def _ensure_buckets_exist(self):
-        """Ensure required S3 buckets exist, create if they don't"""
+    def check_ready(self):
+        """
+        Readiness check: verify the credentials work and both buckets are reachable
+        Returns:
+            bool: True if both buckets answered
+        """
         for bucket_name in [self.word_bucket, self.pdf_bucket]:
             try:
                 self.s3_client.head_bucket(Bucket=bucket_name)
-                logger.info(f"Bucket {bucket_name} exists")
+            except NoCredentialsError:
+                logger.error("AWS credentials not found")
+                return False
+            except PartialCredentialsError:
+                logger.error("Incomplete AWS credentials")
+                return False
             except ClientError as e:
-                error_code = e.response.get('Error', {}).get('Code', '')
-                if error_code in ['404', '403']:
-                    logger.info(f"Bucket {bucket_name} exists but is not owned by you or not accessible")
-                    continue
-                else:
-                    logger.error(f"Error checking bucket {bucket_name}: {str(e)}")
-                    raise
+                logger.error(f"Error checking bucket {bucket_name}: {str(e)}")
+                return False
+            except Exception as e:
+                logger.error(f"Unexpected error checking bucket {bucket_name}: {str(e)}")
+                return False
+        logger.info("Successfully connected to AWS S3")
+        return True
 
-    def upload_file(self, file_path, file_name, is_pdf=False):
+    def upload_file(self, file_path, file_name, is_pdf=False, metadata=None, content_type=None):
         """
         Upload a file to S3
         Args:
             file_path (str): Local path to the file
             file_name (str): Name to give the file in S3
             is_pdf (bool): Whether the file is a PDF (determines which bucket to use)
+            metadata (dict, optional): User metadata stored with the object (string values)
+            content_type (str, optional): Content-Type stored with the object
         Returns:
             str: URL of the uploaded file
         """
@@ -96,8 +211,14 @@ class S3Manager:
             raise FileNotFoundError(f"Local file not found: {file_path}")
 
         bucket = self.pdf_bucket if is_pdf else self.word_bucket
+        extra_args = {}
+        if metadata:
+            extra_args['Metadata'] = {key: str(value) for key, value in metadata.items()}
+        if content_type:
+            extra_args['ContentType'] = content_type
         try:
-            self.s3_client.upload_file(file_path, bucket, file_name)
+            self._guarded('upload_file', self.s3_client.upload_file, file_path, bucket, file_name,
+                          ExtraArgs=extra_args or None, Config=self.transfer_config)
             url = f"https://{bucket}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{file_name}"
             logger.info(f"Successfully uploaded {file_name} to {bucket}")
             return self.get_presigned_url(file_name, is_pdf)
@@ -111,6 +232,47 @@ class S3Manager:
                 logger.error(f"Error uploading {file_name} to {bucket}: {str(e)}")
             raise
 
+    def upload_fileobj(self, fileobj, file_name, is_pdf=False):
+        """
+        Upload a readable file-like object to S3, streaming it in multipart chunks
+        Args:
+            fileobj: Object with a read() method, e.g. an open file or ingest.UploadPipe
+            file_name (str): Name to give the file in S3
+            is_pdf (bool): Whether the file is a PDF (determines which bucket to use)
+        Returns:
+            str: URL of the uploaded file
+        """
+        bucket = self.pdf_bucket if is_pdf else self.word_bucket
+        try:
+            self._guarded('upload_fileobj', self.s3_client.upload_fileobj, fileobj, bucket, file_name,
+                          Config=self.transfer_config)
+            logger.info(f"Successfully streamed {file_name} to {bucket}")
+            return self.get_presigned_url(file_name, is_pdf)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code == 'NoSuchBucket':
+                logger.error(f"Bucket {bucket} does not exist")
+            elif error_code == 'AccessDenied':
+                logger.error(f"Access denied to bucket {bucket}. Check your AWS permissions.")
+            else:
+                logger.error(f"Error streaming {file_name} to {bucket}: {str(e)}")
+            raise
+
+    def upload_file_async(self, file_path, file_name, is_pdf=False, metadata=None, content_type=None):
+        """
+        Upload a file to S3 on the shared upload thread pool
+        Args:
+            file_path (str): Local path to the file
+            file_name (str): Name to give the file in S3
+            is_pdf (bool): Whether the file is a PDF (determines which bucket to use)
+            metadata (dict, optional): User metadata stored with the object
+            content_type (str, optional): Content-Type stored with the object
+        Returns:
+            Future: Resolves to the presigned URL of the uploaded file
+        """
+        return get_upload_executor().submit(in_context(self.upload_file), file_path, file_name, is_pdf,
+                                            metadata, content_type)
+
     def download_file(self, filename):
         """
         Download a file from S3
@@ -122,20 +284,54 @@ class S3Manager:
         # Try PDF bucket first
         local_path = os.path.join('converted', filename)
         try:
-            self.s3_client.download_file(self.pdf_bucket, filename, local_path)
+            self._guarded('download_file', self.s3_client.download_file, self.pdf_bucket, filename, local_path)
             logger.info(f"Successfully downloaded {filename} from {self.pdf_bucket}")
             return local_path
         except ClientError as e:
             # If not in PDF bucket, try Word bucket
             try:
                 local_path = os.path.join('uploads', filename)
-                self.s3_client.download_file(self.word_bucket, filename, local_path)
+                self._guarded('download_file', self.s3_client.download_file, self.word_bucket, filename, local_path)
                 logger.info(f"Successfully downloaded {filename} from {self.word_bucket}")
                 return local_path
             except ClientError:
                 logger.error(f"File {filename} not found in either bucket")
                 return None
 
+    def download_files(self, filenames, max_workers=8):
+        """
+        Download several files from S3 concurrently
+        Args:
+            filenames (list): Names of the files in S3
+            max_workers (int): Maximum number of parallel downloads
+        Returns:
+            dict: Maps each file name to its local path, or None if not found
+        """
+        if not filenames:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(filenames)),
+                                thread_name_prefix='s3-download') as executor:
+            return dict(zip(filenames, executor.map(in_context(self.download_file), filenames)))
+
+    def upload_files(self, uploads, max_workers=8):
+        """
+        Upload several files to S3 concurrently
+        Args:
+            uploads (list): upload_file argument tuples, (file_path, file_name, is_pdf[, metadata[, content_type]])
+            max_workers (int): Maximum number of parallel uploads
+        Returns:
+            list: Presigned URL of each uploaded file, in order
+        Raises:
+            Exception: The first failed upload's error, once every upload has finished
+        """
+        if not uploads:
+            return []
+        upload = in_context(self.upload_file)
+        # A pool of its own, so callers already on the shared upload pool cannot starve it
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(uploads)),
+                                thread_name_prefix='s3-upload-batch') as executor:
+            return list(executor.map(lambda args: upload(*args), uploads))
+
     def delete_file(self, file_name, is_pdf=False):
         """
         Delete a file from S3
@@ -145,7 +341,7 @@ class S3Manager:
         """
         bucket = self.pdf_bucket if is_pdf else self.word_bucket
         try:
-            self.s3_client.delete_object(Bucket=bucket, Key=file_name)
+            self._guarded('delete_object', self.s3_client.delete_object, Bucket=bucket, Key=file_name)
             logger.info(f"Successfully deleted {file_name} from {bucket}")
         except ClientError as e:
             error_code = e.response['Error']['Code']
@@ -159,6 +355,40 @@ class S3Manager:
                 logger.error(f"Error deleting {file_name} from {bucket}: {str(e)}")
             raise
 
+    def delete_files(self, file_names, is_pdf=False):
+        """
+        Delete many files from S3 with batched DeleteObjects requests
+        Args:
+            file_names (list): Names of the files to delete
+            is_pdf (bool): Whether the files are PDFs (determines which bucket to use)
+        Returns:
+            list: Names of the files that could not be deleted
+        """
+        bucket = self.pdf_bucket if is_pdf else self.word_bucket
+        failed = []
+        # DeleteObjects accepts at most 1000 keys per request
+        for start in range(0, len(file_names), 1000):
+            batch = file_names[start:start + 1000]
+            try:
+                response = self._guarded(
+                    'delete_objects',
+                    self.s3_client.delete_objects,
+                    Bucket=bucket,
+                    Delete={
+                        'Objects': [{'Key': name} for name in batch],
+                        'Quiet': True
+                    }
+                )
+            except (ClientError, BotoCoreError, CircuitOpenError) as e:
+                logger.error(f"Error deleting {len(batch)} files from {bucket}: {str(e)}")
+                failed.extend(batch)
+                continue
+            for error in response.get('Errors', []):
+                logger.error(f"Error deleting {error['Key']} from {bucket}: {error.get('Message', error.get('Code'))}")
+                failed.append(error['Key'])
+        logger.info(f"Deleted {len(file_names) - len(failed)} of {len(file_names)} files from {bucket}")
+        return failed
+
     def get_file_url(self, file_name, is_pdf=False):
         """
         Get the URL of a file in S3
@@ -171,26 +401,74 @@ class S3Manager:
         bucket = self.pdf_bucket if is_pdf else self.word_bucket
         return f"https://{bucket}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{file_name}"
 
-    def get_presigned_url(self, filename, is_pdf=False, expiration=3600):
+    def object_exists(self, file_name, is_pdf=False):
+        """
+        Check whether a file exists in S3
+        Args:
+            file_name (str): Name of the file in S3
+            is_pdf (bool): Whether the file is a PDF (determines which bucket to use)
+        Returns:
+            bool: True if the object exists
+        """
+        return self.object_metadata(file_name, is_pdf) is not None
+
+    def object_metadata(self, file_name, is_pdf=False):
+        """
+        Fetch the user metadata of a file in S3
+        Args:
+            file_name (str): Name of the file in S3
+            is_pdf (bool): Whether the file is a PDF (determines which bucket to use)
+        Returns:
+            dict: The object's user metadata (possibly empty), or None if the object does not exist
+        """
+        bucket = self.pdf_bucket if is_pdf else self.word_bucket
+        try:
+            response = self._guarded('head_object', self.s3_client.head_object, Bucket=bucket, Key=file_name)
+            return response.get('Metadata', {})
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', '')
+            if error_code in ['404', 'NoSuchKey', 'NotFound']:
+                return None
+            logger.error(f"Error checking {file_name} in {bucket}: {str(e)}")
+            raise
+
+    def get_presigned_url(self, filename, is_pdf=False, expiration=3600, download_name=None):
         """
         Generate a presigned URL for secure file download
         Args:
             filename (str): Name of the file in S3
             is_pdf (bool): Whether the file is in the PDF bucket
             expiration (int): URL expiration time in seconds (default 1 hour)
+            download_name (str, optional): File name the browser should save as
         Returns:
             str: Presigned URL for the file
         """
+        bucket = self.pdf_bucket if is_pdf else self.word_bucket
+        cache_key = (bucket, filename, download_name, expiration)
+        now = time.time()
+        with self._presign_lock:
+            cached = self._presign_cache.get(cache_key)
+            # Reuse a URL for most of its lifetime so hot downloads skip re-signing
+            if cached and now - cached[1] < expiration * self.presign_reuse_fraction:
+                self._presign_cache.move_to_end(cache_key)
+                return cached[0]
+
         try:
-            bucket = self.pdf_bucket if is_pdf else self.word_bucket
+            params = {
+                'Bucket': bucket,
+                'Key': filename
+            }
+            if download_name:
+                params['ResponseContentDisposition'] = f'attachment; filename="{download_name}"'
             url = self.s3_client.generate_presigned_url(
                 'get_object',
-                Params={
-                    'Bucket': bucket,
-                    'Key': filename
-                },
+                Params=params,
                 ExpiresIn=expiration
             )
+            with self._presign_lock:
+                self._presign_cache[cache_key] = (url, now)
+                while len(self._presign_cache) > PRESIGN_CACHE_SIZE:
+                    self._presign_cache.popitem(last=False)
             return url
         except Exception as e:
             logger.error(f"Failed to generate presigned URL: {str(e)}")
@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Threads doing request work (thread id -> nesting depth); only these are
+# sampled, so idle pool threads do not drown out the conversion path
+_busy = {}
+
+# Child process each thread is currently waiting on (thread id -> label)
+_children = {}
+
+_active = None
+_active_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is already running in this process"""
+
+
+def mark_busy():
+    ident = threading.get_ident()
+    _busy[ident] = _busy.get(ident, 0) + 1
+
+
+def mark_idle():
+    ident = threading.get_ident()
+    depth = _busy.get(ident, 0) - 1
+    if depth > 0:
+        _busy[ident] = depth
+    else:
+        _busy.pop(ident, None)
+
+
+@contextmanager
+def busy():
+    """Make the calling thread visible to the profiler for the enclosed block"""
+    mark_busy()
+    try:
+        yield
+    finally:
+        mark_idle()
+
+
+@contextmanager
+def child_process(label):
+    """
+    Attribute the calling thread's time to a child process while it waits on it
+    Args:
+        label (str): Name of the child, shown as a "[child] label" frame
+    """
+    ident = threading.get_ident()
+    _children[ident] = label
+    start_time = time.monotonic()
+    try:
+        yield
+    finally:
+        _children.pop(ident, None)
+        profiler = _active
+        if profiler is not None:
+            profiler.record_child(label, time.monotonic() - start_time)
+
+
+def request_finished():
+    """Count a finished request towards a running profile's request limit"""
+    profiler = _active
+    if profiler is not None:
+        profiler.request_finished()
+
+
+def _children_cpu_seconds():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of busy threads in this process at a fixed interval
+
+    Samples are folded into collapsed stacks, one "frame;frame;frame count"
+    line per distinct stack, which flamegraph.pl and speedscope read as is.
+    A thread waiting on a child process (LibreOffice, the office pool helper,
+    qpdf) gets a "[child] label" leaf frame, so time spent outside Python
+    shows up as its own tower instead of as a wait in subprocess.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.requests = 0
+        self.request_limit = None
+        self.wall_seconds = 0.0
+        self.children = {}
+        self.children_cpu_seconds = 0.0
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def record_child(self, label, seconds):
+        with self._lock:
+            calls, wall = self.children.get(label, (0, 0.0))
+            self.children[label] = (calls + 1, wall + seconds)
+
+    def request_finished(self):
+        with self._lock:
+            self.requests += 1
+            if self.request_limit is not None and self.requests >= self.request_limit:
+                self._done.set()
+
+    def _sample(self, exclude):
+        frames = sys._current_frames()
+        for ident in list(_busy):
+            frame = frames.get(ident)
+            if frame is None or ident in exclude:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            child = _children.get(ident)
+            if child is not None:
+                stack.append(f"[child] {child}")
+            self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def run(self, seconds, requests=None):
+        """
+        Sample on the calling thread until time is up or enough requests have finished
+        Args:
+            seconds (float): Longest the profile may run
+            requests (int, optional): Stop once this many requests have finished
+        Returns:
+            SamplingProfiler: self, with the results filled in
+        Raises:
+            ProfilerBusyError: If another profile is running in this process
+        """
+        global _active
+
+        with _active_lock:
+            if _active is not None:
+                raise ProfilerBusyError("A profile is already running in this worker")
+            _active = self
+        self.request_limit = requests
+        exclude = {threading.get_ident()}
+        cpu_before = _children_cpu_seconds()
+        start_time = time.monotonic()
+        deadline = start_time + seconds
+        try:
+            while not self._done.is_set() and time.monotonic() < deadline:
+                self._sample(exclude)
+                self._done.wait(self.interval)
+        finally:
+            with _active_lock:
+                _active = None
+        self.wall_seconds = time.monotonic() - start_time
+        # Only children that exited and were reaped count, i.e. not the long-lived office pool
+        self.children_cpu_seconds = _children_cpu_seconds() - cpu_before
+        return self
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def summary(self):
+        return {
+            'pid': os.getpid(),
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'requests': self.requests,
+            'children': {label: {'calls': calls, 'wall_seconds': round(wall, 3)}
+                         for label, (calls, wall) in self.children.items()},
+            'children_cpu_seconds': round(self.children_cpu_seconds, 3),
+            'collapsed': self.collapsed()
+        }
@@ -0,0 +1,186 @@
+import re
+import time
+import queue
+import zipfile
+import logging
+import threading
+from metrics import QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Rough seconds of conversion work per unit, fitted to office-path timings;
+# only the relative order of estimates matters to the scheduler
+COST_BASE = 0.5
+COST_PER_MB = 1.0
+COST_PER_PAGE = 0.05
+COST_PER_IMAGE = 0.1
+
+# Priority classes by estimated cost in seconds, for the queue-wait metric
+PRIORITY_CLASSES = (('small', 2.0), ('medium', 10.0))
+PRIORITY_LARGE = 'large'
+
+_PAGES_PATTERN = re.compile(rb'<Pages>(\d+)</Pages>')
+
+
+def docx_stats(path):
+    """
+    Page and image counts of a .docx, read from the zip directory and docProps/app.xml
+    Args:
+        path (str): Path to the document
+    Returns:
+        tuple: (pages, images); pages is 0 when the document does not record it
+    """
+    with zipfile.ZipFile(path) as archive:
+        images = sum(1 for name in archive.namelist() if name.startswith('word/media/'))
+        try:
+            match = _PAGES_PATTERN.search(archive.read('docProps/app.xml'))
+        except KeyError:
+            match = None
+    return (int(match.group(1)) if match else 0), images
+
+
+def estimate_cost(size, path=None):
+    """
+    Estimate how long a document takes to convert
+    Args:
+        size (int): Document size in bytes
+        path (str, optional): Saved document, inspected for page and image counts
+    Returns:
+        float: Estimated cost in seconds
+    """
+    cost = COST_BASE + COST_PER_MB * (size or 0) / MB
+    if path is not None:
+        try:
+            pages, images = docx_stats(path)
+            cost += COST_PER_PAGE * pages + COST_PER_IMAGE * images
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.debug(f"Could not inspect {path} for cost: {str(e)}")
+    return cost
+
+
+def priority_class(cost):
+    for name, limit in PRIORITY_CLASSES:
+        if cost < limit:
+            return name
+    return PRIORITY_LARGE
+
+
+class Ticket:
+    """One piece of pending work"""
+
+    __slots__ = ('item', 'cost', 'client', 'priority_class', 'enqueued_at')
+
+    def __init__(self, item, cost, client):
+        self.item = item
+        self.cost = cost
+        self.client = client
+        self.priority_class = priority_class(cost)
+        self.enqueued_at = time.monotonic()
+
+
+class FairScheduler:
+    """
+    Pending work ordered by estimated cost, per-client fair share and age
+
+    The next ticket is the one with the lowest score: its cost, plus the
+    client's recently served cost (decaying with usage_half_life), minus
+    aging_rate for every second it has waited. Anything waiting longer than
+    max_wait goes first regardless, oldest first, so large documents cannot
+    starve behind a steady stream of small ones.
+    """
+
+    def __init__(self, max_pending=0, aging_rate=1.0, max_wait=120.0, usage_half_life=60.0):
+        self.max_pending = max_pending
+        self.aging_rate = aging_rate
+        self.max_wait = max_wait
+        self.usage_half_life = usage_half_life
+        self._pending = []
+        self._usage = {}
+        self._cond = threading.Condition()
+
+    def _client_usage(self, client, now):
+        usage, updated_at = self._usage.get(client, (0.0, now))
+        return usage * 0.5 ** ((now - updated_at) / self.usage_half_life)
+
+    def charge(self, client, cost):
+        """Count cost against the client's fair share, e.g. for work that never had to queue"""
+        with self._cond:
+            now = time.monotonic()
+            self._usage[client] = (self._client_usage(client, now) + cost, now)
+            # Forget clients whose usage has decayed away
+            if len(self._usage) > 1024:
+                self._usage = {key: value for key, value in self._usage.items()
+                               if self._client_usage(key, now) > 0.01}
+
+    def _key(self, ticket, now):
+        waited = now - ticket.enqueued_at
+        if waited >= self.max_wait:
+            return (0, ticket.enqueued_at)
+        return (1, ticket.cost + self._client_usage(ticket.client, now) - self.aging_rate * waited)
+
+    def _best(self):
+        now = time.monotonic()
+        return min(self._pending, key=lambda ticket: self._key(ticket, now), default=None)
+
+    def add(self, item, cost, client=None):
+        """
+        Queue work
+        Args:
+            item: Anything; handed back by get()
+            cost (float): Estimated cost in seconds
+            client (str, optional): Identity the work is charged to, e.g. admission.client_id();
+                never one the client chooses, or each new identity starts with no usage
+        Returns:
+            Ticket: The queued ticket
+        Raises:
+            queue.Full: If max_pending tickets are already waiting
+        """
+        ticket = Ticket(item, cost, client)
+        with self._cond:
+            if self.max_pending and len(self._pending) >= self.max_pending:
+                raise queue.Full
+            self._pending.append(ticket)
+            self._cond.notify()
+        return ticket
+
+    def is_next(self, ticket):
+        with self._cond:
+            return self._best() is ticket
+
+    def take(self, ticket):
+        """Remove a ticket that is starting, charging its client and recording its wait"""
+        self.remove(ticket)
+        self._started(ticket)
+
+    def _started(self, ticket):
+        self.charge(ticket.client, ticket.cost)
+        QUEUE_WAIT.labels(priority_class=ticket.priority_class).observe(time.monotonic() - ticket.enqueued_at)
+
+    def remove(self, ticket):
+        """Drop a ticket that gave up waiting"""
+        with self._cond:
+            if ticket in self._pending:
+                self._pending.remove(ticket)
+
+    def get(self):
+        """
+        Block until work is pending, then take the best ticket
+        Returns:
+            Ticket: The ticket to run
+        """
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            ticket = self._best()
+            self._pending.remove(ticket)
+        self._started(ticket)
+        return ticket
+
+    def qsize(self):
+        with self._cond:
+            return len(self._pending)
+
+    def full(self):
+        return bool(self.max_pending) and self.qsize() >= self.max_pending
@@ -10,6 +10,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const errorContainer = document.getElementById('errorContainer');
     const errorMessage = document.getElementById('errorMessage');
 
+    // Larger files go up as resumable chunks, several at a time
+    const MAX_FILE_MB = 512;
+    const CHUNKED_THRESHOLD = 8 * 1024 * 1024;
+    const PARALLEL_CHUNKS = 4;
+    const CHUNK_RETRIES = 3;
+
     // File drag and drop
     ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
         dropZone.addEventListener(eventName, preventDefaults, false);
@@ -53,8 +59,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const file = fileInput.files[0];
         if (file) {
             const size = (file.size / (1024 * 1024)).toFixed(2); // Convert to MB
-            if (size > 16) {
-                showError('File size exceeds 16MB limit');
+            if (size > MAX_FILE_MB) {
+                showError(`File size exceeds ${MAX_FILE_MB}MB limit`);
                 fileInput.value = '';
                 fileInfo.textContent = 'No file selected';
                 convertBtn.disabled = true;
@@ -79,50 +85,30 @@ document.addEventListener('DOMContentLoaded', () => {
     form.addEventListener('submit', async (e) => {
         e.preventDefault();
         
-        const formData = new FormData(form);
+        const file = fileInput.files[0];
         
         try {
             progressContainer.style.display = 'block';
             convertBtn.disabled = true;
-            
-            // Simulate progress
-            let progressValue = 0;
-            const progressInterval = setInterval(() => {
-                if (progressValue < 90) {
-                    progressValue += 10;
-                    progress.style.width = `${progressValue}%`;
-                    statusText.textContent = 'Converting...';
-                }
-            }, 500);
+            progress.style.width = '10%';
+            statusText.textContent = 'Uploading...';
 
-            const response = await fetch('/convert', {
-                method: 'POST',
-                body: formData
-            });
-
-            clearInterval(progressInterval);
-
-            if (!response.ok) {
-                const error = await response.json();
-                throw new Error(error.error || 'Conversion failed');
-            }
+            // Submit the conversion job; the server answers as soon as it is queued
+            const job = file.size > CHUNKED_THRESHOLD ? await uploadInChunks(file) : await uploadWhole(file);
+            const result = await pollJob(job.status_url, parseInt(progress.style.width, 10));
 
             // Complete the progress bar
             progress.style.width = '100%';
             statusText.textContent = 'Done!';
 
-            // Get the blob
-            const blob = await response.blob();
-            
             // Create download link
-            const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.style.display = 'none';
-            a.href = url;
-            a.download = formData.get('word_file').name.replace('.docx', '.pdf');
+            a.href = result.download_url;
+            a.download = file.name.replace('.docx', '.pdf');
             document.body.appendChild(a);
             a.click();
-            window.URL.revokeObjectURL(url);
+            document.body.removeChild(a);
 
             // Reset form after short delay
             setTimeout(() => {
@@ -141,6 +127,126 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    async function readJson(response) {
+        const body = await response.json();
+        if (!response.ok) {
+            throw new Error(body.error || 'Conversion failed');
+        }
+        return body;
+    }
+
+    async function uploadWhole(file) {
+        const formData = new FormData();
+        formData.append('file', file);
+        return readJson(await fetch('/jobs', {
+            method: 'POST',
+            body: formData
+        }));
+    }
+
+    async function sha256Hex(blob) {
+        // crypto.subtle only exists in secure contexts; the server hashes chunks either way
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function startOrResumeUpload(file) {
+        // Resume an interrupted upload of the same file, if the server still has it
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            const response = await fetch(`/uploads/${savedId}`);
+            if (response.ok) {
+                const upload = await response.json();
+                return {resumeKey, upload, missing: upload.missing};
+            }
+            localStorage.removeItem(resumeKey);
+        }
+
+        const upload = await readJson(await fetch('/uploads', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size})
+        }));
+        localStorage.setItem(resumeKey, upload.upload_id);
+        const missing = Array.from({length: upload.total_chunks}, (_, index) => index);
+        return {resumeKey, upload, missing};
+    }
+
+    async function putChunk(file, upload, index) {
+        const start = index * upload.chunk_size;
+        const chunk = file.slice(start, Math.min(start + upload.chunk_size, file.size));
+        const checksum = await sha256Hex(chunk);
+        const headers = {'Content-Type': 'application/octet-stream'};
+        if (checksum) {
+            headers['X-Chunk-SHA256'] = checksum;
+        }
+
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await readJson(await fetch(`/uploads/${upload.upload_id}/chunks/${index}`, {
+                    method: 'PUT',
+                    headers,
+                    body: chunk
+                }));
+            } catch (error) {
+                if (attempt >= CHUNK_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function uploadInChunks(file) {
+        const {resumeKey, upload, missing} = await startOrResumeUpload(file);
+        const total = upload.total_chunks;
+        let done = total - missing.length;
+        const pending = missing.slice();
+
+        // A few workers pull chunk numbers off the shared list until it is empty
+        const worker = async () => {
+            while (pending.length) {
+                await putChunk(file, upload, pending.shift());
+                done++;
+                progress.style.width = `${10 + Math.round(40 * done / total)}%`;
+                statusText.textContent = `Uploading... ${Math.round(100 * done / total)}%`;
+            }
+        };
+        await Promise.all(Array.from({length: Math.min(PARALLEL_CHUNKS, pending.length)}, worker));
+
+        const job = await readJson(await fetch(`/uploads/${upload.upload_id}/complete`, {method: 'POST'}));
+        localStorage.removeItem(resumeKey);
+        return job;
+    }
+
+    async function pollJob(statusUrl, progressValue = 10) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || 'Conversion failed');
+            }
+
+            if (job.status === 'done') {
+                return job;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Conversion failed');
+            }
+
+            // Creep towards 90% while the job is queued or running
+            progressValue = Math.min(90, progressValue + 5);
+            progress.style.width = `${progressValue}%`;
+            statusText.textContent = job.status === 'queued' ? 'Waiting in queue...' : 'Converting...';
+        }
+    }
+
     function showError(message) {
         errorMessage.textContent = message;
         errorContainer.style.display = 'flex';
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admission  # noqa: E402
+from admission import client_id  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.add_url_rule('/whoami', 'whoami', client_id)
+    return app
+
+
+def whoami(app, **headers):
+    return app.test_client().get('/whoami', headers=headers, environ_base={'REMOTE_ADDR': '10.0.0.1'}).text
+
+
+def test_client_is_the_peer_without_trusted_proxies(app):
+    assert whoami(app) == '10.0.0.1'
+    assert whoami(app, **{'X-Forwarded-For': '198.51.100.7'}) == '10.0.0.1'
+
+
+def test_client_is_the_rightmost_untrusted_hop(app):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    assert whoami(app, **{'X-Forwarded-For': '203.0.113.9'}) == '203.0.113.9'
+    # A forged first hop is ignored; the proxy appended the real one
+    assert whoami(app, **{'X-Forwarded-For': '198.51.100.7, 203.0.113.9'}) == '203.0.113.9'
+
+
+def test_only_configured_api_keys_identify_a_client(app, monkeypatch):
+    monkeypatch.setattr(admission, 'API_KEYS', frozenset({'good-key'}))
+    keyed = whoami(app, **{'X-API-Key': 'good-key'})
+    assert keyed.startswith('key-') and 'good-key' not in keyed
+    assert whoami(app, **{'X-API-Key': 'made-up'}) == '10.0.0.1'
+
+
+def test_ipv6_clients_are_grouped_by_network(app):
+    def peer(address):
+        return app.test_client().get('/whoami', environ_base={'REMOTE_ADDR': address}).text
+
+    assert peer('2001:db8:1:2::1') == peer('2001:db8:1:2:ffff::9') == '2001:db8:1:2::/64'
+    assert peer('2001:db8:1:3::1') != peer('2001:db8:1:2::1')
+    assert peer('::ffff:192.0.2.1') == '192.0.2.1'
+
+
+def test_forged_headers_do_not_earn_a_fresh_fair_share(app):
+    scheduler = admission.FairScheduler(aging_rate=0)
+    with app.test_request_context(headers={'X-Forwarded-For': '198.51.100.7', 'X-API-Key': 'made-up'},
+                                  environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        scheduler.charge(client_id(), 50)
+    heavy = scheduler.add('heavy', 1, '10.0.0.1')
+    light = scheduler.add('light', 10, '10.0.0.2')
+    assert scheduler.is_next(light) and not scheduler.is_next(heavy)
@@ -0,0 +1,100 @@
+import io
+import os
+import sys
+import hashlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunked_upload import ChunkedUploadStore, ChunkError, UploadNotFoundError  # noqa: E402
+
+DATA = bytes(range(256)) * 10  # 2560 bytes: chunks of 1000, 1000 and 560
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(str(tmp_path / 'chunked'), max_bytes=10_000, chunk_size=1000)
+
+
+def put(store, upload_id, index, body=None, sha=None):
+    body = DATA[index * 1000:(index + 1) * 1000] if body is None else body
+    return store.put_chunk(upload_id, index, io.BytesIO(body), expected_sha256=sha)
+
+
+def sessions(store):
+    return sorted(os.listdir(store.directory))
+
+
+def test_resume_sends_only_missing_chunks(store, tmp_path):
+    upload_id = store.create('a.docx', len(DATA))['upload_id']
+    put(store, upload_id, 2)
+    put(store, upload_id, 0)
+    assert store.status(upload_id)['missing'] == [1]
+    with pytest.raises(ChunkError):
+        store.complete(upload_id, str(tmp_path / 'a.docx'))
+
+    put(store, upload_id, 1)
+    _, size, digest = store.complete(upload_id, str(tmp_path / 'a.docx'))
+    assert (size, digest) == (len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert (tmp_path / 'a.docx').read_bytes() == DATA
+    assert sessions(store) == []
+    with pytest.raises(UploadNotFoundError):
+        store.complete(upload_id, str(tmp_path / 'again.docx'))
+
+
+def test_duplicate_chunks_replace_the_earlier_copy(store):
+    upload_id = store.create('a.docx', len(DATA))['upload_id']
+    first = put(store, upload_id, 0)
+    assert put(store, upload_id, 0) == first
+    replaced = put(store, upload_id, 0, body=b'x' * 1000)
+    assert store.status(upload_id)['received'] == {0: replaced}
+    assert len(os.listdir(os.path.join(store.directory, upload_id))) == 2  # manifest and one chunk
+
+
+def test_corrupt_or_misfit_chunks_are_rejected(store):
+    upload_id = store.create('a.docx', len(DATA))['upload_id']
+    with pytest.raises(ChunkError):
+        put(store, upload_id, 0, sha='0' * 64)
+    with pytest.raises(ChunkError):
+        put(store, upload_id, 2, body=b'short')
+    with pytest.raises(ChunkError):
+        put(store, upload_id, 3)
+    assert store.status(upload_id)['missing'] == [0, 1, 2]
+    assert os.listdir(os.path.join(store.directory, upload_id)) == ['manifest.json']
+
+
+def test_failed_assembly_keeps_the_chunks(store, tmp_path):
+    upload_id = store.create('a.docx', len(DATA))['upload_id']
+    for index in range(3):
+        put(store, upload_id, index)
+    with pytest.raises(OSError):
+        store.complete(upload_id, str(tmp_path / 'missing-dir' / 'a.docx'))
+    assert sessions(store) == [upload_id]
+    assert store.status(upload_id)['missing'] == []
+    assert store.complete(upload_id, str(tmp_path / 'a.docx'))[1] == len(DATA)
+
+
+def test_reopen_after_assembly_allows_another_complete(store, tmp_path):
+    upload_id = store.create('a.docx', len(DATA))['upload_id']
+    for index in range(3):
+        put(store, upload_id, index)
+    store.assemble(upload_id, str(tmp_path / 'a.docx'))
+    # Claimed while the caller decides; a second complete cannot assemble it
+    with pytest.raises(UploadNotFoundError):
+        store.status(upload_id)
+
+    store.reopen(upload_id)
+    assert store.status(upload_id)['missing'] == []
+    store.assemble(upload_id, str(tmp_path / 'b.docx'))
+    store.finish(upload_id)
+    assert sessions(store) == []
+    assert (tmp_path / 'b.docx').read_bytes() == DATA
+
+
+def test_expire_drops_idle_sessions(store):
+    upload_id = store.create('a.docx', len(DATA))['upload_id']
+    put(store, upload_id, 0)
+    store.ttl = -1
+    assert store.expire() == 1
+    assert sessions(store) == []
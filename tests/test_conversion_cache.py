@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversion_cache import ConversionCache  # noqa: E402
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    def make(name, size):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(b'x' * size)
+        return str(path)
+    return make
+
+
+def count_scans(cache, monkeypatch):
+    scans = []
+    scan = cache._scan
+
+    def counted():
+        scans.append(1)
+        return scan()
+    monkeypatch.setattr(cache, '_scan', counted)
+    return scans
+
+
+def test_stores_under_budget_do_not_scan(tmp_path, pdf, monkeypatch):
+    cache = ConversionCache(str(tmp_path / 'cache'), 1000, rescan_interval=3600)
+    scans = count_scans(cache, monkeypatch)
+    for index in range(5):
+        assert cache.store(f"d{index}", pdf(f"d{index}", 100)) == 0
+    assert scans == [] and cache.total_bytes == 500
+
+    # Storing the same digest again replaces it rather than adding to the total
+    cache.store('d0', pdf('d0-again', 150))
+    assert scans == [] and cache.total_bytes == 550
+
+
+def test_going_over_budget_scans_and_evicts_least_recently_used(tmp_path, pdf, monkeypatch):
+    cache = ConversionCache(str(tmp_path / 'cache'), 250, rescan_interval=3600)
+    cache.store('old', pdf('old', 100))
+    cache.store('used', pdf('used', 100))
+    os.utime(cache.local_path('old'), (1, 1))
+    os.utime(cache.local_path('used'), (2, 2))
+    scans = count_scans(cache, monkeypatch)
+
+    assert cache.store('new', pdf('new', 100)) == 1
+    assert len(scans) == 1
+    assert cache.lookup('old') is None and cache.lookup('used') is not None
+    assert cache.total_bytes == 200
+
+
+def test_stale_totals_are_rescanned(tmp_path, pdf, monkeypatch):
+    cache = ConversionCache(str(tmp_path / 'cache'), 10_000, rescan_interval=0)
+    other = ConversionCache(str(tmp_path / 'cache'), 10_000)
+    other.store('theirs', pdf('theirs', 300))
+    scans = count_scans(cache, monkeypatch)
+
+    # Another worker's entry is found on disk and counted once the total is rescanned
+    assert cache.lookup('theirs').source == 'local'
+    cache.store('mine', pdf('mine', 100))
+    assert len(scans) == 1 and cache.total_bytes == 400
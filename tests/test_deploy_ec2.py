@@ -0,0 +1,218 @@
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import boto3
+import pytest
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest
+
+moto = pytest.importorskip('moto')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deploy_ec2 import EC2Manager, FleetController, ScalingPolicy, FLEET_TAG_KEY, scrape_metrics  # noqa: E402
+
+FLEET = 'test-fleet'
+
+
+def load(in_flight=0, waiting=0, duration_sum=0.0, duration_count=0.0):
+    return {'in_flight': in_flight, 'waiting': waiting, 'duration_sum': duration_sum,
+            'duration_count': duration_count}
+
+
+class FakeScrape:
+    """Answers /metrics scrapes from a dict of instance id -> load; missing ids fail like a closed port"""
+
+    def __init__(self):
+        self.loads = {}
+
+    def __call__(self, url, timeout):
+        instance_id = url.split('/')[2]
+        if instance_id not in self.loads:
+            raise OSError(f"connection refused: {url}")
+        return self.loads[instance_id]
+
+
+@pytest.fixture
+def ec2():
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        client = boto3.client('ec2', region_name='us-east-1')
+        resource = boto3.resource('ec2', region_name='us-east-1')
+        image_id = client.describe_images(Owners=['amazon'])['Images'][0]['ImageId']
+        os.environ['EC2_AMI_ID'] = image_id
+        yield EC2Manager(ec2_client=client, ec2_resource=resource)
+        os.environ.pop('EC2_AMI_ID', None)
+
+
+def controller(manager, **policy):
+    policy = dict({'min_instances': 1, 'max_instances': 10, 'slots_per_instance': 2, 'target_utilization': 1.0,
+                   'scale_out_cooldown': 300, 'scale_in_cooldown': 900, 'max_step': 4}, **policy)
+    scrape = FakeScrape()
+    # The instance id stands in for the address, so the fake scrape knows who it is asking
+    return FleetController(manager, ScalingPolicy(**policy), fleet=FLEET, metrics_url='http://{id}/metrics',
+                           scrape=scrape), scrape
+
+
+def launch(manager, count):
+    return manager.launch_instances(count, tags={FLEET_TAG_KEY: FLEET})
+
+
+def fleet_ids(manager):
+    return [instance['id'] for instance in manager.fleet_instances(FLEET)]
+
+
+def test_launches_up_to_min_instances(ec2):
+    fleet, _ = controller(ec2, min_instances=2)
+    result = fleet.step(now=0)
+    assert (result['current'], result['target'], result['reason']) == (0, 2, 'bounds')
+    assert len(fleet_ids(ec2)) == 2
+
+
+def test_terminates_down_to_max_instances(ec2):
+    fleet, scrape = controller(ec2, max_instances=2)
+    ids = launch(ec2, 3)
+    scrape.loads = {instance_id: load(in_flight=2) for instance_id in ids}
+    result = fleet.step(now=0)
+    assert (result['target'], result['reason']) == (2, 'bounds')
+    assert len(fleet_ids(ec2)) == 2
+
+
+def test_scale_out_is_limited_by_step_and_cooldown(ec2):
+    fleet, scrape = controller(ec2, max_step=2)
+    ids = launch(ec2, 1)
+    scrape.loads = {ids[0]: load(in_flight=2, waiting=10)}
+    result = fleet.step(now=0)
+    assert (result['target'], result['reason']) == (3, 'scale out')
+
+    scrape.loads = {instance_id: load(in_flight=2, waiting=10) for instance_id in fleet_ids(ec2)}
+    result = fleet.step(now=60)
+    assert (result['target'], result['reason']) == (3, 'scale-out cooldown')
+    assert len(fleet_ids(ec2)) == 3
+
+    result = fleet.step(now=400)
+    assert (result['target'], result['reason']) == (5, 'scale out')
+
+
+def test_latency_guard_adds_an_instance(ec2):
+    fleet, scrape = controller(ec2, min_instances=2, target_duration=10)
+    ids = launch(ec2, 2)
+    scrape.loads = {instance_id: load(in_flight=1, duration_sum=100, duration_count=10) for instance_id in ids}
+    assert fleet.step(now=0)['reason'] == 'steady'
+
+    # 20 more conversions averaging 30s, with the slots looking sufficient
+    scrape.loads = {instance_id: load(in_flight=1, duration_sum=400, duration_count=20) for instance_id in ids}
+    result = fleet.step(now=60)
+    assert result['avg_duration'] == pytest.approx(30)
+    assert (result['target'], result['reason']) == (3, 'scale out')
+
+
+def test_scale_in_waits_for_cooldown_and_removes_idle_instances_first(ec2):
+    fleet, scrape = controller(ec2, scale_in_cooldown=900)
+    ids = launch(ec2, 4)
+    busy = ids[0]
+    scrape.loads = {instance_id: load() for instance_id in ids}
+    scrape.loads[busy] = load(in_flight=2)
+
+    fleet.policy.last_scale_out = 0
+    assert fleet.step(now=60)['reason'] == 'scale-in cooldown'
+    assert len(fleet_ids(ec2)) == 4
+
+    result = fleet.step(now=1000)
+    assert (result['target'], result['reason']) == (1, 'scale in')
+    assert fleet_ids(ec2) == [busy]
+
+
+def test_failed_scrapes_never_scale_in(ec2):
+    fleet, scrape = controller(ec2, min_instances=4)
+    ids = launch(ec2, 8)
+    scrape.loads = {}
+    result = fleet.step(now=10000)
+    assert (result['current'], result['target'], result['reason']) == (8, 8, 'metrics incomplete')
+    assert sorted(fleet_ids(ec2)) == sorted(ids)
+
+    # Half the fleet answering idle is still not the whole fleet
+    scrape.loads = {instance_id: load() for instance_id in ids[:4]}
+    assert fleet.step(now=20000)['reason'] == 'metrics incomplete'
+    assert len(fleet_ids(ec2)) == 8
+
+
+def test_scale_in_candidates_skip_pending_and_silent_instances(ec2):
+    fleet, _ = controller(ec2)
+    now = datetime.now(timezone.utc)
+    instances = [
+        {'id': 'i-old', 'state': 'running', 'launch_time': now - timedelta(hours=2)},
+        {'id': 'i-new', 'state': 'running', 'launch_time': now - timedelta(hours=1)},
+        {'id': 'i-silent', 'state': 'running', 'launch_time': now},
+        {'id': 'i-pending', 'state': 'pending', 'launch_time': now}
+    ]
+    loads = {'i-old': load(), 'i-new': load()}
+    assert fleet.scale_in_candidates(instances, loads, 4) == ['i-new', 'i-old']
+
+
+def test_over_max_shrinks_to_max_with_a_silent_instance(ec2):
+    fleet, scrape = controller(ec2, max_instances=2)
+    ids = launch(ec2, 4)
+    scrape.loads = {instance_id: load() for instance_id in ids[:3]}
+    result = fleet.step(now=0)
+    assert (result['target'], result['reason']) == (2, 'bounds')
+    remaining = fleet_ids(ec2)
+    assert len(remaining) == 2 and ids[3] in remaining
+
+
+def metrics_rules(ec2, group_id):
+    group = ec2.ec2_client.describe_security_groups(GroupIds=[group_id])['SecurityGroups'][0]
+    return [permission for permission in group['IpPermissions'] if permission.get('FromPort') == 8000]
+
+
+def test_security_group_opens_metrics_to_its_vpc(ec2, monkeypatch):
+    monkeypatch.delenv('FLEET_METRICS_CIDR', raising=False)
+    vpc_cidr = ec2.ec2_client.describe_vpcs(Filters=[{'Name': 'isDefault', 'Values': ['true']}])['Vpcs'][0]['CidrBlock']
+    group_id = ec2.create_security_group()
+    [rule] = metrics_rules(ec2, group_id)
+    assert rule['IpRanges'][0]['CidrIp'] == vpc_cidr
+
+    # Running it again is harmless
+    assert ec2.create_security_group() == group_id
+    assert len(metrics_rules(ec2, group_id)) == 1
+
+
+def test_existing_security_group_gains_the_metrics_rule(ec2, monkeypatch):
+    monkeypatch.delenv('FLEET_METRICS_CIDR', raising=False)
+    group_id = ec2.ec2_client.create_security_group(GroupName='WordToPDFConverter-SG', Description='old')['GroupId']
+    ec2.ec2_client.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[
+        {'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
+    ])
+    assert ec2.create_security_group() == group_id
+    assert len(metrics_rules(ec2, group_id)) == 1
+
+
+def test_scrape_metrics_reads_prometheus_text():
+    registry = CollectorRegistry()
+    Gauge('pdf_conversion_in_flight', '', registry=registry).set(2)
+    Gauge('pdf_conversion_queue_depth', '', registry=registry).set(3)
+    Gauge('admission_waiting', '', registry=registry).set(1)
+    duration = Histogram('pdf_conversion_duration_seconds', '', registry=registry)
+    for seconds in (1.5, 2.5, 5.0):
+        duration.observe(seconds)
+    body = generate_latest(registry)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE_LATEST)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        result = scrape_metrics(f"http://127.0.0.1:{server.server_port}/metrics")
+    finally:
+        server.shutdown()
+    assert result == {'in_flight': 2, 'waiting': 4, 'duration_sum': 9.0, 'duration_count': 3}
@@ -0,0 +1,65 @@
+import os
+import sys
+import sqlite3
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import JobStore, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED  # noqa: E402
+
+
+def dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def set_job(store, job_id, **fields):
+    with sqlite3.connect(store.db_path) as conn:
+        for name, value in fields.items():
+            conn.execute(f'UPDATE jobs SET {name} = ? WHERE id = ?', (value, job_id))
+
+
+def test_prune_deletes_only_old_finished_jobs(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'), ttl=60)
+    old_done, old_running, new_done = (store.create(name) for name in ('a', 'b', 'c'))
+    store.update(old_done, JOB_DONE)
+    store.update(new_done, JOB_DONE)
+    store.update(old_running, JOB_RUNNING)
+    set_job(store, old_done, updated_at=0)
+    set_job(store, old_running, updated_at=0)
+
+    assert store.prune() == 1
+    assert store.get(old_done) is None
+    assert store.get(old_running)['status'] == JOB_RUNNING
+    assert store.get(new_done)['status'] == JOB_DONE
+
+
+def test_jobs_of_dead_workers_are_failed(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    mine, orphaned, finished = (store.create(name) for name in ('a', 'b', 'c'))
+    set_job(store, orphaned, owner_pid=dead_pid(), status=JOB_RUNNING)
+    set_job(store, finished, owner_pid=dead_pid())
+    store.update(finished, JOB_DONE)
+
+    assert store.fail_orphaned() == 1
+    assert store.get(mine)['status'] == JOB_QUEUED
+    assert store.get(orphaned)['status'] == JOB_FAILED
+    assert store.get(finished)['status'] == JOB_DONE
+
+    # A worker that just exited may not have been reaped yet
+    assert store.fail_orphaned(os.getpid()) == 1
+    assert store.get(mine)['status'] == JOB_FAILED
+
+
+def test_old_databases_gain_an_owner_column(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT NOT NULL, '
+                     'download_url TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)')
+        conn.execute("INSERT INTO jobs VALUES ('old', 'queued', 'a.docx', NULL, NULL, 0, 0)")
+
+    store = JobStore(path)
+    assert store.get('old')['owner_pid'] is None
+    assert store.fail_orphaned() == 1
+    assert store.get(store.create('b'))['owner_pid'] == os.getpid()
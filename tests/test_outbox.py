@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitOpenError  # noqa: E402
+from outbox import Outbox, DEAD_LETTER_DIR  # noqa: E402
+
+
+class FakeS3:
+    """Fails uploads with the queued exception, else records them"""
+
+    def __init__(self):
+        self.errors = []
+        self.uploaded = []
+
+    def upload_file(self, path, key, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.uploaded.append(key)
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(Outbox, 'start', lambda self: None)
+    source = tmp_path / 'source.pdf'
+    source.write_bytes(b'%PDF')
+    box = Outbox(str(tmp_path / 'outbox'), FakeS3(), drain_interval=30, max_attempts=3, max_backoff=60)
+    box.add(str(source), 'a.pdf', is_pdf=True)
+    return box
+
+
+def entry(box):
+    [entry_id] = box._entry_ids()
+    with open(os.path.join(box.directory, entry_id + '.json')) as f:
+        return json.load(f)
+
+
+def test_failed_uploads_back_off(outbox, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('outbox.time.time', lambda: clock[0])
+    outbox.s3_manager.errors = [ValueError('bad'), ValueError('bad')]
+
+    assert outbox.drain() == 0
+    assert entry(outbox)['retry_at'] == 1030
+
+    # Not due yet, so S3 is not called
+    clock[0] = 1029
+    assert outbox.drain() == 0 and entry(outbox)['attempts'] == 1
+
+    clock[0] = 1030
+    assert outbox.drain() == 0
+    assert entry(outbox)['retry_at'] == 1090
+
+    clock[0] = 1090
+    assert outbox.drain() == 1
+    assert outbox.s3_manager.uploaded == ['a.pdf'] and outbox.depth() == 0
+
+
+@pytest.mark.parametrize('error', [CircuitOpenError('s3'), EndpointConnectionError(endpoint_url='https://s3')])
+def test_outages_are_not_attempts(outbox, error):
+    outbox.s3_manager.errors = [error]
+    assert outbox.drain() == 0
+    assert entry(outbox)['attempts'] == 0
+
+
+def test_entries_that_keep_failing_are_dead_lettered(outbox, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('outbox.time.time', lambda: clock[0])
+    outbox.s3_manager.errors = [ValueError('bad')] * 3
+    for _ in range(3):
+        outbox.drain()
+        clock[0] += 3600
+
+    assert outbox.depth() == 0 and outbox.dead_letter_depth() == 1
+    dead = os.listdir(os.path.join(outbox.directory, DEAD_LETTER_DIR))
+    assert sorted(name.rsplit('.', 1)[1] for name in dead) == ['data', 'json']
+    assert outbox.drain() == 0 and outbox.s3_manager.uploaded == []
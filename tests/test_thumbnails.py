@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import zlib
+import struct
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+docx = pytest.importorskip('docx')
+from docx import Document  # noqa: E402
+
+import word_to_pdf  # noqa: E402
+from office_pool import OfficeInstance  # noqa: E402
+from thumbnails import PNG_SIGNATURE, render_page  # noqa: E402
+from word_to_pdf import PATH_FAST, PATH_OFFICE, convert_document, pdf_page_count  # noqa: E402
+
+
+def read_png(path):
+    """(width, height, rows of RGB bytes) of an 8-bit RGB PNG, checking every chunk's CRC"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.startswith(PNG_SIGNATURE)
+    offset, chunks = len(PNG_SIGNATURE), {}
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = chunks.get(kind, b'') + body
+        offset += 12 + length
+    assert kind == b'IEND'
+    width, height, depth, colour_type = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    assert (depth, colour_type) == (8, 2)
+    raw = zlib.decompress(chunks[b'IDAT'])
+    stride = 1 + width * 3
+    assert len(raw) == stride * height
+    return width, height, [raw[row * stride + 1:(row + 1) * stride] for row in range(height)]
+
+
+def report(tmp_path, paragraphs=5):
+    document = Document()
+    document.add_heading('Quarterly report', level=1)
+    for _ in range(paragraphs):
+        document.add_paragraph('Revenue grew in every region. ' * 20)
+    table = document.add_table(rows=2, cols=2)
+    table.style = 'Table Grid'
+    path = tmp_path / 'report.docx'
+    document.save(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def fast_path(monkeypatch):
+    monkeypatch.setenv('CONVERTER_FAST_PATH', 'auto')
+    monkeypatch.setenv('THUMBNAIL_WIDTH', '200')
+
+
+def test_fast_path_thumbnail_matches_the_first_page(tmp_path, fast_path):
+    thumbnail = str(tmp_path / 'report.png')
+
+    result = convert_document(report(tmp_path, paragraphs=40), str(tmp_path / 'report.pdf'), thumbnail_path=thumbnail)
+
+    assert result.path == PATH_FAST
+    assert result.thumbnail_path == thumbnail
+    assert result.pages > 1
+    assert result.pages == pdf_page_count(result.output_path)
+    width, height, rows = read_png(thumbnail)
+    # Letter or A4 portrait: taller than wide, in the page's proportions
+    assert width == 200
+    assert 1.2 < height / width < 1.5
+    white = b'\xff' * (width * 3)
+    assert rows[0] == white
+    assert any(row != white for row in rows)
+
+
+def test_render_page_scales_to_the_requested_width(tmp_path, fast_path):
+    document = Document(report(tmp_path))
+    writer = word_to_pdf.render_fast_path(document, str(tmp_path / 'report.pdf'))
+    page = writer.pages[0]
+
+    render_page(page, str(tmp_path / 'small.png'), 64)
+
+    width, height, _ = read_png(str(tmp_path / 'small.png'))
+    assert (width, height) == (64, round(page.height * 64 / page.width))
+
+
+def test_no_thumbnail_when_disabled(tmp_path, fast_path, monkeypatch):
+    monkeypatch.setenv('THUMBNAIL_WIDTH', '0')
+    thumbnail = str(tmp_path / 'report.png')
+
+    result = convert_document(report(tmp_path, paragraphs=1), str(tmp_path / 'report.pdf'), thumbnail_path=thumbnail)
+
+    assert result.thumbnail_path is None
+    assert not os.path.exists(thumbnail)
+    assert result.pages == 1
+
+
+def test_office_pool_reports_pages_and_thumbnail(tmp_path, monkeypatch):
+    calls = []
+
+    def run_supervised(cmd, timeout, label=None):
+        calls.append(cmd)
+        request = json.loads(cmd[-1])
+        with open(cmd[5], 'wb') as f:
+            f.write(b'%PDF-1.4\n%%EOF\n')
+        with open(request['path'], 'wb') as f:
+            f.write(PNG_SIGNATURE)
+        return subprocess.CompletedProcess(cmd, 0, stdout='{"pages": 3}\n', stderr='')
+
+    monkeypatch.setattr('office_pool.run_supervised', run_supervised)
+    instance = OfficeInstance(0, 'soffice', str(tmp_path), sys.executable, 30)
+    monkeypatch.setattr(instance, 'is_alive', lambda: True)
+    monkeypatch.setattr(word_to_pdf, 'get_office_pool', lambda: instance)
+    monkeypatch.setenv('CONVERTER_FAST_PATH', 'off')
+    monkeypatch.setenv('THUMBNAIL_WIDTH', '128')
+    thumbnail = str(tmp_path / 'report.png')
+
+    result = convert_document(report(tmp_path), str(tmp_path / 'report.pdf'), thumbnail_path=thumbnail)
+
+    assert result.path == PATH_OFFICE
+    assert result.pages == 3
+    assert result.thumbnail_path == thumbnail
+    assert json.loads(calls[0][-1]) == {'path': os.path.abspath(thumbnail), 'width': 128}
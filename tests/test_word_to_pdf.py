@@ -0,0 +1,170 @@
+import os
+import re
+import sys
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+docx = pytest.importorskip('docx')
+from docx import Document  # noqa: E402
+from docx.oxml import OxmlElement  # noqa: E402
+from docx.oxml.ns import qn  # noqa: E402
+from docx.shared import Inches  # noqa: E402
+
+import word_to_pdf  # noqa: E402
+from thumbnails import write_png  # noqa: E402
+from word_to_pdf import PATH_FAST, PATH_OFFICE, classify_document, convert_document, pdf_page_count  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def office(monkeypatch):
+    """Stand in for LibreOffice: record the documents sent to it and write a one-page PDF"""
+    sent = []
+
+    def convert(input_path, output_path, timeout, profile):
+        sent.append(input_path)
+        with open(output_path, 'wb') as f:
+            f.write(b'%PDF-1.4\n1 0 obj\n<< /Type /Pages /Kids [] /Count 1 >>\nendobj\n%%EOF\n')
+
+    monkeypatch.setenv('CONVERTER_FAST_PATH', 'auto')
+    monkeypatch.setattr(word_to_pdf, 'get_office_pool', lambda: None)
+    monkeypatch.setattr(word_to_pdf, '_convert_with_libreoffice', convert)
+    return sent
+
+
+def text_document():
+    document = Document()
+    document.add_heading('Quarterly report', level=1)
+    document.add_paragraph('Revenue grew in every region. ' * 40)
+    document.add_paragraph('First point', style='List Bullet')
+    document.add_paragraph('Second point', style='List Number')
+    return document
+
+
+def add_table(document, rows=3, cols=3, style='Table Grid'):
+    table = document.add_table(rows=rows, cols=cols)
+    table.style = style
+    for row in table.rows:
+        for cell in row.cells:
+            cell.text = 'cell'
+    return table
+
+
+def add_field(document):
+    field = OxmlElement('w:fldSimple')
+    field.set(qn('w:instr'), 'PAGE')
+    document.add_paragraph('Page ')._p.append(field)
+
+
+def add_image(document, tmp_path):
+    image = tmp_path / 'image.png'
+    write_png(str(image), 8, [bytearray(b'\x80' * 24) for _ in range(8)])
+    document.add_picture(str(image), width=Inches(1))
+
+
+def save(document, tmp_path, name='document'):
+    path = tmp_path / f"{name}.docx"
+    document.save(str(path))
+    return str(path)
+
+
+def assert_parses(pdf_path):
+    """Check the header, trailer and that every xref entry points at its object"""
+    with open(pdf_path, 'rb') as f:
+        data = f.read()
+    assert data.startswith(b'%PDF-1.')
+    assert data.rstrip().endswith(b'%%EOF')
+    xref = int(re.search(rb'startxref\s+(\d+)\s+%%EOF\s*$', data).group(1))
+    assert data[xref:].startswith(b'xref')
+    size = int(re.search(rb'/Size (\d+)', data[xref:]).group(1))
+    entries = re.findall(rb'(\d{10}) (\d{5}) ([nf]) ?\r?\n', data[xref:])[:size]
+    assert len(entries) == size
+    for number, (offset, _, kind) in enumerate(entries):
+        if kind == b'n':
+            assert data[int(offset):].startswith(b'%d 0 obj' % number)
+
+
+def test_plain_document_is_accepted():
+    document = text_document()
+    add_table(document)
+    add_table(document, style=None)
+
+    assert classify_document(document) == []
+
+
+@pytest.mark.parametrize('build, feature', [
+    (lambda document, tmp_path: add_image(document, tmp_path), 'image'),
+    (lambda document, tmp_path: add_field(document), 'field'),
+    (lambda document, tmp_path: add_table(document, style='Light Grid Accent 1'), 'table_style'),
+    (lambda document, tmp_path: add_table(document).cell(0, 0).merge(document.tables[0].cell(0, 1)), 'merged_cells'),
+    (lambda document, tmp_path: add_table(document).cell(1, 1).add_table(1, 1), 'nested_table'),
+])
+def test_unsupported_features_are_flagged(tmp_path, build, feature):
+    document = text_document()
+    build(document, tmp_path)
+
+    assert feature in classify_document(document)
+
+
+def test_fast_path_writes_a_pdf_that_parses(tmp_path, office):
+    document = text_document()
+    add_table(document)
+    source = save(document, tmp_path)
+
+    result = convert_document(source, str(tmp_path / 'out.pdf'))
+
+    assert result.path == PATH_FAST
+    assert office == []
+    assert_parses(result.output_path)
+    assert result.pages >= 1
+    assert pdf_page_count(result.output_path) == result.pages
+
+
+def test_long_document_spans_pages(tmp_path, office):
+    document = Document()
+    for _ in range(200):
+        document.add_paragraph('A line of body text that fills the page. ' * 3)
+    source = save(document, tmp_path)
+
+    result = convert_document(source, str(tmp_path / 'out.pdf'))
+
+    assert result.path == PATH_FAST
+    assert result.pages > 1
+    assert_parses(result.output_path)
+
+
+@pytest.mark.parametrize('build', [
+    lambda document, tmp_path: add_image(document, tmp_path),
+    lambda document, tmp_path: add_field(document),
+    lambda document, tmp_path: add_table(document).cell(0, 0).merge(document.tables[0].cell(0, 1)),
+])
+def test_unsupported_documents_go_to_the_office_suite(tmp_path, office, build):
+    document = text_document()
+    build(document, tmp_path)
+    source = save(document, tmp_path)
+
+    result = convert_document(source, str(tmp_path / 'out.pdf'))
+
+    assert result.path == PATH_OFFICE
+    assert office == [source]
+
+
+def test_fast_path_can_be_switched_off(tmp_path, office, monkeypatch):
+    source = save(text_document(), tmp_path)
+    monkeypatch.setenv('CONVERTER_FAST_PATH', 'off')
+
+    result = convert_document(source, str(tmp_path / 'out.pdf'))
+
+    assert result.path == PATH_OFFICE
+    assert office == [source]
+
+
+def test_importing_the_converter_does_not_load_docx():
+    code = 'import sys, word_to_pdf; print(sorted(m for m in sys.modules if m.split(".")[0] == "docx"))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, LOG_STDERR='0')).stdout
+    assert output.strip() == '[]'
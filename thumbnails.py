@@ -0,0 +1,88 @@
+import os
+import zlib
+import struct
+from pdf_writer import text_width
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# At thumbnail size text is unreadable anyway, so it is drawn as bars of
+# this much of its colour over white ("greeking"), as word processors do
+TEXT_INK = 0.55
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+# Share of the font size a greeked line covers above the baseline
+TEXT_HEIGHT = 0.6
+
+
+def thumbnail_width():
+    """Thumbnail width in pixels from THUMBNAIL_WIDTH (default 256); 0 disables thumbnails"""
+    return int(os.getenv('THUMBNAIL_WIDTH', '256'))
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def write_png(path, width, rows):
+    """
+    Write an 8-bit RGB PNG
+    Args:
+        path (str): Output file path
+        width (int): Image width in pixels
+        rows (list): One bytearray of width * 3 bytes per pixel row, top to bottom
+    """
+    raw = b''.join(b'\x00' + bytes(row) for row in rows)
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        f.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, len(rows), 8, 2, 0, 0, 0)))
+        f.write(_chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(_chunk(b'IEND', b''))
+
+
+def _ink(color, share):
+    color = tuple(round(c * 255) for c in color) if color else BLACK
+    return bytes(round(255 - (255 - c) * share) for c in color)
+
+
+def render_page(page, path, width):
+    """
+    Draw a fast-path page as a small PNG from the shapes it recorded
+    Args:
+        page (PdfPage): The page, as laid out by the fast path
+        path (str): Output file path
+        width (int): Thumbnail width in pixels; the height follows the page
+    """
+    scale = width / page.width
+    height = max(1, round(page.height * scale))
+    rows = [bytearray(bytes(WHITE) * width) for _ in range(height)]
+
+    def fill(left, top, right, bottom, pixel):
+        # PDF user space to pixels: y grows downwards, at least one pixel each way
+        x0 = min(max(int(left * scale), 0), width - 1)
+        x1 = min(max(int(right * scale + 0.5), x0 + 1), width)
+        y0 = min(max(int((page.height - top) * scale), 0), height - 1)
+        y1 = min(max(int((page.height - bottom) * scale + 0.5), y0 + 1), height)
+        span = pixel * (x1 - x0)
+        for y in range(y0, y1):
+            rows[y][x0 * 3:x1 * 3] = span
+
+    for shape in page.shapes:
+        kind = shape[0]
+        if kind == 'text':
+            _, x, y, text, font, size, color = shape
+            if text.strip():
+                bold = font in ('bold', 'bold_italic')
+                fill(x, y + size * TEXT_HEIGHT, x + text_width(text, size, bold), y, _ink(color, TEXT_INK))
+        elif kind == 'line':
+            _, x1, y1, x2, y2 = shape
+            fill(min(x1, x2), max(y1, y2), max(x1, x2), min(y1, y2), _ink(None, TEXT_INK))
+        elif kind == 'rect':
+            _, x, y, w, h = shape
+            pixel = _ink(None, TEXT_INK)
+            fill(x, y + h, x + w, y + h, pixel)
+            fill(x, y, x + w, y, pixel)
+            fill(x, y + h, x, y, pixel)
+            fill(x + w, y + h, x + w, y, pixel)
+
+    write_png(path, width, rows)
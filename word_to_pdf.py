@@ -1,31 +1,96 @@
 import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
 import logging
+import tempfile
+import threading
 import subprocess
 import sys
 from pathlib import Path
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from collections import namedtuple
+from pdf_writer import PdfWriter, can_encode, text_width
+from office_pool import get_office_pool, OfficePoolError
+from office_watchdog import (
+    ConversionTimeoutError, run_supervised, job_timeout, cpu_limit_for, memory_limit,
+    owner_env, limited, kill_process_group, failure_reason, REASON_ERROR
 )
+from export_profiles import PROFILES, get_profile, export_filter, finish_pdf
+from thumbnails import thumbnail_width, render_page
+from metrics import CONVERSION_FAILURE_REASONS, CONVERSION_PATH_COUNT, CONVERSION_PATH_DURATION, FAST_PATH_REJECTED
+
 logger = logging.getLogger(__name__)
 
-def convert_word_to_pdf(input_path, output_path=None):
+# Which converter produced a PDF
+PATH_FAST = 'fast'
+PATH_OFFICE = 'office'
+PATH_DOCX2PDF = 'docx2pdf'
+
+# Outcome of convert_document: path is one of the PATH_* values; pages and
+# thumbnail_path are None when the converter that ran could not provide them
+ConversionResult = namedtuple('ConversionResult', ['output_path', 'path', 'duration', 'pages', 'thumbnail_path'],
+                              defaults=(None, None))
+
+# Finds the page tree's page count in a PDF that does not use object streams
+_PAGE_TREE_COUNT = re.compile(rb'/Type\s*/Pages\b(?:(?!endobj).)*?/Count\s+(\d+)', re.DOTALL)
+
+def convert_word_to_pdf(input_path, output_path=None, timeout=None, profile=None):
     """
     Convert a Word document to PDF using LibreOffice or Microsoft Word
     Args:
         input_path (str): Path to the input Word document
         output_path (str, optional): Path for the output PDF file
+        timeout (float, optional): Wall-clock limit in seconds; scales with file size by default
+        profile (str, optional): Export profile (web, print, archive); PDF_EXPORT_PROFILE by default
     Returns:
         str: Path to the converted PDF file
     """
+    return convert_document(input_path, output_path, timeout, profile).output_path
+
+
+def convert_document(input_path, output_path=None, timeout=None, profile=None, thumbnail_path=None):
+    """
+    Convert a Word document to PDF, rendering simple documents in-process and
+    sending the rest to LibreOffice or Microsoft Word
+
+    The page count and first-page thumbnail come out of the same document load
+    as the PDF: the fast path draws the thumbnail from its own layout and the
+    office pool exports it from the already opened document. The one-shot
+    office and Word paths produce no thumbnail.
+    Args:
+        input_path (str): Path to the input Word document
+        output_path (str, optional): Path for the output PDF file
+        timeout (float, optional): Wall-clock limit in seconds; scales with file size by default
+        profile (str or ExportProfile, optional): Export profile; PDF_EXPORT_PROFILE by default
+        thumbnail_path (str, optional): Where to write a PNG of the first page,
+            THUMBNAIL_WIDTH pixels wide; no thumbnail when None
+    Returns:
+        ConversionResult: The PDF path, which converter produced it, the page count and the thumbnail
+    Raises:
+        UnknownProfileError: If the profile name is not known
+    """
+    profile = get_profile(profile)
+    start_time = time.monotonic()
+    pages = None
+    width = thumbnail_width() if thumbnail_path else 0
     try:
         # Generate output PDF path if not provided
         if output_path is None:
             output_path = os.path.splitext(input_path)[0] + '.pdf'
+        if timeout is None:
+            timeout = job_timeout(os.path.getsize(input_path))
 
-        if sys.platform.startswith('win'):
+        writer = _convert_fast(input_path, output_path) if profile.fast_path and fast_path_mode() == 'auto' else None
+        if writer is not None:
+            path = PATH_FAST
+            pages = len(writer.pages)
+            if width > 0 and writer.pages:
+                render_page(writer.pages[0], thumbnail_path, width)
+        elif sys.platform.startswith('win'):
+            path = PATH_DOCX2PDF
             # Use docx2pdf on Windows
             from docx2pdf import convert
             import pythoncom
@@ -35,34 +100,1021 @@ def convert_word_to_pdf(input_path, output_path=None):
             finally:
                 pythoncom.CoUninitialize()
         else:
-            # Use LibreOffice on Linux/Unix
-            input_file = Path(input_path).absolute()
-            output_dir = Path(output_path).parent.absolute()
-            
-            # Convert using LibreOffice
-            cmd = [
-                'libreoffice',
-                '--headless',
-                '--convert-to',
-                'pdf',
-                '--outdir',
-                str(output_dir),
-                str(input_file)
-            ]
-            
-            process = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            
-            if process.returncode != 0:
-                raise Exception(f"LibreOffice conversion failed: {process.stderr}")
-        
-        logger.info(f"Successfully converted {input_path} to {output_path}")
-        return output_path
+            path = PATH_OFFICE
+            # Prefer a warm pooled office instance; fall back to a one-shot process
+            pool = get_office_pool()
+            converted = False
+            if pool is not None:
+                try:
+                    outputs = pool.convert(input_path, output_path, timeout=timeout, filter_data=profile.filter_data,
+                                           thumbnail=(thumbnail_path, width) if width > 0 else None)
+                    pages = outputs.get('pages')
+                    converted = True
+                except OfficePoolError as e:
+                    # Timeouts and kills are not retried: a document that hung
+                    # a warm instance would only hang the one-shot process too
+                    logger.warning(f"Office pool conversion failed, falling back to one-shot: {str(e)}")
+
+            if not converted:
+                _convert_with_libreoffice(input_path, output_path, timeout, profile)
+
+        if pages is None:
+            # Before finish_pdf, which may pack the page tree into an object stream
+            pages = pdf_page_count(output_path)
+        finish_pdf(input_path, output_path, profile)
+        duration = time.monotonic() - start_time
+        CONVERSION_PATH_COUNT.labels(path=path).inc()
+        CONVERSION_PATH_DURATION.labels(path=path).observe(duration)
+        logger.info(f"Successfully converted {input_path} to {output_path} ({path} path, {duration:.2f}s)")
+        if not (thumbnail_path and os.path.exists(thumbnail_path)):
+            thumbnail_path = None
+        return ConversionResult(output_path, path, duration, pages, thumbnail_path)
         
     except Exception as e:
         logger.error(f"Error converting {input_path} to PDF: {str(e)}")
-        raise 
\ No newline at end of file
+        CONVERSION_FAILURE_REASONS.labels(reason=failure_reason(e)).inc()
+        raise
+
+
+def pdf_page_count(pdf_path):
+    """
+    Read the page count from a PDF's page tree
+    Args:
+        pdf_path (str): The PDF, as written by LibreOffice or the fast path
+    Returns:
+        int: Number of pages, or None if the page tree could not be found
+    """
+    try:
+        with open(pdf_path, 'rb') as f:
+            counts = [int(count) for count in _PAGE_TREE_COUNT.findall(f.read())]
+    except OSError:
+        return None
+    # Intermediate page tree nodes count their subtree; the root counts everything
+    return max(counts) if counts else None
+
+
+def _convert_with_libreoffice(input_path, output_path, timeout, profile):
+    """
+    Convert a document by starting a one-shot headless LibreOffice process
+    Args:
+        input_path (str): Path to the input Word document
+        output_path (str): Path for the output PDF file
+        timeout (float): Seconds before the process group is killed
+        profile (ExportProfile): Export profile selecting the PDF filter options
+    """
+    input_file = Path(input_path).absolute()
+    output_dir = Path(output_path).parent.absolute()
+    
+    # Convert using LibreOffice
+    cmd = [
+        'libreoffice',
+        '--headless',
+        '--convert-to',
+        export_filter(profile),
+        '--outdir',
+        str(output_dir),
+        str(input_file)
+    ]
+    
+    process = run_supervised(cmd, timeout, cpu_seconds=cpu_limit_for(timeout), memory_bytes=memory_limit())
+    
+    if process.returncode != 0:
+        raise Exception(f"LibreOffice conversion failed: {process.stderr}")
+
+
+def convert_batch(input_paths, output_dir, profile=None):
+    """
+    Convert many Word documents with a single LibreOffice invocation
+    Args:
+        input_paths (list): Paths to the input documents; file stems must be unique
+        output_dir (str): Directory for the PDF files
+        profile (str or ExportProfile, optional): Export profile; PDF_EXPORT_PROFILE by default
+    Yields:
+        tuple: (input_path, output_path, error) for each document as it finishes.
+        output_path is None and error is set when that document failed.
+    """
+    profile = get_profile(profile)
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [(input_path, os.path.join(output_dir, Path(input_path).stem + '.pdf'))
+               for input_path in input_paths]
+
+    if sys.platform.startswith('win'):
+        # docx2pdf has no batch mode worth using; convert one at a time
+        for input_path, output_path in pending:
+            try:
+                yield input_path, convert_word_to_pdf(input_path, output_path, profile=profile), None
+            except Exception as e:
+                yield input_path, None, str(e)
+        return
+
+    # A private profile keeps the batch from colliding with other office processes
+    profile_dir = tempfile.mkdtemp(prefix='word-to-pdf-batch-')
+    cmd = [
+        'libreoffice',
+        f"-env:UserInstallation={Path(profile_dir).as_uri()}",
+        '--headless',
+        '--convert-to',
+        export_filter(profile),
+        '--outdir',
+        str(Path(output_dir).absolute())
+    ] + [str(Path(input_path).absolute()) for input_path, _ in pending]
+
+    # The whole batch shares one deadline: the sum of the per-document budgets
+    timeout = sum(job_timeout(os.path.getsize(input_path)) for input_path, _ in pending)
+    deadline = time.monotonic() + timeout
+    process = subprocess.Popen(
+        limited(cmd, memory_bytes=memory_limit()),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        env=owner_env()
+    )
+    try:
+        while pending:
+            finished = process.poll() is not None
+
+            if not finished and time.monotonic() > deadline:
+                kill_process_group(process)
+                process.wait()
+                logger.error(f"Killed batch conversion after {timeout:.0f}s timeout")
+                # Anything still pending was unfinished, even if a partial PDF exists
+                for input_path, output_path in pending:
+                    CONVERSION_FAILURE_REASONS.labels(reason=ConversionTimeoutError.reason).inc()
+                    yield input_path, None, "Conversion timed out"
+                return
+
+            # LibreOffice converts its arguments in order, so a document is
+            # complete once a later output exists or the process has exited
+            if finished:
+                done = len(pending)
+            else:
+                done = 0
+                for index, (_, output_path) in enumerate(pending):
+                    if os.path.exists(output_path):
+                        done = index
+
+            for input_path, output_path in pending[:done]:
+                if os.path.exists(output_path):
+                    finish_pdf(input_path, output_path, profile)
+                    logger.info(f"Successfully converted {input_path} to {output_path}")
+                    yield input_path, output_path, None
+                else:
+                    logger.error(f"Error converting {input_path} to PDF in batch")
+                    CONVERSION_FAILURE_REASONS.labels(reason=REASON_ERROR).inc()
+                    yield input_path, None, "LibreOffice produced no PDF"
+            pending = pending[done:]
+
+            if pending:
+                time.sleep(0.2)
+    finally:
+        kill_process_group(process)
+        if process.poll() is None:
+            process.wait()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def warm_up(directory, profile=None):
+    """
+    Convert a tiny built-in document on every converter path this process
+    uses, so the first real request does not pay for cold starts
+    Args:
+        directory (str): Scratch directory for the document and its PDFs
+        profile (str, optional): Export profile; PDF_EXPORT_PROFILE by default
+    Returns:
+        dict: Seconds taken, by converter path
+    Raises:
+        Exception: If a converter could not convert the document
+    """
+    from docx import Document
+
+    profile = get_profile(profile)
+    source = os.path.join(directory, 'warmup.docx')
+    document = Document()
+    document.add_paragraph('Warm-up')
+    document.save(source)
+
+    timings = {}
+    if profile.fast_path and fast_path_mode() == 'auto':
+        start_time = time.monotonic()
+        if _convert_fast(source, os.path.join(directory, 'warmup-fast.pdf')) is not None:
+            timings[PATH_FAST] = time.monotonic() - start_time
+
+    # docx2pdf drives Word through COM on every call; there is nothing to keep warm
+    if sys.platform.startswith('win'):
+        return timings
+
+    start_time = time.monotonic()
+    output_path = os.path.join(directory, 'warmup.pdf')
+    timeout = job_timeout(os.path.getsize(source))
+    pool = get_office_pool()
+    converted = False
+    if pool is not None:
+        try:
+            pool.convert(source, output_path, timeout=timeout, filter_data=profile.filter_data)
+            converted = True
+        except OfficePoolError as e:
+            logger.warning(f"Office pool warm-up failed, warming the one-shot path instead: {str(e)}")
+    if not converted:
+        # Without a pool this still pays off: the office binaries land in the
+        # page cache and the font cache gets built
+        _convert_with_libreoffice(source, output_path, timeout, profile)
+    timings[PATH_OFFICE] = time.monotonic() - start_time
+    return timings
+
+
+# --- Fast path: render simple documents in-process without an office suite ---
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+POINTS_PER_TWIP = 1 / 20.0
+
+# Elements that make a document unsuitable for the fast path, by the feature they imply
+UNSUPPORTED_ELEMENTS = {
+    'drawing': 'image', 'pict': 'image', 'object': 'embedded_object',
+    'fldSimple': 'field', 'fldChar': 'field', 'instrText': 'field',
+    'footnoteReference': 'footnote', 'endnoteReference': 'endnote', 'commentReference': 'comment',
+    'ins': 'tracked_changes', 'del': 'tracked_changes', 'moveFrom': 'tracked_changes', 'moveTo': 'tracked_changes',
+    'sdt': 'content_control', 'txbxContent': 'text_box', 'AlternateContent': 'alternate_content',
+    'oMath': 'math', 'oMathPara': 'math', 'framePr': 'frame', 'ruby': 'ruby', 'altChunk': 'embedded_document',
+    'smartTag': 'custom_xml', 'customXml': 'custom_xml', 'bidi': 'right_to_left', 'rtl': 'right_to_left',
+    'gridSpan': 'merged_cells', 'vMerge': 'merged_cells', 'hMerge': 'merged_cells',
+    'headerReference': 'header_footer', 'footerReference': 'header_footer',
+    'sym': 'symbol', 'ptab': 'positional_tab',
+}
+PARAGRAPH_CHILDREN = {'pPr', 'r', 'hyperlink', 'bookmarkStart', 'bookmarkEnd', 'proofErr'}
+SUPPORTED_TABLE_STYLES = {None, 'Normal Table', 'Table Grid'}
+SUPPORTED_NUMBER_FORMATS = {'bullet', 'decimal', 'lowerLetter', 'upperLetter'}
+
+FAST_PATH_MODES = ('auto', 'off')
+CELL_PADDING = 4.0
+LIST_INDENT = 18.0
+
+
+class FastPathUnsupported(Exception):
+    """The document uses something the fast path cannot render faithfully"""
+
+    def __init__(self, feature):
+        super().__init__(f"Fast path does not support: {feature}")
+        self.feature = feature
+
+
+def fast_path_mode():
+    """
+    Fast path setting from CONVERTER_FAST_PATH: 'auto' renders simple
+    documents in-process, 'off' sends everything to the office suite
+    """
+    mode = os.getenv('CONVERTER_FAST_PATH', 'auto').lower()
+    return mode if mode in FAST_PATH_MODES else 'auto'
+
+
+def _w(name):
+    return f"{{{W_NS}}}{name}"
+
+
+def _local_name(element):
+    tag = element.tag
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else None
+
+
+def _numbering_format(document, num_id, level):
+    """numFmt of a numbering instance level, or None if it cannot be resolved"""
+    try:
+        numbering = document.part.numbering_part.element
+    except (KeyError, NotImplementedError):
+        return None
+    abstract_ids = numbering.xpath(f'./w:num[@w:numId="{num_id}"]/w:abstractNumId/@w:val')
+    if not abstract_ids:
+        return None
+    formats = numbering.xpath(
+        f'./w:abstractNum[@w:abstractNumId="{abstract_ids[0]}"]/w:lvl[@w:ilvl="{level}"]/w:numFmt/@w:val')
+    return formats[0] if formats else None
+
+
+def _numbering(paragraph, resolver):
+    """(numId, level) from the paragraph or its style chain, or None"""
+    sources = [paragraph._p.pPr] + [style.element.pPr for style in resolver.paragraph_chain(paragraph)]
+    for pPr in sources:
+        if pPr is None or pPr.numPr is None:
+            continue
+        num_id = pPr.numPr.numId.val if pPr.numPr.numId is not None else None
+        level = pPr.numPr.ilvl.val if pPr.numPr.ilvl is not None else 0
+        if num_id:
+            return num_id, level
+        return None
+    return None
+
+
+def classify_document(document):
+    """
+    List the constructs in a document that the fast path cannot render
+    Args:
+        document (Document): The python-docx document
+    Returns:
+        list: Unsupported feature names; empty if the fast path can take it
+    """
+    features = []
+
+    def flag(feature):
+        if feature not in features:
+            features.append(feature)
+
+    body = document.element.body
+    for element in body.iter():
+        name = _local_name(element)
+        if name in UNSUPPORTED_ELEMENTS:
+            flag(UNSUPPORTED_ELEMENTS[name])
+        elif name == 'cols' and int(element.get(_w('num'), '1')) > 1:
+            flag('columns')
+        elif name == 'sectPr' and element.getparent() is not body:
+            flag('sections')
+        elif name == 'p':
+            for child in element:
+                if _local_name(child) not in PARAGRAPH_CHILDREN and _local_name(child) is not None:
+                    flag(_local_name(child))
+        elif name == 'tbl' and any(_local_name(parent) == 'tbl' for parent in element.iterancestors()):
+            flag('nested_table')
+
+    text = ''.join(node.text or '' for node in body.iter(_w('t')))
+    if not can_encode(text):
+        flag('unicode_text')
+
+    for table in document.tables:
+        style = table.style.name if table.style is not None else None
+        if style not in SUPPORTED_TABLE_STYLES:
+            flag('table_style')
+
+    resolver = _StyleResolver(document)
+    for paragraph in document.paragraphs:
+        numbering = _numbering(paragraph, resolver)
+        if numbering is not None:
+            number_format = _numbering_format(document, *numbering)
+            if number_format is not None and number_format not in SUPPORTED_NUMBER_FORMATS:
+                flag('numbering')
+
+    return features
+
+
+class _StyleResolver:
+    """
+    Effective run and paragraph formatting, following style inheritance
+
+    python-docx finds a style by scanning every style in the document, so the
+    style chains are looked up once here and reused for every run.
+    """
+
+    def __init__(self, document):
+        from docx.enum.style import WD_STYLE_TYPE
+
+        styles = document.styles
+        self._styles = {style.style_id: style for style in styles}
+        self._default_paragraph = styles.default(WD_STYLE_TYPE.PARAGRAPH)
+        self._default_character = styles.default(WD_STYLE_TYPE.CHARACTER)
+        self._chains = {}
+        self.default_size = 11.0
+        self.default_after = 0.0
+        self.default_line = 1.0
+        defaults = document.styles.element.find(_w('docDefaults'))
+        if defaults is not None:
+            size = defaults.find(f"{_w('rPrDefault')}/{_w('rPr')}/{_w('sz')}")
+            if size is not None:
+                self.default_size = int(size.get(_w('val'))) / 2.0
+            spacing = defaults.find(f"{_w('pPrDefault')}/{_w('pPr')}/{_w('spacing')}")
+            if spacing is not None:
+                self.default_after = int(spacing.get(_w('after'), '0')) * POINTS_PER_TWIP
+                if spacing.get(_w('lineRule'), 'auto') == 'auto' and spacing.get(_w('line')):
+                    self.default_line = int(spacing.get(_w('line'))) / 240.0
+
+    def _chain(self, style_id, default):
+        key = (style_id, default.style_id if default is not None else None)
+        if key not in self._chains:
+            chain = []
+            style = self._styles.get(style_id, default) if style_id else default
+            while style is not None and style not in chain:
+                chain.append(style)
+                base_id = style.element.basedOn_val
+                style = self._styles.get(base_id) if base_id else None
+            self._chains[key] = chain
+        return self._chains[key]
+
+    def paragraph_chain(self, paragraph):
+        """The paragraph's style followed by the styles it is based on"""
+        return self._chain(paragraph._p.style, self._default_paragraph)
+
+    def paragraph_style_name(self, paragraph):
+        chain = self.paragraph_chain(paragraph)
+        return chain[0].name if chain else None
+
+    def run_chain(self, run):
+        return self._chain(run._r.style, self._default_character)
+
+    def font(self, run, paragraph, attribute):
+        value = getattr(run.font, attribute)
+        if value is not None:
+            return value
+        for style in self.run_chain(run) + self.paragraph_chain(paragraph):
+            value = getattr(style.font, attribute)
+            if value is not None:
+                return value
+        return None
+
+    def color(self, run, paragraph):
+        for font in [run.font] + [style.font for style in self.run_chain(run) + self.paragraph_chain(paragraph)]:
+            if font.color is not None and font.color.rgb is not None:
+                rgb = font.color.rgb
+                return tuple(channel / 255.0 for channel in (rgb[0], rgb[1], rgb[2]))
+        return None
+
+    def paragraph_format(self, paragraph, attribute):
+        value = getattr(paragraph.paragraph_format, attribute)
+        if value is not None:
+            return value
+        for style in self.paragraph_chain(paragraph):
+            value = getattr(style.paragraph_format, attribute)
+            if value is not None:
+                return value
+        return None
+
+    def contextual_spacing(self, paragraph):
+        for style in self.paragraph_chain(paragraph):
+            pPr = style.element.pPr
+            if pPr is not None and pPr.find(_w('contextualSpacing')) is not None:
+                return True
+        return False
+
+
+def _run_pieces(paragraph, resolver):
+    """Text pieces of a paragraph: (text, bold, italic, size, color, underline); '\n' and '\f' are breaks"""
+    from docx.text.run import Run
+
+    pieces = []
+    for element in paragraph._p.xpath('./w:r | ./w:hyperlink/w:r'):
+        run = Run(element, paragraph)
+        bold = bool(resolver.font(run, paragraph, 'bold'))
+        italic = bool(resolver.font(run, paragraph, 'italic'))
+        size = resolver.font(run, paragraph, 'size')
+        size = size.pt if size is not None else resolver.default_size
+        color = resolver.color(run, paragraph)
+        underline = bool(resolver.font(run, paragraph, 'underline'))
+        caps = bool(resolver.font(run, paragraph, 'all_caps'))
+        for child in element:
+            name = _local_name(child)
+            if name == 't':
+                text = child.text or ''
+            elif name == 'tab':
+                text = '    '
+            elif name in ('br', 'cr'):
+                text = '\f' if child.get(_w('type')) == 'page' else '\n'
+            elif name == 'noBreakHyphen':
+                text = '-'
+            else:
+                continue
+            if caps:
+                text = text.upper()
+            pieces.append((text, bold, italic, size, color, underline))
+    return pieces
+
+
+def _font_key(bold, italic):
+    if bold and italic:
+        return 'bold_italic'
+    return 'bold' if bold else 'italic' if italic else 'regular'
+
+
+def _wrap(pieces, width, first_indent=0.0):
+    """
+    Break styled pieces into lines no wider than width
+    Returns:
+        list: Lines as (fragments, width, height, page_break_after); a fragment
+        is (x offset, text, bold, italic, size, color, underline)
+    """
+    lines = []
+    fragments, x, height = [], first_indent, 0.0
+
+    def finish(page_break=False):
+        nonlocal fragments, x, height
+        # Trailing spaces take no room at the end of a line
+        while fragments and not fragments[-1][1].strip():
+            fragments.pop()
+        if fragments:
+            last = fragments[-1]
+            stripped = last[1].rstrip()
+            fragments[-1] = (last[0], stripped) + last[2:]
+            line_width = last[0] + text_width(stripped, last[4], last[2])
+        else:
+            line_width = 0.0
+        lines.append((fragments, line_width, height, page_break))
+        fragments, x, height = [], 0.0, 0.0
+
+    for text, bold, italic, size, color, underline in pieces:
+        for token in re.findall(r'\n|\f| +|[^ \n\f]+', text):
+            if token in ('\n', '\f'):
+                height = height or size
+                finish(page_break=token == '\f')
+                continue
+            token_width = text_width(token, size, bold)
+            if token.strip() and x + token_width > width and fragments:
+                finish()
+            if not token.strip() and not fragments:
+                continue
+            # A word longer than the line is split across lines
+            while token_width > width:
+                cut = len(token)
+                while cut > 1 and text_width(token[:cut], size, bold) > width - x:
+                    cut -= 1
+                fragments.append((x, token[:cut], bold, italic, size, color, underline))
+                height = max(height, size)
+                finish()
+                token = token[cut:]
+                token_width = text_width(token, size, bold)
+            if fragments and fragments[-1][2:] == (bold, italic, size, color, underline):
+                # Same formatting as the previous fragment: extend it rather than start a new one
+                last = fragments[-1]
+                fragments[-1] = (last[0], last[1] + token) + last[2:]
+            else:
+                fragments.append((x, token, bold, italic, size, color, underline))
+            x += token_width
+            height = max(height, size)
+
+    if fragments or not lines:
+        finish()
+    return lines
+
+
+class _Layout:
+    """Flows paragraphs and tables onto pages, top to bottom"""
+
+    def __init__(self, document, writer):
+        self.document = document
+        self.writer = writer
+        self.resolver = _StyleResolver(document)
+        section = document.sections[0]
+        self.page_width = section.page_width.pt if section.page_width else 612.0
+        self.page_height = section.page_height.pt if section.page_height else 792.0
+        self.left = section.left_margin.pt if section.left_margin is not None else 72.0
+        self.right = self.page_width - (section.right_margin.pt if section.right_margin is not None else 72.0)
+        self.top = self.page_height - (section.top_margin.pt if section.top_margin is not None else 72.0)
+        self.bottom = section.bottom_margin.pt if section.bottom_margin is not None else 72.0
+        self.page = None
+        self.y = self.top
+        self.counters = {}
+        self.previous_style = None
+        self.pending_after = 0.0
+        self.new_page()
+
+    def new_page(self):
+        self.page = self.writer.add_page(self.page_width, self.page_height)
+        self.y = self.top
+
+    def _list_prefix(self, paragraph):
+        numbering = _numbering(paragraph, self.resolver)
+        if numbering is None:
+            return None, 0
+        num_id, level = numbering
+        number_format = _numbering_format(self.document, num_id, level)
+        if number_format is None:
+            style_name = self.resolver.paragraph_style_name(paragraph) or ''
+            number_format = 'decimal' if 'Number' in style_name else 'bullet'
+        if number_format == 'bullet':
+            return '•', level
+
+        # Deeper levels restart whenever a shallower item appears
+        for key in [key for key in self.counters if key[0] == num_id and key[1] > level]:
+            del self.counters[key]
+        count = self.counters.get((num_id, level), 0) + 1
+        self.counters[(num_id, level)] = count
+        if number_format == 'lowerLetter':
+            return f"{chr(ord('a') + (count - 1) % 26)}.", level
+        if number_format == 'upperLetter':
+            return f"{chr(ord('A') + (count - 1) % 26)}.", level
+        return f"{count}.", level
+
+    def _paragraph_lines(self, paragraph, width):
+        resolver = self.resolver
+        pieces = _run_pieces(paragraph, resolver)
+        left_indent = resolver.paragraph_format(paragraph, 'left_indent')
+        indent = max(0.0, left_indent.pt) if left_indent is not None else 0.0
+
+        prefix, level = self._list_prefix(paragraph)
+        if prefix is not None:
+            indent += LIST_INDENT * (level + 1)
+
+        lines = _wrap(pieces, max(width - indent, 36.0))
+        return lines, indent, prefix
+
+    def _spacing(self, paragraph):
+        resolver = self.resolver
+        before = resolver.paragraph_format(paragraph, 'space_before')
+        after = resolver.paragraph_format(paragraph, 'space_after')
+        before = before.pt if before is not None else 0.0
+        after = after.pt if after is not None else resolver.default_after
+        # Only proportional line spacing is honoured; exact spacing falls back to the default
+        line_spacing = resolver.paragraph_format(paragraph, 'line_spacing')
+        multiplier = line_spacing if isinstance(line_spacing, float) else resolver.default_line
+        return before, after, multiplier
+
+    def _draw_line(self, page, fragments, line_width, x, y, width, alignment):
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+        if alignment == WD_ALIGN_PARAGRAPH.CENTER:
+            x += (width - line_width) / 2
+        elif alignment == WD_ALIGN_PARAGRAPH.RIGHT:
+            x += width - line_width
+        for offset, text, bold, italic, size, color, underline in fragments:
+            page.text(x + offset, y, text, _font_key(bold, italic), size, color)
+            if underline and text.strip():
+                page.line(x + offset, y - size * 0.12, x + offset + text_width(text, size, bold), y - size * 0.12,
+                          width=size / 18.0)
+
+    def paragraph(self, paragraph):
+        style_name = self.resolver.paragraph_style_name(paragraph)
+        before, after, multiplier = self._spacing(paragraph)
+        # Contextual spacing drops the gap between paragraphs of the same style
+        if self.resolver.contextual_spacing(paragraph) and style_name == self.previous_style:
+            gap = 0.0
+        else:
+            gap = self.pending_after + before
+        self.previous_style = style_name
+
+        if paragraph.paragraph_format.page_break_before:
+            self.new_page()
+        elif self.y < self.top:
+            self.y -= gap
+
+        width = self.right - self.left
+        lines, indent, prefix = self._paragraph_lines(paragraph, width)
+        alignment = self.resolver.paragraph_format(paragraph, 'alignment')
+
+        for index, (fragments, line_width, height, page_break) in enumerate(lines):
+            line_height = (height or self.resolver.default_size) * 1.2 * multiplier
+            if self.y - line_height < self.bottom:
+                self.new_page()
+            self.y -= line_height
+            baseline = self.y + line_height * 0.25
+            if index == 0 and prefix is not None:
+                size = fragments[0][4] if fragments else self.resolver.default_size
+                self.page.text(self.left + indent - LIST_INDENT * 0.75, baseline, prefix, 'regular', size)
+            self._draw_line(self.page, fragments, line_width, self.left + indent, baseline,
+                            width - indent, alignment)
+            if page_break:
+                self.new_page()
+
+        self.pending_after = after
+
+    def table(self, table):
+        if self.y < self.top:
+            self.y -= self.pending_after
+        width = self.right - self.left
+        grid = [int(col.get(_w('w'), '0')) * POINTS_PER_TWIP
+                for col in table._tbl.xpath('./w:tblGrid/w:gridCol')]
+        columns = len(table.columns)
+        if len(grid) != columns or not all(grid):
+            grid = [width / columns] * columns
+        scale = min(1.0, width / sum(grid))
+        widths = [column * scale for column in grid]
+        bordered = table.style is not None and table.style.name == 'Table Grid'
+
+        for row in table.rows:
+            cells = row.cells
+            if len(cells) != columns:
+                raise FastPathUnsupported('irregular_table')
+            laid_out, row_height = [], 0.0
+            for cell, cell_width in zip(cells, widths):
+                cell_lines = []
+                for paragraph in cell.paragraphs:
+                    lines, indent, prefix = self._paragraph_lines(paragraph, cell_width - 2 * CELL_PADDING)
+                    alignment = self.resolver.paragraph_format(paragraph, 'alignment')
+                    for fragments, line_width, height, _ in lines:
+                        cell_lines.append((fragments, line_width, (height or self.resolver.default_size) * 1.2,
+                                           indent, alignment))
+                laid_out.append(cell_lines)
+                row_height = max(row_height, sum(line[2] for line in cell_lines) + 2 * CELL_PADDING)
+
+            if row_height > self.top - self.bottom:
+                raise FastPathUnsupported('table_row_too_tall')
+            if self.y - row_height < self.bottom:
+                self.new_page()
+
+            x = self.left
+            for cell_lines, cell_width in zip(laid_out, widths):
+                y = self.y - CELL_PADDING
+                for fragments, line_width, line_height, indent, alignment in cell_lines:
+                    y -= line_height
+                    self._draw_line(self.page, fragments, line_width, x + CELL_PADDING + indent,
+                                    y + line_height * 0.25, cell_width - 2 * CELL_PADDING - indent, alignment)
+                if bordered:
+                    self.page.rect(x, self.y - row_height, cell_width, row_height)
+                x += cell_width
+            self.y -= row_height
+
+        self.pending_after = self.resolver.default_after
+        self.previous_style = None
+
+    def render(self):
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+
+        for element in self.document.element.body.iterchildren():
+            name = _local_name(element)
+            if name == 'p':
+                self.paragraph(Paragraph(element, self.document._body))
+            elif name == 'tbl':
+                self.table(Table(element, self.document._body))
+
+
+def render_fast_path(document, output_path):
+    """
+    Write a PDF for a document that classify_document accepted
+    Args:
+        document (Document): The python-docx document
+        output_path (str): Path for the output PDF file
+    Returns:
+        PdfWriter: The laid-out document, pages included
+    Raises:
+        FastPathUnsupported: If layout hits something the fast path cannot draw
+    """
+    title = document.core_properties.title
+    writer = PdfWriter(title=title if title and can_encode(title) else None)
+    _Layout(document, writer).render()
+    writer.save(output_path)
+    return writer
+
+
+def _convert_fast(input_path, output_path):
+    """
+    Try the in-process fast path
+    Returns:
+        PdfWriter: The laid-out document if the PDF was written; None routes
+            the document to the office suite
+    """
+    # python-docx is imported here, not at module level, so that importing
+    # the converter stays cheap for workers that never take the fast path
+    from docx import Document
+
+    try:
+        document = Document(input_path)
+    except Exception as e:
+        logger.warning(f"Fast path could not read {input_path}: {str(e)}")
+        FAST_PATH_REJECTED.labels(feature='unreadable').inc()
+        return None
+
+    features = classify_document(document)
+    if features:
+        logger.info(f"Routing {input_path} to the office suite: {', '.join(features)}")
+        FAST_PATH_REJECTED.labels(feature=features[0]).inc()
+        return None
+
+    try:
+        return render_fast_path(document, output_path)
+    except FastPathUnsupported as e:
+        logger.info(f"Routing {input_path} to the office suite: {e.feature}")
+        FAST_PATH_REJECTED.labels(feature=e.feature).inc()
+    except Exception as e:
+        # A fast path bug must never fail a conversion the office suite can do
+        logger.error(f"Fast path failed on {input_path}, using the office suite: {str(e)}")
+        FAST_PATH_REJECTED.labels(feature='render_error').inc()
+
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return None
+
+
+# --- Bulk conversion CLI: convert a directory tree for backfills ---
+
+MANIFEST_NAME = '.manifest.jsonl'
+STATUS_CONVERTED = 'converted'
+STATUS_UPLOADED = 'uploaded'
+STATUS_FAILED = 'failed'
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_documents(input_dir):
+    """
+    List the Word documents under a directory, skipping Word's ~$ lock files
+    Args:
+        input_dir (str): Root of the tree
+    Returns:
+        list: Paths relative to input_dir, sorted
+    """
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in files:
+            if name.lower().endswith('.docx') and not name.startswith('~$'):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(found)
+
+
+class BulkManifest:
+    """
+    Append-only JSON lines record of a bulk run; the last line per input wins
+
+    Every finished conversion or upload is flushed as soon as it happens, so an
+    interrupted run loses at most the documents that were in flight.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.records[record['input']] = record
+                    except (ValueError, KeyError):
+                        # A line cut short by the interruption being resumed
+                        continue
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._file = open(path, 'a')
+
+    def finished(self, relative_path, sha256, profile):
+        """
+        The record of an unchanged document whose conversion already succeeded
+        Args:
+            relative_path (str): Document path relative to the input directory
+            sha256 (str): Hex digest of the document as it is now
+            profile (str): Export profile of this run; other profiles are redone
+        Returns:
+            dict: The record, or None if the document must be converted
+        """
+        record = self.records.get(relative_path)
+        if (record and record.get('sha256') == sha256 and record.get('profile') == profile
+                and record['status'] in (STATUS_CONVERTED, STATUS_UPLOADED)):
+            return record
+        return None
+
+    def write(self, record):
+        record = dict(record, time=time.time())
+        with self._lock:
+            self.records[record['input']] = record
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _init_bulk_worker():
+    """Give each pool process its own warm office instance and profile, closed when it exits"""
+    os.environ.setdefault('OFFICE_POOL_SIZE', '1')
+    pool = get_office_pool()
+    if pool is not None:
+        # Pool processes end via os._exit, which skips atexit handlers
+        import multiprocessing.util
+        multiprocessing.util.Finalize(None, pool.close, exitpriority=10)
+
+
+def _bulk_convert(input_path, output_path, timeout, profile):
+    """Convert one document in a pool process; failures come back as data, not exceptions"""
+    start_time = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        result = convert_document(input_path, output_path, timeout, profile)
+        if not os.path.exists(output_path):
+            # LibreOffice exits 0 on some documents it could not convert
+            raise Exception("The converter produced no PDF")
+        return {'status': STATUS_CONVERTED, 'path': result.path, 'duration': round(result.duration, 3)}
+    except Exception as e:
+        return {'status': STATUS_FAILED, 'error': str(e), 'duration': round(time.monotonic() - start_time, 3)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a directory tree of Word documents to PDF')
+    parser.add_argument('input_dir', help='Directory searched recursively for .docx files')
+    parser.add_argument('output_dir', help='Directory for the PDFs, mirroring the input tree')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Conversion processes, each with its own office instance (default: one per core)')
+    parser.add_argument('--manifest', help=f"Progress record used to resume (default: OUTPUT_DIR/{MANIFEST_NAME})")
+    parser.add_argument('--timeout', type=float, help='Per-document limit in seconds (default: scales with size)')
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        help='Export profile (default: PDF_EXPORT_PROFILE, else web)')
+    parser.add_argument('--s3', action='store_true', help='Upload each PDF to the PDF bucket through S3Manager')
+    parser.add_argument('--s3-prefix', default='', help='Key prefix for uploaded PDFs')
+    parser.add_argument('--upload-workers', type=int, default=int(os.getenv('S3_UPLOAD_WORKERS', '8')),
+                        help='Concurrent S3 uploads')
+    parser.add_argument('--quiet', action='store_true', help='Only log warnings and errors')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Convert every .docx under a directory with a process pool, resuming from the manifest
+    Returns:
+        int: Exit status; 1 if any document failed to convert or upload
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    profile = get_profile(args.profile)
+    manifest = BulkManifest(args.manifest or os.path.join(args.output_dir, MANIFEST_NAME))
+    documents = find_documents(args.input_dir)
+    stats = {'converted': 0, 'failed': 0, 'skipped': 0, 'uploaded': 0, 'upload_failed': 0, 'bytes': 0}
+    paths = {}
+
+    uploader = None
+    s3_manager = None
+    if args.s3:
+        from s3_manager import S3Manager
+        s3_manager = S3Manager()
+        uploader = ThreadPoolExecutor(max_workers=max(1, args.upload_workers), thread_name_prefix='bulk-upload')
+    uploads = []
+    stats_lock = threading.Lock()
+
+    def upload(record):
+        key = args.s3_prefix + Path(record['output']).as_posix()
+        try:
+            s3_manager.upload_file(os.path.join(args.output_dir, record['output']), key, is_pdf=True)
+            manifest.write(dict(record, status=STATUS_UPLOADED, s3_key=key))
+            counter = 'uploaded'
+        except Exception as e:
+            logger.error(f"Uploading {record['output']} failed: {str(e)}")
+            counter = 'upload_failed'
+        with stats_lock:
+            stats[counter] += 1
+
+    def finish(job, outcome):
+        record = dict(job, **outcome)
+        manifest.write(record)
+        if record['status'] == STATUS_FAILED:
+            stats['failed'] += 1
+            print(f"FAILED {record['input']}: {record['error']}", file=sys.stderr)
+            return
+        stats['converted'] += 1
+        stats['bytes'] += record['size']
+        paths[record['path']] = paths.get(record['path'], 0) + 1
+        if uploader is not None:
+            uploads.append(uploader.submit(upload, record))
+
+    start = time.perf_counter()
+    interrupted = False
+    pool = ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_bulk_worker)
+    try:
+        in_flight = {}
+        for relative_path in documents:
+            input_path = os.path.join(args.input_dir, relative_path)
+            sha256 = _file_sha256(input_path)
+            output = str(Path(relative_path).with_suffix('.pdf'))
+            record = manifest.finished(relative_path, sha256, profile.name)
+            if record and os.path.exists(os.path.join(args.output_dir, record['output'])):
+                stats['skipped'] += 1
+                if uploader is not None and record['status'] == STATUS_CONVERTED:
+                    uploads.append(uploader.submit(upload, record))
+                continue
+
+            # Keep the queue short so an interruption strands little work
+            while len(in_flight) >= 2 * args.workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(in_flight.pop(future), future.result())
+
+            job = {'input': relative_path, 'sha256': sha256, 'output': output, 'size': os.path.getsize(input_path),
+                   'profile': profile.name}
+            future = pool.submit(_bulk_convert, input_path, os.path.join(args.output_dir, output), args.timeout,
+                                 profile.name)
+            in_flight[future] = job
+
+        for future in list(in_flight):
+            finish(in_flight.pop(future), future.result())
+        pool.shutdown()
+        if uploader is not None:
+            wait(uploads)
+            uploader.shutdown()
+    except KeyboardInterrupt:
+        interrupted = True
+        pool.shutdown(wait=False, cancel_futures=True)
+        if uploader is not None:
+            uploader.shutdown(wait=False, cancel_futures=True)
+    finally:
+        manifest.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"Converted {stats['converted']} documents in {elapsed:.1f}s "
+          f"({stats['failed']} failed, {stats['skipped']} already done)")
+    if stats['converted']:
+        print(f"Throughput: {stats['converted'] / elapsed:.2f} documents/s, "
+              f"{stats['bytes'] / (1024 * 1024) / elapsed:.2f} MB/s with {args.workers} workers")
+        print('Paths: ' + ', '.join(f"{path} {count}" for path, count in sorted(paths.items())))
+    if args.s3:
+        print(f"Uploaded {stats['uploaded']} PDFs to S3 ({stats['upload_failed']} failed)")
+    if interrupted:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    return 1 if stats['failed'] or stats['upload_failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+import os
+import re
+import time
+import errno
+import shutil
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from metrics import (
+    DISK_USAGE_BYTES, DISK_BUDGET_BYTES, WORKSPACE_CREATED, CONVERTED_EVICTION_COUNT, CONVERTED_EVICTED_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_PREFIX = 'ws-'
+S3_SIDECAR_SUFFIX = '.s3'
+
+# Files served from converted/: PDFs and their first-page thumbnails
+SERVED_SUFFIXES = ('.pdf', '.png')
+
+# Local download names are prefixed with part of the document digest, so two
+# different documents uploaded under the same name never overwrite each other
+LOCAL_NAME_PATTERN = re.compile(r'^[0-9a-f]{16}_(.+)$')
+
+
+def local_name(digest, pdf_filename):
+    return f"{digest[:16]}_{pdf_filename}"
+
+
+def display_name(name):
+    """The file name to offer the browser for a local download name"""
+    match = LOCAL_NAME_PATTERN.match(name)
+    return match.group(1) if match else name
+
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+
+def _free_bytes(path):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+class Workspace:
+    """
+    A private scratch directory for one conversion: the upload, the office
+    output and any temporary files live here and go away together
+    """
+
+    def __init__(self, root, medium):
+        self.path = tempfile.mkdtemp(prefix=f"{WORKSPACE_PREFIX}{os.getpid()}-", dir=root)
+        self.medium = medium
+        self.handed_off = False
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def hand_off(self):
+        """Keep the workspace past the request; the new owner must call cleanup()"""
+        self.handed_off = True
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+
+class WorkspaceManager:
+    """
+    Hands out per-request workspaces, on tmpfs when there is room for the
+    document, otherwise on disk
+    """
+
+    # Room to leave on tmpfs for the office output and temporary files, per input byte
+    TMPFS_SIZE_FACTOR = 3
+
+    def __init__(self, disk_root, tmpfs_root=None, tmpfs_reserve_bytes=64 * 1024 * 1024):
+        self.disk_root = disk_root
+        self.tmpfs_root = tmpfs_root or None
+        self.tmpfs_reserve_bytes = tmpfs_reserve_bytes
+        os.makedirs(disk_root, exist_ok=True)
+        if self.tmpfs_root:
+            try:
+                os.makedirs(self.tmpfs_root, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"tmpfs workspaces disabled, cannot use {self.tmpfs_root}: {str(e)}")
+                self.tmpfs_root = None
+
+    def create(self, expected_bytes=0):
+        """
+        Create a workspace
+        Args:
+            expected_bytes (int): Size of the upload, if known
+        Returns:
+            Workspace: The new workspace
+        """
+        if self.tmpfs_root:
+            try:
+                needed = (expected_bytes or 0) * self.TMPFS_SIZE_FACTOR + self.tmpfs_reserve_bytes
+                if _free_bytes(self.tmpfs_root) > needed:
+                    WORKSPACE_CREATED.labels(medium='tmpfs').inc()
+                    return Workspace(self.tmpfs_root, 'tmpfs')
+            except OSError as e:
+                logger.warning(f"Falling back to a disk workspace: {str(e)}")
+        WORKSPACE_CREATED.labels(medium='disk').inc()
+        return Workspace(self.disk_root, 'disk')
+
+    def _roots(self):
+        return [(self.disk_root, 'scratch_disk')] + ([(self.tmpfs_root, 'scratch_tmpfs')] if self.tmpfs_root else [])
+
+    def reap_stale(self):
+        """
+        Remove workspaces left by processes that no longer exist
+        Returns:
+            int: Number of workspaces removed
+        """
+        removed = 0
+        for root, _ in self._roots():
+            for name in os.listdir(root):
+                match = re.match(rf'^{WORKSPACE_PREFIX}(\d+)-', name)
+                if not match or _pid_alive(int(match.group(1))):
+                    continue
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} stale workspaces")
+        return removed
+
+    def report_usage(self):
+        for root, area in self._roots():
+            DISK_USAGE_BYTES.labels(area=area).set(sum(
+                _directory_bytes(os.path.join(root, name)) for name in os.listdir(root)
+                if name.startswith(WORKSPACE_PREFIX)))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ConvertedStore:
+    """
+    Locally served PDFs under converted/, kept within a byte budget
+
+    A PDF becomes evictable once it is known to be in S3; a small sidecar file
+    records its S3 key, so downloads of an evicted PDF can redirect to S3.
+    Thumbnails are served and evicted the same way.
+    """
+
+    def __init__(self, directory, max_bytes, sweep_interval=60, sidecar_max_age=30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.sidecar_max_age = sidecar_max_age
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._reporters = []
+        os.makedirs(directory, exist_ok=True)
+        DISK_BUDGET_BYTES.labels(area='converted').set(max_bytes)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _sidecar(self, name):
+        return os.path.join(self.directory, f"{name}{S3_SIDECAR_SUFFIX}")
+
+    def add(self, source_path, name):
+        """
+        Publish a PDF for local download, linking rather than copying where possible
+        Args:
+            source_path (str): The converted PDF
+            name (str): Local download name
+        Returns:
+            str: Path of the published PDF
+        """
+        path = self.path(name)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.start()
+        return path
+
+    def mark_in_s3(self, name, s3_key):
+        """Record that a local PDF is safely in S3 under s3_key, making it evictable"""
+        with open(self._sidecar(name), 'w') as f:
+            f.write(s3_key)
+
+    def s3_key(self, name):
+        """
+        Args:
+            name (str): Local download name
+        Returns:
+            str: The S3 key of the PDF, or None if it is not known to be in S3
+        """
+        try:
+            with open(self._sidecar(name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def touch(self, path, stat=None):
+        """Mark a PDF as recently used; only the access time changes, so ETags stay valid"""
+        try:
+            stat = stat or os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+
+    def total_bytes(self):
+        """Bytes of PDFs and thumbnails currently in the directory"""
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SERVED_SUFFIXES) and entry.is_file(follow_symlinks=False):
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+        return total
+
+    def add_usage_reporter(self, reporter):
+        """Call reporter() after every sweep, e.g. to refresh other disk usage gauges"""
+        self._reporters.append(reporter)
+
+    def start(self):
+        """Start the background sweeper in this process, once"""
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='converted-sweeper', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep_if_leader()
+                for reporter in self._reporters:
+                    reporter()
+            except Exception as e:
+                logger.error(f"Sweeping {self.directory} failed: {str(e)}")
+            time.sleep(self.sweep_interval)
+
+    def sweep_if_leader(self):
+        """Sweep unless another worker on this node is already doing it"""
+        if fcntl is None:
+            return self.sweep()
+        with open(os.path.join(self.directory, '.sweep.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return 0
+                raise
+            return self.sweep()
+
+    def sweep(self):
+        """
+        Evict least-recently-used PDFs that are in S3 until under budget
+        Returns:
+            int: Number of PDFs evicted
+        """
+        pdfs = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.name.endswith(SERVED_SUFFIXES):
+                stat = entry.stat()
+                pdfs.append((stat.st_atime, entry.name, stat.st_size))
+                total += stat.st_size
+            elif entry.name.endswith(S3_SIDECAR_SUFFIX):
+                # Sidecars outlive their PDF to redirect downloads, but not forever
+                if now - entry.stat().st_mtime > self.sidecar_max_age:
+                    pdf = entry.name[:-len(S3_SIDECAR_SUFFIX)]
+                    if not os.path.exists(self.path(pdf)):
+                        _remove(entry.path)
+
+        evicted = 0
+        if total > self.max_bytes:
+            for _, name, size in sorted(pdfs):
+                if total <= self.max_bytes:
+                    break
+                if self.s3_key(name) is None:
+                    continue
+                if _remove(self.path(name)):
+                    total -= size
+                    evicted += 1
+                    CONVERTED_EVICTED_BYTES.inc(size)
+            CONVERTED_EVICTION_COUNT.inc(evicted)
+            if evicted:
+                logger.info(f"Evicted {evicted} PDFs from {self.directory}")
+            if total > self.max_bytes:
+                logger.warning(f"{self.directory} is over budget ({total} > {self.max_bytes} bytes) "
+                               f"with no more PDFs known to be in S3")
+
+        DISK_USAGE_BYTES.labels(area='converted').set(total)
+        return evicted
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False